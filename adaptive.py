@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive sweep point density.
+
+A sweep starts from a coarse grid and each round adds midpoints only in the
+intervals where the measured curve bends or jumps more than the tolerance,
+until nothing is left to refine or the point budget is spent. Flat parts of a
+diode or transistor curve stay coarse, points go to the knee or threshold.
+"""
+import numpy as np
+
+from devicemodels import shockley, squareLaw
+
+#Interpolation error allowed per interval, as a fraction of the curve's current range
+TOLERANCE = 0.005
+#Largest current step allowed across one interval, same units
+JUMP_TOLERANCE = 0.05
+#Starting grid, refinement fills in the rest
+COARSE_POINTS = 17
+MIN_COARSE_POINTS = 5
+MAX_ROUNDS = 12
+
+def coarseGrid(start, stop, budget):
+    points = max(MIN_COARSE_POINTS, min(COARSE_POINTS, budget // 4))
+    return np.linspace(start, stop, min(points, budget))
+
+def intervalScores(V, I, tolerance = TOLERANCE, jumpTolerance = JUMP_TOLERANCE):
+    """Score every interval of a sorted curve, > 1 means it needs refining.
+    The curvature term estimates the linear interpolation error h^2 |I''| / 8
+    from three-point second differences at both ends of the interval."""
+    h = np.diff(V)
+    scale = np.ptp(I) or 1.0
+    slope = np.diff(I) / h
+    curvature = np.zeros(len(V))
+    curvature[1:-1] = 2 * np.abs(np.diff(slope)) / (h[:-1] + h[1:])
+    curvature = np.maximum(curvature[:-1], curvature[1:])
+
+    error = curvature * h ** 2 / 8 / scale
+    jump = np.abs(np.diff(I)) / scale
+    return np.maximum(error / tolerance, jump / jumpTolerance)
+
+def refinePoints(V, I, budget, tolerance = TOLERANCE, minStep = 1e-4):
+    """Midpoints of the worst intervals, at most budget of them."""
+    order = np.argsort(V)
+    V, I = np.asarray(V)[order], np.asarray(I)[order]
+    if len(V) < 3 or budget <= 0:
+        return np.empty(0)
+    scores = intervalScores(V, I, tolerance)
+    #Intervals already at the resolution limit cannot be split any further
+    scores[np.diff(V) < 2 * minStep] = 0
+    candidates = np.flatnonzero(scores > 1)
+    candidates = candidates[np.argsort(scores[candidates])[::-1]][:budget]
+    return np.sort((V[candidates] + V[candidates + 1]) / 2)
+
+def adaptiveSweep(measure, start, stop, budget, tolerance = TOLERANCE, minStep = 1e-4):
+    """Run an adaptive sweep. measure(points) takes an array of source
+    voltages, measures them and returns their currents."""
+    V = coarseGrid(start, stop, budget)
+    I = np.asarray(measure(V))
+    for _ in range(MAX_ROUNDS):
+        new = refinePoints(V, I, budget - len(V), tolerance, minStep)
+        if len(new) == 0:
+            break
+        V = np.concatenate((V, new))
+        I = np.concatenate((I, measure(new)))
+    order = np.argsort(V)
+    return V[order], I[order]
+
+def predictRefinement(VdPoints, VgPoints, testType, budget = None):
+    """Points an adaptive sweep would end up measuring on the default device
+    model, as (n, 2) offsets of (Vd, Vg) for the input preview."""
+    VdPoints = np.asarray(VdPoints, dtype = float)
+    budget = budget or len(VdPoints)
+    offsets = []
+    if not len(VdPoints):
+        return np.empty((0, 2))
+    for Vg in np.asarray(VgPoints, dtype = float):
+        if testType.lower() == "transistor":
+            model = lambda V, Vg = Vg: squareLaw(V, Vg)
+        else:
+            model = shockley
+        V, I = adaptiveSweep(model, VdPoints[0], VdPoints[-1], budget)
+        offsets.append(np.column_stack((V, np.full(len(V), Vg))))
+    return np.concatenate(offsets) if offsets else np.empty((0, 2))
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+On-line curve analysis.
+
+Figures of merit are built up chunk by chunk as readings arrive, so they are
+ready the moment a sweep ends. Every fit is a least squares problem whose
+normal equations are accumulated per curve; a chunk only adds its rows to
+those sums, and solving all curves at once is one batched pinv.
+
+Diode, per curve (one per station for multi-SMU runs):
+    ln I = ln Is + (V - I Rs) / (n Vt), fitted over forward bias above
+    MIN_CURRENT, gives the ideality factor n, saturation current Is and
+    series resistance Rs.
+
+Transistor, per Vg curve:
+    Ron  1 / slope of Id(Vd) over the lowest RON_WINDOW of the Vd range
+    ro   1 / slope over the highest RO_WINDOW, the output resistance
+and across curves, from Id at the largest Vd of each curve:
+    gm     dId/dVg, its peak is reported
+    Vth    extrapolated from the steepest point of sqrt(Id) vs Vg
+    Ion/Ioff and the subthreshold swing in mV/decade
+The across-curve figures are only as fine as the Vg grid.
+"""
+import json
+import os
+import numpy as np
+
+from devicemodels import THERMAL_VOLTAGE
+
+#Readings below this are too close to the noise floor for the diode fit, in A
+MIN_CURRENT = 1e-10
+#Fractions of the Vd range used for the linear and saturation region fits
+RON_WINDOW = 0.1
+RO_WINDOW = 0.2
+
+class LinearFits:
+    """Running least squares y ~ X . coef for any number of curves, kept as
+    normal equations so each chunk costs O(rows)."""
+    def __init__(self, terms):
+        self.terms = terms
+        self.keys = {}
+        self.XtX = np.zeros((0, terms, terms))
+        self.Xty = np.zeros((0, terms))
+        self.count = np.zeros(0, dtype = np.int64)
+
+    def index(self, keys):
+        #Curve keys to row indices, growing the sums for new curves
+        unique, inverse = np.unique(keys, return_inverse = True)
+        for key in unique:
+            if float(key) not in self.keys:
+                self.keys[float(key)] = len(self.keys)
+        grow = len(self.keys) - len(self.count)
+        if grow:
+            self.XtX = np.concatenate((self.XtX, np.zeros((grow, self.terms, self.terms))))
+            self.Xty = np.concatenate((self.Xty, np.zeros((grow, self.terms))))
+            self.count = np.concatenate((self.count, np.zeros(grow, dtype = np.int64)))
+        return np.array([self.keys[float(key)] for key in unique])[inverse]
+
+    def add(self, keys, X, y):
+        if len(y) == 0:
+            return
+        index = self.index(keys)
+        np.add.at(self.XtX, index, X[:, :, None] * X[:, None, :])
+        np.add.at(self.Xty, index, X * y[:, None])
+        np.add.at(self.count, index, 1)
+
+    def solve(self):
+        """Coefficients per curve in key order, NaN for curves with too few points."""
+        #Scale columns to unit norm first, Id and Vd differ by orders of magnitude
+        scale = np.sqrt(np.einsum("kii->ki", self.XtX))
+        scale[scale == 0] = 1
+        A = self.XtX / scale[:, :, None] / scale[:, None, :]
+        b = self.Xty / scale
+        coef = np.einsum("kij,kj->ki", np.linalg.pinv(A), b) / scale
+        coef[self.count < self.terms + 1] = np.nan
+        return coef
+
+    def sortedKeys(self):
+        return np.array(sorted(self.keys, key = self.keys.get))
+
+class DiodeAnalysis:
+    def __init__(self):
+        #ln I = a + b V + c I
+        self.fits = LinearFits(3)
+
+    def update(self, keys, V, I):
+        use = (V > 0) & (I > MIN_CURRENT)
+        V, I = V[use], I[use]
+        self.fits.add(keys[use], np.column_stack((np.ones(len(V)), V, I)), np.log(I))
+
+    def results(self):
+        a, b, c = self.fits.solve().T
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            return {
+                "curves": self.fits.sortedKeys().tolist(),
+                "n": (1 / (b * THERMAL_VOLTAGE)).tolist(),
+                "Is": np.exp(a).tolist(),
+                "Rs": (-c / b).tolist(),
+            }
+
+class TransistorAnalysis:
+    def __init__(self, VdPoints):
+        VdMin, VdMax = float(np.min(VdPoints)), float(np.max(VdPoints))
+        span = VdMax - VdMin
+        self.ronLimit = VdMin + RON_WINDOW * span
+        self.roLimit = VdMax - RO_WINDOW * span
+        self.linear = LinearFits(2)
+        self.saturation = LinearFits(2)
+        #Id at the largest Vd seen so far on each curve, the transfer characteristic
+        self.transfer = {}
+
+    def update(self, Vg, Vd, Id):
+        ones = np.ones(len(Vd))
+        low = Vd <= self.ronLimit
+        self.linear.add(Vg[low], np.column_stack((ones[low], Vd[low])), Id[low])
+        high = Vd >= self.roLimit
+        self.saturation.add(Vg[high], np.column_stack((ones[high], Vd[high])), Id[high])
+
+        for key in np.unique(Vg):
+            rows = np.flatnonzero(Vg == key)
+            last = rows[np.argmax(Vd[rows])]
+            previous = self.transfer.get(float(key))
+            if previous is None or Vd[last] >= previous[0]:
+                self.transfer[float(key)] = (Vd[last], Id[last])
+
+    def results(self):
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            Vg = np.array(sorted(self.transfer))
+            Id = np.array([self.transfer[key][1] for key in Vg])
+            results = {
+                "Vg": Vg.tolist(),
+                "IdSat": Id.tolist(),
+                "Ron": self.curveResistance(self.linear, Vg),
+                "ro": self.curveResistance(self.saturation, Vg),
+                "gm": [], "gmMax": np.nan, "Vth": np.nan, "IonIoff": np.nan, "SS": np.nan,
+            }
+            if len(Vg) < 2:
+                return results
+
+            gm = np.gradient(Id, Vg)
+            results["gm"] = gm.tolist()
+            results["gmMax"] = float(gm.max())
+            magnitude = np.abs(Id)
+            floor = magnitude[magnitude > 0].min() if np.any(magnitude > 0) else np.nan
+            results["IonIoff"] = float(magnitude.max() / max(magnitude.min(), floor))
+
+            #Steepest point of sqrt(Id), extrapolated down to zero current
+            root = np.sqrt(np.maximum(Id, 0))
+            slope = np.diff(root) / np.diff(Vg)
+            steepest = np.argmax(slope)
+            if slope[steepest] > 0:
+                results["Vth"] = float(Vg[steepest] - root[steepest] / slope[steepest])
+
+            #Smallest Vg step per decade of current, below the steepest sqrt(Id) point
+            decades = np.diff(np.log10(np.maximum(magnitude, floor))) / np.diff(Vg)
+            below = decades[:max(steepest, 1)]
+            if np.any(below > 0):
+                results["SS"] = float(1e3 / below.max())
+            return results
+
+    def curveResistance(self, fits, Vg):
+        slopes = dict(zip(fits.sortedKeys(), fits.solve()[:, 1])) if fits.keys else {}
+        return [float(1 / slopes[key]) if key in slopes else np.nan for key in Vg]
+
+class CurveAnalysis:
+    """Analysis for one run, fed the same rows the worker posts."""
+    def __init__(self, testType, VdPoints = None):
+        self.testType = testType.lower()
+        if self.testType == "transistor":
+            self.analysis = TransistorAnalysis(VdPoints)
+        else:
+            self.analysis = DiodeAnalysis()
+        self.cached = None
+
+    def update(self, rows):
+        if len(rows) == 0:
+            return
+        self.cached = None
+        if self.testType in ("transistor", "stations"):
+            #Keyed rows, (Vg, Vd, Id, ...) or (station, V, I, t)
+            self.analysis.update(rows[:, 0], rows[:, 1], rows[:, 2])
+        else:
+            self.analysis.update(np.zeros(len(rows)), rows[:, 0], rows[:, 1])
+
+    def results(self):
+        if self.cached is None:
+            self.cached = self.analysis.results()
+        return self.cached
+
+    def write(self, dataFile):
+        #Figures of merit go next to the run data as <run>_analysis.json
+        path = os.path.splitext(dataFile)[0] + "_analysis.json"
+        with open(path, "w") as file:
+            json.dump(self.results(), file, indent = 1)
+        return path
+
+    def summary(self):
+        results = self.results()
+        if self.testType == "transistor":
+            Ron = np.array(results["Ron"], dtype = float)
+            ro = np.array(results["ro"], dtype = float)
+            lines = ["Vth %s" % formatValue(results["Vth"], "V"),
+                     "gm max %s" % formatValue(results["gmMax"], "S"),
+                     "Ion/Ioff %s" % formatValue(results["IonIoff"]),
+                     "SS %s" % formatValue(results["SS"], "mV/dec")]
+            if len(Ron):
+                lines.append("Ron %s, ro %s at Vg = %g V" % (formatValue(Ron[-1], "Ohm"), formatValue(ro[-1], "Ohm"),
+                                                            results["Vg"][-1]))
+            return "\n".join(lines)
+
+        lines = []
+        for key, n, Is, Rs in zip(results["curves"], results["n"], results["Is"], results["Rs"]):
+            prefix = "SMU #%d: " % key if self.testType == "stations" else ""
+            lines.append("%sn %s, Is %s, Rs %s" % (prefix, formatValue(n), formatValue(Is, "A"), formatValue(Rs, "Ohm")))
+        return "\n".join(lines)
+
+def formatValue(value, unit = ""):
+    if value is None or not np.isfinite(value):
+        return "n/a"
+    return ("%.4g %s" % (value, unit)).strip()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Headless batch runner, no Tk needed.
+
+    python batch.py recipe.yaml [--parallel] [--dry-run]
+
+A recipe (YAML or JSON) names the instruments once and lists the DUTs to
+measure with them:
+
+    output: runs/lot42
+    parallel: true
+    instruments:
+      smuA: {resource: "TCPIP::192.168.0.10::INSTR", model: K2450}
+      smuB: {resource: "GPIB::1", model: K2400}
+    duts:
+      - name: D1
+        mode: diode
+        device: smuA
+        Vd: {min: 0, max: 2, steps: 101}
+      - name: T1
+        mode: transistor
+        device: smuA
+        gate: smuB
+        Vd: {min: 0, max: 5, steps: 51}
+        Vg: {min: 0, max: 3, steps: 7}
+        adaptive: false
+        order: serpentine
+        backend: npy
+
+order is raster (default), serpentine, hysteresis or minslew, see sweepplan.
+delay fixes the source delay per point in seconds; left out, each sweep
+settles for its own step size.
+
+DUTs that share an instrument run back-to-back in recipe order. With
+parallel set, DUTs on disjoint instruments run at the same time, one thread
+per group of instruments.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import numpy as np
+
+from analysis import CurveAnalysis
+from connections import ConnectionManager
+from instrumentation import tracePath
+from recorder import Recorder
+from sweepengine import SweepWorker
+from sweepplan import checkOrder
+
+DEFAULT_BACKEND = {"diode": "csv", "transistor": "npy"}
+
+def loadRecipe(path):
+    with open(path) as file:
+        if path.lower().endswith((".yaml", ".yml")):
+            import yaml
+            recipe = yaml.safe_load(file)
+        else:
+            recipe = json.load(file)
+    checkRecipe(recipe)
+    return recipe
+
+def checkRecipe(recipe):
+    instruments = recipe.get("instruments", {})
+    for index, dut in enumerate(recipe.get("duts", [])):
+        name = dut.get("name", "#%d" % index)
+        mode = dut.get("mode", "diode").lower()
+        if mode not in ("diode", "transistor"):
+            raise ValueError("DUT %s: unknown mode %r" % (name, mode))
+        for key in ("device", "gate") if mode == "transistor" else ("device",):
+            if dut.get(key) not in instruments:
+                raise ValueError("DUT %s: %s %r is not listed under instruments" % (name, key, dut.get(key)))
+        if "Vd" not in dut or (mode == "transistor" and "Vg" not in dut):
+            raise ValueError("DUT %s: missing sweep range" % name)
+        try:
+            checkOrder(dut.get("order", "raster"), bool(dut.get("adaptive", False)))
+        except ValueError as e:
+            raise ValueError("DUT %s: %s" % (name, e))
+
+def sweepPoints(spec):
+    return np.linspace(float(spec["min"]), float(spec["max"]), int(spec["steps"]))
+
+def runSweep(smu, testType, VdPoints, VgPoints = None, gate = None, recorder = None,
+             adaptive = False, delay = None, order = "raster", onMessage = None):
+    """Run one sweep to completion on the calling thread and return its rows.
+    onMessage(kind, payload) sees the same messages the GUI gets. With a
+    recorder the run's timing trace is written next to its data."""
+    messages = queue.Queue()
+    worker = SweepWorker(messages, smu, testType, VdPoints, VgPoints, gate = gate, delay = delay,
+                         recorder = recorder, adaptive = adaptive, order = order)
+    worker.start()
+
+    chunks = []
+    while True:
+        kind, payload = messages.get()
+        if onMessage is not None:
+            onMessage(kind, payload)
+        if kind == "data":
+            chunks.append(payload)
+        elif kind == "error":
+            raise payload
+        elif kind in ("done", "cancelled"):
+            break
+    worker.join()
+    if recorder is not None:
+        worker.stats.write(tracePath(recorder.path))
+    return np.concatenate(chunks) if chunks else np.empty((0, 3))
+
+class BatchRunner:
+    def __init__(self, recipe, connections = None, log = print):
+        self.recipe = recipe
+        self.connections = connections or ConnectionManager()
+        self.output = recipe.get("output", "runs")
+        self.log = log
+        self.results = []
+        self.resultsLock = threading.Lock()
+
+    def instrument(self, name):
+        spec = self.recipe["instruments"][name]
+        return self.connections.prepare(self.connections.open(spec["resource"], spec.get("model")))
+
+    def runDUT(self, dut):
+        mode = dut.get("mode", "diode").lower()
+        name = dut.get("name", "run")
+        VdPoints = sweepPoints(dut["Vd"])
+        VgPoints = sweepPoints(dut["Vg"]) if mode == "transistor" else np.array([0.0])
+        self.log("%s: %s sweep on %s" % (name, mode, dut["device"]))
+        status = "ok"
+        path = None
+        try:
+            smu = self.instrument(dut["device"])
+            gate = self.instrument(dut["gate"]) if mode == "transistor" else None
+            recorder = Recorder(self.output, name, mode,
+                                backend = dut.get("backend", self.recipe.get("backend", DEFAULT_BACKEND[mode])),
+                                metadata = {"VdPoints": VdPoints.tolist(), "VgPoints": VgPoints.tolist(),
+                                            "device1": dut["device"], "device2": dut.get("gate", ""),
+                                            "adaptive": bool(dut.get("adaptive", False)),
+                                            "order": dut.get("order", "raster")})
+            path = recorder.path
+            data = runSweep(smu, mode, VdPoints, VgPoints, gate = gate, recorder = recorder,
+                            adaptive = dut.get("adaptive", False), delay = dut.get("delay"),
+                            order = dut.get("order", "raster"))
+            self.log("%s: %d points -> %s" % (name, len(data), path))
+            analysis = CurveAnalysis(mode, VdPoints)
+            analysis.update(data)
+            self.log("%s: %s" % (name, analysis.summary().replace("\n", ", ")))
+        except Exception as e:
+            #One bad DUT or instrument should not stop the rest of the lot
+            status = "error: %s" % e
+            self.log("%s: failed, %s" % (name, e))
+        with self.resultsLock:
+            self.results.append((name, path, status))
+
+    def groups(self):
+        """Split the DUT list into groups that share no instrument, keeping
+        recipe order inside each group."""
+        groups = []
+        for dut in self.recipe.get("duts", []):
+            uses = {dut["device"], dut.get("gate")} - {None}
+            touching = [group for group in groups if group["uses"] & uses]
+            merged = {"uses": set(uses), "duts": []}
+            for group in touching:
+                merged["uses"] |= group["uses"]
+                merged["duts"] += group["duts"]
+                groups.remove(group)
+            merged["duts"].append(dut)
+            groups.append(merged)
+        #Merging can interleave recipe order, restore it
+        order = {id(dut): index for index, dut in enumerate(self.recipe.get("duts", []))}
+        groups = [sorted(group["duts"], key = lambda dut: order[id(dut)]) for group in groups]
+        return sorted(groups, key = lambda group: order[id(group[0])])
+
+    def run(self, parallel = None):
+        if parallel is None:
+            parallel = self.recipe.get("parallel", False)
+        if not parallel:
+            for dut in self.recipe.get("duts", []):
+                self.runDUT(dut)
+            return self.results
+
+        threads = [threading.Thread(target = self.runGroup, args = (group,), daemon = True)
+                   for group in self.groups()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.results
+
+    def runGroup(self, duts):
+        for dut in duts:
+            self.runDUT(dut)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Run SMU I-V sweeps from a recipe file without the GUI")
+    parser.add_argument("recipe", help = "YAML or JSON recipe")
+    parser.add_argument("--parallel", action = "store_true", default = None,
+                        help = "run DUTs on separate instruments at the same time")
+    parser.add_argument("--output", help = "directory for run files, overrides the recipe")
+    parser.add_argument("--dry-run", action = "store_true", help = "check the recipe and list the run plan")
+    args = parser.parse_args(argv)
+
+    recipe = loadRecipe(args.recipe)
+    if args.output:
+        recipe["output"] = args.output
+    runner = BatchRunner(recipe)
+
+    if args.dry_run:
+        for index, group in enumerate(runner.groups()):
+            print("group %d: %s" % (index, ", ".join(dut.get("name", "run") for dut in group)))
+        return 0
+
+    results = runner.run(args.parallel)
+    runner.connections.closeAll()
+    failed = [name for name, path, status in results if status != "ok"]
+    print("%d of %d DUTs measured, results in %s" % (len(results) - len(failed), len(results),
+                                                      os.path.abspath(runner.output)))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
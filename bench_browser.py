@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the results browser's catalog: indexing a directory of runs, the
+background previews of its CSV runs, the first overlay of all of them (npy
+data read and decimated) and a repeat overlay served from the catalog's
+previews. Runs are written through Recorder, half
+as csv and half as npy, with a diode-like curve per run.
+
+python bench_browser.py [runs] [points per run]
+"""
+import sys
+import tempfile
+import time
+import numpy as np
+
+from catalog import RunCatalog
+from recorder import Recorder
+
+def writeRuns(directory, runs, points):
+    V = np.linspace(0, 0.8, points)
+    for run in range(runs):
+        backend = "csv" if run % 2 else "npy"
+        recorder = Recorder(directory, "dut%02d" % run, "diode", backend = backend,
+                            metadata = {"VdPoints": [0.0, 0.8]})
+        I = 1e-12 * (1 + 0.01 * run) * np.expm1(V / 0.045)
+        recorder.write(np.column_stack((V, I, np.arange(points) * 1e-3)))
+        recorder.close()
+
+def timed(name, function):
+    start = time.perf_counter()
+    result = function()
+    print("%-16s %8.1f ms" % (name, (time.perf_counter() - start) * 1e3))
+    return result
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    points = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    with tempfile.TemporaryDirectory() as directory:
+        timed("write runs", lambda: writeRuns(directory, runs, points))
+        catalog = RunCatalog(directory)
+        timed("index", catalog.refresh)
+        entries = timed("search", catalog.search)
+        timed("csv previews", catalog.buildPreviews)
+        curves = timed("first overlay", lambda: [catalog.curves(entry) for entry in entries])
+        timed("repeat overlay", lambda: [catalog.curves(entry) for entry in entries])
+        #Drop the previews to time memmap loading on its own
+        with catalog.db:
+            catalog.db.execute("DELETE FROM previews")
+        timed("npy only", lambda: [catalog.curves(entry) for entry in entries if entry["backend"] == "npy"])
+        print("%d runs x %d points, %d curves, %d points shown" %
+              (runs, points, sum(map(len, curves)), sum(len(x) for run in curves for key, x, y in run)))
+        catalog.close()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark per-reading buffer access against bulk ASCII and binary readback
+using the simulated Keithley 2450.
+
+python bench_readback.py [points] [latency]
+"""
+import sys
+import time
+import numpy as np
+
+from readback import readBufferChunked, setDataFormat
+from simsmu import SimKeithley2450
+
+def perIndex(smu):
+    data = []
+    for i in range(1, smu.defbuffer1.n + 1):
+        data.append([
+            smu.defbuffer1.sourcevalues[i],
+            smu.defbuffer1.readings[i],
+            smu.defbuffer1.relativetimestamps[i]])
+    return np.array(data)
+
+def bulk(smu, binary):
+    setDataFormat(smu, binary)
+    return readBufferChunked(smu, binary = binary)
+
+def timeIt(name, smu, func):
+    smu.queries = 0
+    smu.bytesMoved = 0
+    start = time.perf_counter()
+    data = func(smu)
+    elapsed = time.perf_counter() - start
+    print("%-10s %8.3f s  %6d queries  %10d bytes  %10.0f pts/s" %
+          (name, elapsed, smu.queries, smu.bytesMoved, len(data) / elapsed))
+    return data
+
+if __name__ == "__main__":
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.002
+
+    smu = SimKeithley2450(latency = latency)
+    smu.fillSweep(0, 2, points)
+    print("%d readings, %.1f ms round-trip" % (points, latency * 1e3))
+
+    reference = timeIt("ascii", smu, lambda s: bulk(s, False))
+    binary = timeIt("binary", smu, lambda s: bulk(s, True))
+    assert np.allclose(reference, binary, rtol = 1e-5)
+
+    #The per-index loop is three round-trips per point, keep it short
+    if points <= 2000:
+        timeIt("per-index", smu, perIndex)
+    else:
+        print("per-index  ~%.1f s estimated (3 round-trips per point)" % (3 * points * latency))
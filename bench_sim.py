@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark on the simulated SMUs: sweep throughput, how long a
+reading waits before the GUI queue hands it over, and recording/export speed.
+Then the same transistor map in every sweep order, with the old fixed 0.1 s
+source delay next to delays settled for the step size. Runs are seeded so
+repeated runs see the same load.
+
+python bench_sim.py [Vd points] [Vg curves] [timeScale]
+"""
+import os
+import queue
+import sys
+import tempfile
+import time
+import numpy as np
+
+from recorder import Recorder, loadRun
+from simsmu import SimKeithley2450, TRANSISTOR
+from sweepengine import SweepWorker
+from sweepplan import ORDERS, slew
+
+def percentile(values, q):
+    return np.percentile(values, q) * 1e3 if len(values) else float("nan")
+
+def runSweep(name, worker, directory):
+    #Drain the worker queue like pollSweep does and note how stale each chunk is on arrival
+    messages = worker.outQueue
+    start = time.perf_counter()
+    worker.start()
+    lags = []
+    rows = 0
+    while True:
+        kind, payload = messages.get()
+        if kind == "data":
+            rows += len(payload)
+            lags.append(time.monotonic() - worker.sweepStart - payload[-1, -1])
+        elif kind == "error":
+            raise payload
+        elif kind in ("done", "cancelled"):
+            break
+    elapsed = time.perf_counter() - start
+    worker.join()
+    print("%-10s %6d rows %8.3f s %9.0f rows/s   queue lag p50 %6.1f ms  p95 %6.1f ms" %
+          (name, rows, elapsed, rows / elapsed, percentile(lags, 50), percentile(lags, 95)))
+
+    recorder = worker.recorder
+    start = time.perf_counter()
+    recorder.exportTo(directory)
+    exported = time.perf_counter() - start
+    start = time.perf_counter()
+    info, data = loadRun(recorder.path)
+    loaded = time.perf_counter() - start
+    print("%-10s export %6.1f ms  load %6.1f ms  (%s, %d bytes)" %
+          (name, exported * 1e3, loaded * 1e3, info["backend"], os.path.getsize(recorder.path)))
+
+def runOrder(drain, gate, VdPoints, VgPoints, order, delay):
+    worker = SweepWorker(queue.Queue(), drain, "transistor", VdPoints, VgPoints, gate = gate, delay = delay, order = order)
+    start = time.perf_counter()
+    worker.start()
+    worker.join()
+    elapsed = time.perf_counter() - start
+    summary = worker.stats.summary()
+    settle = summary["phases"].get("settle", {}).get("seconds", 0.0)
+    #Source delays and settling are what the order and delay change; the instrument's share is given at
+    #real speed, the host waits before each curve are not time scaled
+    print("%-10s %-5s %6d rows %8.3f s   source delay %7.2f s  settle %6.2f s  slew %6.1f V" %
+          (order, "auto" if delay is None else "%g" % delay, worker.done, elapsed,
+           summary["notes"]["sourceDelay"], settle, slew(VdPoints, VgPoints, order)))
+
+if __name__ == "__main__":
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    curves = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    timeScale = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    VdPoints = np.linspace(0, 3, points)
+    VgPoints = np.linspace(0, 3, curves)
+    options = {"latency": 0.002, "timeScale": timeScale}
+    print("%d Vd points, %d Vg curves, timeScale %g, 2 ms round-trip" % (points, curves, timeScale))
+
+    with tempfile.TemporaryDirectory() as directory:
+        smu = SimKeithley2450("SIM::diode", seed = 1, **options)
+        runSweep("diode", SweepWorker(queue.Queue(), smu, "diode", VdPoints, delay = 0,
+                                      recorder = Recorder(directory, "diode", "diode", "csv")),
+                 os.path.join(directory, "export"))
+
+        drain = SimKeithley2450("SIM::drain", device = TRANSISTOR.drain, seed = 2, **options)
+        gate = SimKeithley2450("SIM::gate", device = TRANSISTOR.gate, seed = 3, **options)
+        runSweep("transistor", SweepWorker(queue.Queue(), drain, "transistor", VdPoints, VgPoints, gate = gate, delay = 0,
+                                           recorder = Recorder(directory, "transistor", "transistor", "npy")),
+                 os.path.join(directory, "export"))
+
+        print("sweep orders, %d x %d map" % (min(points, 101), curves))
+        VdPoints = np.linspace(0, 3, min(points, 101))
+        runOrder(drain, gate, VdPoints, VgPoints, "raster", 0.1)
+        for order in ORDERS:
+            runOrder(drain, gate, VdPoints, VgPoints, order, None)
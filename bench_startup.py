@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark GUI startup: importing runme, the first painted frame, and the
+point where the plotting and measurement modules have finished loading in
+the background. Every run is a fresh interpreter so nothing is cached.
+
+python bench_startup.py [runs]
+
+Without a display only the import is timed, next to an eager import of
+everything the GUI used to load up front.
+"""
+import json
+import subprocess
+import sys
+
+GUI_RUN = r"""
+import json, sys, time
+start = time.perf_counter()
+import runme
+imported = time.perf_counter()
+try:
+    app = runme.SMU_GUI()
+except Exception:
+    print(json.dumps({"import": imported - start}))
+    sys.exit(0)
+app.update()
+firstFrame = time.perf_counter()
+while not app.ready:
+    app.update()
+    time.sleep(0.005)
+ready = time.perf_counter()
+app.connections.closeAll()
+app.destroy()
+print(json.dumps({"import": imported - start, "first frame": firstFrame - start, "ready": ready - start}))
+"""
+
+EAGER_RUN = r"""
+import json, time
+start = time.perf_counter()
+import numpy, matplotlib.figure, matplotlib.backends.backend_tkagg
+import sweepengine, coordinator, recorder, liveplot, adaptive, results, analysis, runqueue, catalog, sweepplan
+print(json.dumps({"eager import": time.perf_counter() - start}))
+"""
+
+def timeRun(code):
+    output = subprocess.run([sys.executable, "-c", code], capture_output = True, text = True, check = True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    results = {}
+    for code in (GUI_RUN, EAGER_RUN):
+        for _ in range(runs):
+            for phase, seconds in timeRun(code).items():
+                results.setdefault(phase, []).append(seconds)
+
+    print("median of %d runs" % runs)
+    for phase, seconds in results.items():
+        print("%-14s %8.1f ms" % (phase, median(seconds) * 1e3))
+    if "first frame" not in results:
+        print("no display, window timings skipped")
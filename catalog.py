@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Catalog of saved runs for the results browser.
+
+A directory of runs is indexed into a small SQLite file (catalog.sqlite in
+that directory) from each run's sidecar: test name, type, start time, status,
+rows and the Vd/Vg ranges, so searching never opens the data. CSV files saved
+without a sidecar are indexed from their header and file time, their ranges
+are filled in the first time they are loaded.
+
+npy data is only read when a run is shown, memory-mapped. CSV runs are
+parsed CSV_CHUNK_ROWS at a time by buildPreviews, which the browser runs in
+the background right after indexing, so the run list never waits for them
+and a first overlay of many CSV runs does not parse them either. Either way
+each curve is reduced to a min/max decimated preview (liveplot.CurveBuffer)
+of at most PREVIEW_POINTS. Previews are stored in the catalog against the
+data file's size and mtime, so showing a run again does not touch its data
+at all.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import warnings
+import numpy as np
+
+from liveplot import CURVE_LABELS, CurveBuffer, uniqueInOrder
+from recorder import TRANSISTOR_COLUMNS, NPYBackend, sidecarPath
+
+CATALOG_NAME = "catalog.sqlite"
+#Decimated points kept per curve, dozens of runs are overlaid at once
+PREVIEW_POINTS = 1000
+CSV_CHUNK_ROWS = 32768
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    dataPath TEXT PRIMARY KEY,
+    sidecar TEXT,
+    stamp REAL,
+    size INTEGER,
+    testName TEXT,
+    testType TEXT,
+    started TEXT,
+    status TEXT,
+    backend TEXT,
+    columns TEXT,
+    rows INTEGER,
+    VdMin REAL, VdMax REAL, VdCount INTEGER,
+    VgMin REAL, VgMax REAL, VgCount INTEGER,
+    device TEXT
+);
+CREATE INDEX IF NOT EXISTS runsByName ON runs (testName);
+CREATE INDEX IF NOT EXISTS runsByStarted ON runs (started);
+CREATE TABLE IF NOT EXISTS previews (
+    dataPath TEXT PRIMARY KEY,
+    stamp REAL,
+    size INTEGER,
+    curves BLOB
+);
+"""
+
+def fileStamp(*paths):
+    #Newest mtime of the files and the data file's size, a run is re-read when either changes
+    stats = [os.stat(path) for path in paths]
+    return max(stat.st_mtime for stat in stats), stats[0].st_size
+
+def pointRange(points):
+    if not points:
+        return None, None, 0
+    return float(min(points)), float(max(points)), len(points)
+
+def sidecarEntry(sidecar):
+    with open(sidecar) as file:
+        info = json.load(file)
+    dataPath = os.path.join(os.path.dirname(sidecar), info["dataFile"])
+    VdMin, VdMax, VdCount = pointRange(info.get("VdPoints"))
+    VgMin, VgMax, VgCount = pointRange(info.get("VgPoints") if info["testType"].lower() == "transistor" else None)
+    stamp, size = fileStamp(dataPath, sidecar)
+    return {
+        "dataPath": dataPath, "sidecar": sidecar, "stamp": stamp, "size": size,
+        "testName": info.get("testName") or "", "testType": info["testType"].lower(),
+        "started": info.get("started", ""), "status": info.get("status", ""),
+        "backend": info["backend"], "columns": json.dumps(info["columns"]), "rows": info.get("rows"),
+        "VdMin": VdMin, "VdMax": VdMax, "VdCount": VdCount,
+        "VgMin": VgMin, "VgMax": VgMax, "VgCount": VgCount,
+        "device": info.get("device1", ""),
+    }
+
+def csvEntry(dataPath):
+    """Entry for a CSV without a sidecar, None if it does not look like a run."""
+    with open(dataPath, newline = "") as file:
+        columns = file.readline().strip().split(",")
+    if len(columns) < 2:
+        return None
+    try:
+        float(columns[0])
+        return None
+    except ValueError:
+        pass
+    stamp, size = fileStamp(dataPath)
+    return {
+        "dataPath": dataPath, "sidecar": None, "stamp": stamp, "size": size,
+        "testName": os.path.splitext(os.path.basename(dataPath))[0],
+        "testType": "transistor" if columns == TRANSISTOR_COLUMNS else "diode",
+        "started": time.strftime("%Y%m%d-%H%M%S", time.localtime(stamp)), "status": "",
+        "backend": "csv", "columns": json.dumps(columns), "rows": None,
+        "VdMin": None, "VdMax": None, "VdCount": None,
+        "VgMin": None, "VgMax": None, "VgCount": None,
+        "device": "",
+    }
+
+def iterRows(entry, used = None):
+    """Yield a run's rows in chunks, the whole memmap for npy runs. Only the
+    first used columns are read, parsing the rest of a CSV costs as much again."""
+    columns = json.loads(entry["columns"])
+    used = used or len(columns)
+    if entry["backend"] == "npy":
+        yield NPYBackend.load(entry["dataPath"], columns, entry["rows"])[:, :used]
+        return
+    remaining = entry["rows"]
+    with open(entry["dataPath"], newline = "") as file:
+        file.readline()
+        while remaining is None or remaining > 0:
+            count = CSV_CHUNK_ROWS if remaining is None else min(CSV_CHUNK_ROWS, remaining)
+            with warnings.catch_warnings():
+                #The read that finds the end of the file warns that it is empty
+                warnings.simplefilter("ignore", UserWarning)
+                rows = np.loadtxt(file, delimiter = ",", ndmin = 2, max_rows = count, usecols = range(used))
+            if len(rows):
+                yield rows.reshape(-1, used)
+            if len(rows) < count:
+                return
+            if remaining is not None:
+                remaining -= len(rows)
+
+def previewCurves(testType, chunks):
+    """Decimated (key, x, y) per curve from chunks of recorded rows, with the
+    row count and the x range seen."""
+    keyed = testType in CURVE_LABELS
+    buffers = {}
+    rows = 0
+    xMin, xMax = np.inf, -np.inf
+    for chunk in chunks:
+        keys = chunk[:, 0] if keyed else np.zeros(len(chunk))
+        x, y = (chunk[:, 1], chunk[:, 2]) if keyed else (chunk[:, 0], chunk[:, 1])
+        for key in uniqueInOrder(keys):
+            use = keys == key
+            buffer = buffers.get(float(key))
+            if buffer is None:
+                buffer = buffers[float(key)] = CurveBuffer(maxPoints = PREVIEW_POINTS)
+            buffer.append(x[use], y[use])
+        rows += len(chunk)
+        if len(chunk):
+            xMin, xMax = min(xMin, float(x.min())), max(xMax, float(x.max()))
+    curves = [(key,) + buffer.display() for key, buffer in buffers.items()]
+    return curves, rows, (xMin, xMax) if rows else (None, None)
+
+def packCurves(curves):
+    #One float64 block of (key, x, y) rows per run
+    if not curves:
+        return b""
+    return np.concatenate([np.column_stack((np.full(len(x), key), x, y)) for key, x, y in curves]).tobytes()
+
+def unpackCurves(blob):
+    data = np.frombuffer(blob, dtype = float).reshape(-1, 3)
+    return [(key, data[data[:, 0] == key, 1], data[data[:, 0] == key, 2]) for key in uniqueInOrder(data[:, 0])]
+
+def curveLabel(entry, key):
+    label = CURVE_LABELS.get(entry["testType"])
+    return entry["testName"] + (", " + label % key if label else "")
+
+class RunCatalog:
+    def __init__(self, directory):
+        self.directory = directory
+        #Refreshes and previews run on a background thread, searches on the Tk thread
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(directory, CATALOG_NAME), check_same_thread = False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def refresh(self):
+        """Bring the catalog in line with the files on disk, returns how
+        many runs were added or re-read."""
+        found = []
+        for root, dirs, files in os.walk(self.directory):
+            names = set(files)
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(".run.json"):
+                    found.append(("sidecar", path))
+                elif name.endswith(".csv") and os.path.basename(sidecarPath(path)) not in names:
+                    found.append(("csv", path))
+
+        with self.lock:
+            known = {row["dataPath"]: (row["stamp"], row["size"], row["sidecar"])
+                     for row in self.db.execute("SELECT dataPath, stamp, size, sidecar FROM runs")}
+        updated = []
+        seen = set()
+        for kind, path in found:
+            try:
+                if kind == "sidecar":
+                    with open(path) as file:
+                        dataPath = os.path.join(os.path.dirname(path), json.load(file)["dataFile"])
+                    stamp, size = fileStamp(dataPath, path)
+                else:
+                    dataPath = path
+                    stamp, size = fileStamp(dataPath)
+                seen.add(dataPath)
+                if known.get(dataPath, (None,))[:2] == (stamp, size):
+                    continue
+                entry = sidecarEntry(path) if kind == "sidecar" else csvEntry(path)
+            except (OSError, ValueError, KeyError):
+                #Half written or foreign files are left out until they read cleanly
+                continue
+            if entry is not None:
+                updated.append(entry)
+
+        with self.lock, self.db:
+            for entry in updated:
+                self.db.execute("INSERT OR REPLACE INTO runs (%s) VALUES (%s)" % (", ".join(entry), ", ".join("?" * len(entry))),
+                                list(entry.values()))
+            gone = [(path,) for path in known if path not in seen]
+            self.db.executemany("DELETE FROM runs WHERE dataPath = ?", gone)
+            self.db.executemany("DELETE FROM previews WHERE dataPath = ?", gone)
+        return len(updated)
+
+    def buildPreviews(self):
+        """Store previews for CSV runs without a current one, returns how
+        many were made. Slow, parses the CSVs, run it after refresh."""
+        with self.lock:
+            entries = [dict(row) for row in self.db.execute(
+                "SELECT runs.* FROM runs LEFT JOIN previews ON previews.dataPath = runs.dataPath"
+                " AND previews.stamp = runs.stamp AND previews.size = runs.size"
+                " WHERE runs.backend = 'csv' AND previews.dataPath IS NULL")]
+        made = 0
+        for entry in entries:
+            try:
+                self.storePreview(entry)
+            except (OSError, ValueError):
+                #Left for curves() to report when the run is shown
+                continue
+            made += 1
+        return made
+
+    def search(self, name = "", testType = None, since = "", until = "", VdLow = None, VdHigh = None):
+        """Runs matching every given filter, newest first. since and until are
+        YYYYMMDD dates, VdLow/VdHigh keep runs whose Vd range overlaps them."""
+        clauses, args = [], []
+        if name:
+            clauses.append("testName LIKE ?")
+            args.append("%" + name + "%")
+        if testType:
+            clauses.append("testType = ?")
+            args.append(testType.lower())
+        if since:
+            clauses.append("substr(started, 1, 8) >= ?")
+            args.append(since)
+        if until:
+            clauses.append("substr(started, 1, 8) <= ?")
+            args.append(until)
+        if VdLow is not None:
+            clauses.append("(VdMax IS NULL OR VdMax >= ?)")
+            args.append(VdLow)
+        if VdHigh is not None:
+            clauses.append("(VdMin IS NULL OR VdMin <= ?)")
+            args.append(VdHigh)
+        query = "SELECT * FROM runs" + (" WHERE " + " AND ".join(clauses) if clauses else "") + " ORDER BY started DESC"
+        with self.lock:
+            return [dict(row) for row in self.db.execute(query, args)]
+
+    def curves(self, entry):
+        """Decimated (key, x, y) curves of a run, from the catalog when the
+        data file has not changed since they were made."""
+        stamp, size = entry["stamp"], entry["size"]
+        with self.lock:
+            cached = self.db.execute("SELECT curves FROM previews WHERE dataPath = ? AND stamp = ? AND size = ?",
+                                     (entry["dataPath"], stamp, size)).fetchone()
+        if cached is not None:
+            return unpackCurves(cached["curves"])
+        return self.storePreview(entry)
+
+    def storePreview(self, entry):
+        #Read the run's data once for its previews, and a bare CSV's rows and range
+        stamp, size = entry["stamp"], entry["size"]
+        used = 3 if entry["testType"] in CURVE_LABELS else 2
+        curves, rows, (xMin, xMax) = previewCurves(entry["testType"], iterRows(entry, used))
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO previews VALUES (?, ?, ?, ?)",
+                            (entry["dataPath"], stamp, size, packCurves(curves)))
+            if entry["rows"] is None:
+                #Bare CSVs only learn their size and range once read
+                self.db.execute("UPDATE runs SET rows = ?, VdMin = ?, VdMax = ? WHERE dataPath = ?",
+                                (rows, xMin, xMax, entry["dataPath"]))
+        return curves
+
+    def close(self):
+        with self.lock:
+            self.db.close()
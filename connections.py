@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Instrument connection manager.
+
+Keeps one open session per VISA resource string and hands the same session
+back on reconnect instead of building a new driver and resetting the SMU.
+Discovery, opening and health checks all run on background threads and
+report through self.events, a queue of (kind, payload) messages the GUI
+drains with after():
+
+    ("resources", [(resource, idn), ...])   discovery finished
+    ("opened", session)                     session is open and prepared
+    ("openFailed", (resource, exception))
+    ("lost", session)                       health check failed, reconnecting
+    ("reconnected", session)                reopened and prepared again
+
+"SIM::<device>" resources open a simulated SMU from simsmu instead.
+
+Nothing here touches Tk.
+"""
+import queue
+import threading
+import time
+
+from instrumentstate import resetSMU, stateFor
+
+#*IDN? timeout for health checks and probing, in ms
+PING_TIMEOUT = 500
+HEALTH_INTERVAL = 10.0
+
+MODELS = {"2450": "K2450", "2400": "K2400"}
+
+def modelFromIDN(idn):
+    #"KEITHLEY INSTRUMENTS,MODEL 2450,04412345,1.7.3b" -> "K2450"
+    for number, model in MODELS.items():
+        if number in idn:
+            return model
+    return None
+
+def defaultFactory(model, resource):
+    if resource.upper().startswith("SIM::"):
+        from simsmu import simulatedInstrument
+        return simulatedInstrument(model, resource)
+    #pymeasure pulls in pyvisa, only import it once a real instrument is wanted
+    from pymeasure.instruments.keithley import Keithley2400, Keithley2450
+    if model == "K2400":
+        return Keithley2400(resource)
+    return Keithley2450(resource)
+
+def closeInstrument(instrument):
+    try:
+        instrument.adapter.close()
+    except Exception:
+        pass
+
+def setTimeout(instrument, timeout):
+    try:
+        connection = instrument.adapter.connection
+    except AttributeError:
+        return None
+    previous = connection.timeout
+    connection.timeout = timeout
+    return previous
+
+class Session:
+    def __init__(self, resource, model, instrument):
+        self.resource = resource
+        self.model = model
+        self.instrument = instrument
+        self.idn = ""
+        self.alive = True
+        self.lastSeen = 0.0
+        #Held while a sweep owns the instrument, health checks skip busy sessions
+        self.busy = threading.Lock()
+        #Only a brand new session starts from unknown state and needs a reset
+        self.needsReset = True
+        #(perf_counter start, seconds) of the last reset, until a run's stats pick it up
+        self.prepared = None
+
+class ConnectionManager:
+    def __init__(self, factory = defaultFactory, healthInterval = HEALTH_INTERVAL):
+        self.factory = factory
+        self.healthInterval = healthInterval
+        self.sessions = {}
+        self.resources = []
+        self.events = queue.Queue()
+        self.lock = threading.Lock()
+        self.stopEvent = threading.Event()
+        self.healthThread = None
+
+    def background(self, target, *args):
+        thread = threading.Thread(target = target, args = args, daemon = True)
+        thread.start()
+        return thread
+
+    def discover(self):
+        return self.background(self.discoverNow)
+
+    def discoverNow(self):
+        try:
+            import pyvisa
+            resourceManager = pyvisa.ResourceManager()
+            found = []
+            for resource in resourceManager.list_resources():
+                found.append((resource, self.probe(resourceManager, resource)))
+            self.resources = found
+        except Exception as e:
+            self.resources = []
+            self.events.put(("discoverFailed", e))
+            return
+        self.events.put(("resources", list(self.resources)))
+
+    def probe(self, resourceManager, resource):
+        #Sessions we already hold answer from the pool, never open a second one
+        if resource in self.sessions:
+            return self.sessions[resource].idn
+        try:
+            handle = resourceManager.open_resource(resource, open_timeout = PING_TIMEOUT)
+            handle.timeout = PING_TIMEOUT
+            try:
+                return handle.query("*IDN?").strip()
+            finally:
+                handle.close()
+        except Exception:
+            return ""
+
+    def open(self, resource, model = None):
+        """Return a live Session for resource, reusing a pooled one when it
+        still answers *IDN?. Blocks, use openAsync from the GUI."""
+        with self.lock:
+            session = self.sessions.get(resource)
+            if session is not None:
+                if not session.busy.acquire(blocking = False):
+                    #A sweep owns it, it is in use and answering, never talk over it
+                    return session
+                try:
+                    alive = self.ping(session)
+                finally:
+                    session.busy.release()
+                if alive:
+                    return session
+
+            if model is None:
+                model = modelFromIDN(dict(self.resources).get(resource, "")) or "K2450"
+            if session is not None:
+                self.close(resource)
+            session = Session(resource, model, self.factory(model, resource))
+            self.ping(session)
+            self.sessions[resource] = session
+            return session
+
+    def openAsync(self, resource, model = None):
+        def target():
+            try:
+                session = self.open(resource, model)
+                #The reset is slow, it stays off the GUI thread too
+                self.prepare(session)
+                self.events.put(("opened", session))
+            except Exception as e:
+                self.events.put(("openFailed", (resource, e)))
+        return self.background(target)
+
+    def ping(self, session, timeout = PING_TIMEOUT):
+        previous = setTimeout(session.instrument, timeout)
+        try:
+            session.idn = session.instrument.ask("*IDN?").strip()
+            session.alive = True
+            session.lastSeen = time.monotonic()
+        except Exception:
+            session.alive = False
+        finally:
+            if previous is not None:
+                setTimeout(session.instrument, previous)
+        return session.alive
+
+    def prepare(self, session):
+        #Initialize SMU parameters, a pooled session that is still alive keeps its state and settings mirror
+        if not self.needsPrepare(session):
+            #Never wait out a sweep that is using a healthy pooled session
+            return session.instrument
+        with session.busy:
+            return self.prepareHeld(session)
+
+    def needsPrepare(self, session):
+        return session.needsReset or not stateFor(session.instrument).known
+
+    def prepareHeld(self, session):
+        #prepare for a caller already holding session.busy
+        if self.needsPrepare(session):
+            start = time.perf_counter()
+            resetSMU(session.instrument)
+            session.prepared = (start, time.perf_counter() - start)
+            session.needsReset = False
+        return session.instrument
+
+    def close(self, resource):
+        session = self.sessions.pop(resource, None)
+        if session is not None:
+            closeInstrument(session.instrument)
+
+    def closeAll(self):
+        self.stopEvent.set()
+        for resource in list(self.sessions):
+            self.close(resource)
+
+    def startHealthChecks(self):
+        if self.healthThread is None:
+            self.healthThread = self.background(self.healthLoop)
+
+    def healthLoop(self):
+        while not self.stopEvent.wait(self.healthInterval):
+            for session in list(self.sessions.values()):
+                if not session.busy.acquire(blocking = False):
+                    continue
+                try:
+                    self.checkSession(session)
+                finally:
+                    session.busy.release()
+
+    def checkSession(self, session):
+        if self.ping(session):
+            return
+        self.events.put(("lost", session))
+        #Free the dead VISA session before opening another on the same resource
+        closeInstrument(session.instrument)
+        try:
+            instrument = self.factory(session.model, session.resource)
+        except Exception:
+            return
+        session.instrument = instrument
+        session.needsReset = True
+        if not self.ping(session):
+            return
+        try:
+            #healthLoop already holds session.busy
+            self.prepareHeld(session)
+        except Exception:
+            #Still needs its reset, the next check tries again
+            session.alive = False
+            return
+        self.events.put(("reconnected", session))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel acquisition across several SMUs.
+
+A StationCoordinator runs one SweepWorker per DUT station, each on its own
+thread with its own VISA session, and merges their messages into a single
+queue in the same (kind, payload) form the GUI already understands. Every
+worker times its readings from the coordinator's start, so rows from
+different instruments line up in the saved files as well as on screen. Rows
+posted to the GUI are tagged with the station index:
+
+    ("data", rows)    rows are (station, V, I, aligned time)
+
+It exposes the same cancel/pause/resume/paused/is_alive surface as a
+SweepWorker, so RunInformation can drive either.
+"""
+import queue
+import threading
+import time
+import numpy as np
+
+from instrumentation import RunStats
+from sweepengine import SweepWorker
+
+class StationQueue:
+    #Stands in for a worker's outQueue and tags each message with its station
+    def __init__(self, merged, station):
+        self.merged = merged
+        self.station = station
+
+    def put(self, message):
+        self.merged.put((self.station,) + tuple(message))
+
+class StationCoordinator(threading.Thread):
+    def __init__(self, outQueue, smus, VdPoints, delay = None, recorders = None, order = "raster"):
+        threading.Thread.__init__(self, daemon = True)
+        self.outQueue = outQueue
+        self.merged = queue.Queue()
+        recorders = recorders or [None] * len(smus)
+        #One set of run statistics, each station's instrument counted under its own label
+        self.stats = RunStats()
+        self.workers = [SweepWorker(StationQueue(self.merged, station), smu, "diode", VdPoints,
+                                    delay = delay, recorder = recorders[station], stats = self.stats,
+                                    label = "SMU #%d" % station, order = order)
+                        for station, smu in enumerate(smus)]
+        self.t0 = None
+
+    @property
+    def totalPoints(self):
+        return sum(worker.totalPoints for worker in self.workers)
+
+    @property
+    def paused(self):
+        return any(worker.paused for worker in self.workers)
+
+    def cancel(self):
+        for worker in self.workers:
+            worker.cancel()
+
+    def pause(self):
+        for worker in self.workers:
+            worker.pause()
+
+    def resume(self):
+        for worker in self.workers:
+            worker.resume()
+
+    def run(self):
+        self.t0 = time.monotonic()
+        self.outQueue.put(("started", self.totalPoints))
+        for worker in self.workers:
+            #Shared before any reading, so each station's recorder saves aligned times too
+            worker.timeOrigin = self.t0
+            worker.start()
+
+        progress = [0] * len(self.workers)
+        finished = {}
+        while len(finished) < len(self.workers):
+            station, kind, payload = self.merged.get()
+            if kind == "data":
+                self.outQueue.put(("data", self.align(station, payload)))
+            elif kind == "progress":
+                progress[station] = payload[0]
+                self.outQueue.put(("progress", (sum(progress), self.totalPoints)))
+            elif kind in ("done", "cancelled", "error"):
+                finished[station] = (kind, payload)
+
+        self.stats.finish()
+        errors = ["SMU #%d: %s" % (station, payload) for station, (kind, payload) in sorted(finished.items())
+                  if kind == "error"]
+        if errors:
+            self.outQueue.put(("error", RuntimeError("\n".join(errors))))
+        elif any(kind == "cancelled" for kind, payload in finished.values()):
+            self.outQueue.put(("cancelled", None))
+        else:
+            self.outQueue.put(("done", None))
+
+    def align(self, station, rows):
+        #Times are already on the shared clock, see run
+        return np.column_stack((np.full(len(rows), station), rows[:, 0], rows[:, 1], rows[:, 2]))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized device models.
+
+Used to predict where an adaptive sweep will refine before anything is
+measured, and as the response of the simulated SMUs.
+"""
+import numpy as np
+
+THERMAL_VOLTAGE = 0.025852
+
+#Default parameters, a small signal silicon diode and an enhancement NMOS
+DIODE = {"Is": 1e-12, "n": 1.8, "Rs": 2.0}
+MOSFET = {"Vth": 1.0, "k": 2e-3, "lam": 0.02, "n": 1.5, "Ioff": 1e-11}
+
+def shockley(V, Is = DIODE["Is"], n = DIODE["n"], Rs = DIODE["Rs"]):
+    """Diode current with series resistance. Solves for the junction voltage
+    Vj + Rs*Is*(exp(Vj/(n*Vt)) - 1) = V with vectorized Newton steps started
+    from an upper bound, which converge monotonically for this convex
+    equation."""
+    V = np.asarray(V, dtype = float)
+    nVt = n * THERMAL_VOLTAGE
+    if Rs <= 0:
+        return Is * np.expm1(np.minimum(V / nVt, 700))
+    Vj = np.minimum(V, nVt * np.log1p(np.maximum(V, 0) / (Rs * Is)))
+    for _ in range(50):
+        e = Rs * Is * np.exp(Vj / nVt)
+        step = (Vj + e - Rs * Is - V) / (1 + e / nVt)
+        Vj = Vj - step
+        if np.all(np.abs(step) < 1e-12):
+            break
+    return Is * np.expm1(Vj / nVt)
+
+def squareLaw(Vd, Vg, Vth = MOSFET["Vth"], k = MOSFET["k"], lam = MOSFET["lam"], n = MOSFET["n"], Ioff = MOSFET["Ioff"]):
+    """Drain current of a long channel NMOS, broadcast over Vd and Vg.
+    Linear and saturation regions follow the square law with channel length
+    modulation; below threshold the current falls off exponentially so the
+    transfer curve stays smooth through Vth."""
+    Vd = np.asarray(Vd, dtype = float)
+    Vg = np.asarray(Vg, dtype = float)
+    #Smooth overdrive, ~Vg - Vth above threshold and exponentially small below it
+    nVt = n * THERMAL_VOLTAGE
+    Vov = 2 * nVt * np.logaddexp(0, (Vg - Vth) / (2 * nVt))
+    Vdsat = np.minimum(Vd, Vov)
+    Id = k * (Vov * Vdsat - 0.5 * Vdsat ** 2) * (1 + lam * Vd)
+    return Id + Ioff * np.tanh(Vd / THERMAL_VOLTAGE)
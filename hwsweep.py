@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Instrument-side sweeps.
+
+Loads a linear or list voltage sweep into the SMU so it steps the source,
+measures and fills its reading buffer on its own. The host only starts the
+sweep and drains the buffer, so throughput is set by NPLC and the source
+delay instead of a bus round-trip per point.
+
+Keithley 2450: :SOUR:SWE:VOLT:LIN / :SOUR:SWE:VOLT:LIST build the trigger model,
+               a uniform forward and back loop is one dual linear sweep
+Keithley 2400: :SOUR:VOLT:MODE SWE|LIST with :TRIG:COUN and the trace buffer
+
+Linear sweeps pick the best source range themselves. List sweeps and fixed
+levels run on the source range, which is set to the lowest one covering
+them, and lists are sent at most MAX_LIST values per command.
+
+Loaded sweeps and the source range are remembered in the instrument's state
+mirror, ensureSweep skips loading a sweep that is already there.
+"""
+import numpy as np
+
+from instrumentstate import stateFor, sweepKey
+from readback import BUFFER, isKeithley2400
+
+#Most values either model accepts in one :SOUR:LIST:VOLT(:APP), and the 2400's buffer size
+MAX_LIST = 100
+MAX_POINTS_2400 = 2500
+#Voltage source ranges both models have, in V
+SOURCE_RANGES = (0.2, 2, 20, 200)
+
+def isUniform(points, rtol = 1e-9):
+    if len(points) < 3:
+        return True
+    steps = np.diff(points)
+    return np.allclose(steps, steps[0], rtol = rtol, atol = rtol * np.abs(points).max())
+
+def isLoop(points):
+    #Uniform points out and the same points back, what a 2450 dual linear sweep runs
+    half = len(points) // 2
+    return (len(points) >= 4 and len(points) % 2 == 0 and isUniform(points[:half])
+            and np.array_equal(points[half:], points[half - 1::-1]))
+
+def isListSweep(smu, points):
+    #Lists run on the fixed source range, linear sweeps pick their own
+    return not isUniform(points) and (isKeithley2400(smu) or not isLoop(points))
+
+def formatList(points):
+    return ",".join("%.6g" % v for v in points)
+
+def writeList(smu, points):
+    smu.write(":SOUR:LIST:VOLT " + formatList(points[:MAX_LIST]))
+    for start in range(MAX_LIST, len(points), MAX_LIST):
+        smu.write(":SOUR:LIST:VOLT:APP " + formatList(points[start:start + MAX_LIST]))
+
+def sourceRange(points):
+    #Lowest range covering every point, the top one beyond it
+    peak = float(np.abs(points).max()) if len(points) else 0.0
+    return next((limit for limit in SOURCE_RANGES if peak <= limit), SOURCE_RANGES[-1])
+
+def setSourceRange(smu, points):
+    """Put the source on the lowest range covering points. Written through
+    the state mirror, so configureSMU's fixed range is restored next run and
+    an unchanged range is not written again."""
+    return stateFor(smu).apply(smu, (("source.range", sourceRange(points)),))
+
+def clearBuffer(smu, buffer = BUFFER):
+    if isKeithley2400(smu):
+        smu.write(":TRAC:CLE")
+        #Clearing the 2400 buffer also stops it storing, re-arm it
+        smu.write(":TRAC:FEED:CONT NEXT")
+    else:
+        smu.write(':TRAC:CLE "%s"' % buffer)
+
+def loadSweep2450(smu, points, delay, buffer = BUFFER):
+    if isUniform(points):
+        smu.write(':SOUR:SWE:VOLT:LIN %.6g, %.6g, %d, %.6g, 1, BEST, OFF, OFF, "%s"' %
+                  (points[0], points[-1], len(points), delay, buffer))
+    elif isLoop(points):
+        #Dual sweep: the half's points forward, then back again from the stop point
+        half = len(points) // 2
+        smu.write(':SOUR:SWE:VOLT:LIN %.6g, %.6g, %d, %.6g, 1, BEST, OFF, ON, "%s"' %
+                  (points[0], points[half - 1], half, delay, buffer))
+    else:
+        writeList(smu, points)
+        smu.write(':SOUR:SWE:VOLT:LIST 1, %.6g, 1, OFF, "%s"' % (delay, buffer))
+
+def loadSweep2400(smu, points, delay):
+    if len(points) > MAX_POINTS_2400:
+        raise ValueError("Keithley 2400 sweeps are limited to %d points" % MAX_POINTS_2400)
+    if isUniform(points):
+        smu.write(":SOUR:VOLT:MODE SWE")
+        smu.write(":SOUR:SWE:SPAC LIN")
+        smu.write(":SOUR:VOLT:STAR %.6g" % points[0])
+        smu.write(":SOUR:VOLT:STOP %.6g" % points[-1])
+        smu.write(":SOUR:SWE:POIN %d" % len(points))
+    else:
+        smu.write(":SOUR:VOLT:MODE LIST")
+        writeList(smu, points)
+    smu.write(":SOUR:DEL %.6g" % delay)
+    smu.write(":TRIG:COUN %d" % len(points))
+    smu.write(":TRAC:POIN %d" % len(points))
+    smu.write(":TRAC:FEED SENS")
+    smu.write(":TRAC:FEED:CONT NEXT")
+
+def loadSweep(smu, points, delay, buffer = BUFFER):
+    points = np.asarray(points, dtype = float)
+    state = stateFor(smu)
+    #A load that fails halfway leaves no usable sweep behind
+    state.sweep = None
+    if isListSweep(smu, points):
+        setSourceRange(smu, points)
+    else:
+        #Linear sweeps run on BEST range, the mirrored source range no longer holds
+        state.forget("source.range")
+    if isKeithley2400(smu):
+        loadSweep2400(smu, points, delay)
+    else:
+        loadSweep2450(smu, points, delay, buffer)
+    state.sweep = sweepKey(points, delay, buffer)
+
+def ensureSweep(smu, points, delay, buffer = BUFFER):
+    """Load the sweep unless the same one is still loaded. Returns whether it
+    had to be loaded."""
+    state = stateFor(smu)
+    if state.known and state.sweep == sweepKey(points, delay, buffer):
+        #A level held since may have moved the source range off the list's
+        if isListSweep(smu, points):
+            setSourceRange(smu, points)
+        return False
+    loadSweep(smu, points, delay, buffer)
+    return True
+
+def holdLevel(smu, level):
+    #Drive the output to level ahead of a sweep, so the jump onto its first point can settle
+    if abs(level) > stateFor(smu).settings.get("source.range", 0):
+        #Only ever raised here, lowering it first could cut off the level the output is at
+        setSourceRange(smu, [level])
+    smu.write(":SOUR:VOLT %.6g" % level)
+    smu.write(":OUTP ON")
+
+def startSweep(smu):
+    smu.write(":OUTP ON")
+    smu.write(":INIT")
+
+def abortSweep(smu):
+    smu.write(":ABOR")
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Acquisition instrumentation.
+
+A RunStats collects, for one run:
+    phases       timed spans (configure, load, start, wait, readback, record,
+                 draw, ...) per thread
+    instruments  SCPI writes, queries and bytes moved per SMU
+    points       readings delivered, for points per second
+
+Phase totals add up over threads, so with a gate SMU waiting alongside the
+drain they can exceed the wall time.
+
+instrumentSMU wraps an instrument's write/ask/query_binary_values so every
+command is counted without touching the code that sends it. The whole run
+can be written as a Chrome trace (chrome://tracing or ui.perfetto.dev) with
+the summary under "otherData".
+"""
+import json
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+#Individual spans kept for the trace, totals keep counting past it
+MAX_TRACE_EVENTS = 100000
+
+def tracePath(dataFile):
+    return os.path.splitext(dataFile)[0] + "_trace.json"
+
+class RunStats:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.end = None
+        self.lock = threading.Lock()
+        self.spans = []
+        #Phase -> [count, seconds]
+        self.totals = {}
+        #Instrument label -> command counters
+        self.instruments = {}
+        self.points = 0
+        #Derived figures that are not measured directly, e.g. the settling share of the sweep
+        self.notes = {}
+
+    @contextmanager
+    def phase(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addSpan(name, start, time.perf_counter() - start, **args)
+
+    def addSpan(self, name, start, duration, thread = None, **args):
+        with self.lock:
+            total = self.totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += duration
+            if len(self.spans) < MAX_TRACE_EVENTS:
+                self.spans.append((name, start, duration, thread or threading.current_thread().name, args))
+
+    def countCommand(self, label, kind, bytesOut, bytesIn = 0):
+        with self.lock:
+            counters = self.instruments.setdefault(label, {"writes": 0, "queries": 0, "bytesOut": 0, "bytesIn": 0})
+            counters[kind] += 1
+            counters["bytesOut"] += bytesOut
+            counters["bytesIn"] += bytesIn
+
+    def addPoints(self, count):
+        with self.lock:
+            self.points += count
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    @property
+    def wall(self):
+        return (self.end or time.perf_counter()) - self.t0
+
+    def summary(self):
+        wall = self.wall
+        with self.lock:
+            phases = {name: {"count": count, "seconds": seconds, "share": seconds / wall if wall else 0.0}
+                      for name, (count, seconds) in sorted(self.totals.items(), key = lambda item: -item[1][1])}
+            return {
+                "wall": wall,
+                "points": self.points,
+                "pointsPerSecond": self.points / wall if wall else 0.0,
+                "phases": phases,
+                "instruments": {label: dict(counters) for label, counters in self.instruments.items()},
+                "notes": dict(self.notes),
+            }
+
+    def summaryText(self, phases = 6):
+        summary = self.summary()
+        lines = ["%d points in %.2f s, %.0f pts/s" % (summary["points"], summary["wall"], summary["pointsPerSecond"])]
+        for name, phase in list(summary["phases"].items())[:phases]:
+            lines.append("%-10s %7.3f s  x%d" % (name, phase["seconds"], phase["count"]))
+        for label, counters in summary["instruments"].items():
+            lines.append("%s: %d cmds, %.1f kB" % (label, counters["writes"] + counters["queries"],
+                                                  (counters["bytesOut"] + counters["bytesIn"]) / 1e3))
+        return "\n".join(lines)
+
+    def chromeTrace(self):
+        with self.lock:
+            spans = list(self.spans)
+        threads = {}
+        events = []
+        for name, start, duration, thread, args in spans:
+            tid = threads.setdefault(thread, len(threads) + 1)
+            events.append({"name": name, "cat": "acquisition", "ph": "X", "pid": 1, "tid": tid,
+                           "ts": (start - self.t0) * 1e6, "dur": duration * 1e6, "args": args})
+        for thread, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread}})
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": self.summary()}
+
+    def write(self, path):
+        temp = path + ".tmp"
+        with open(temp, "w") as file:
+            json.dump(self.chromeTrace(), file)
+        os.replace(temp, path)
+        return path
+
+def responseBytes(response):
+    try:
+        return len(response)
+    except TypeError:
+        return 0
+
+def binaryBytes(values, datatype = "f", *args, **kwargs):
+    #Sized by the format the caller parsed, float32 blocks from a 2400 are half a 2450's float64
+    return struct.calcsize(datatype) * responseBytes(values)
+
+def instrumentSMU(smu, stats, label):
+    """Count every command smu sends into stats under label. Returns a
+    function that puts the instrument back the way it was."""
+    wrapped = []
+
+    def wrap(target, name, kind, sizeOf):
+        original = getattr(target, name, None)
+        if original is None:
+            return
+        def counted(command, *args, **kwargs):
+            response = original(command, *args, **kwargs)
+            stats.countCommand(label, kind, len(command), sizeOf(response, *args, **kwargs))
+            return response
+        try:
+            setattr(target, name, counted)
+        except AttributeError:
+            return
+        wrapped.append((target, name))
+
+    wrap(smu, "write", "writes", lambda response, *args, **kwargs: 0)
+    wrap(smu, "ask", "queries", lambda response, *args, **kwargs: responseBytes(response))
+    if hasattr(smu, "query_binary_values"):
+        wrap(smu, "query_binary_values", "queries", binaryBytes)
+    else:
+        #pymeasure instruments read binary blocks through the pyvisa session
+        connection = getattr(getattr(smu, "adapter", None), "connection", None)
+        if connection is not None:
+            wrap(connection, "query_binary_values", "queries", binaryBytes)
+
+    def restore():
+        for target, name in wrapped:
+            try:
+                delattr(target, name)
+            except AttributeError:
+                pass
+    return restore
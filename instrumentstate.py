@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Cached mirror of each instrument's configuration.
+
+Every setting the program writes is remembered per instrument, so a repeat
+run only sends the ones that changed, and a sweep already loaded with the
+same points and delay is not loaded again. The mirror is only trusted while
+the state is known: a fresh connection or a failed run leaves it unknown,
+and the next configure starts with a full reset.
+
+Nothing outside this program is seen, so settings changed on the front
+panel between runs are not noticed; call invalidate() after touching an
+instrument by hand.
+"""
+import hashlib
+import threading
+import weakref
+
+#Setting values that name an instrument constant, e.g. smu.FUNC_DC_CURRENT
+class Constant:
+    def __init__(self, name):
+        self.name = name
+
+    def resolve(self, smu):
+        return getattr(smu, self.name)
+
+class InstrumentState:
+    def __init__(self):
+        self.known = False
+        self.settings = {}
+        self.sweep = None
+
+    def invalidate(self):
+        self.known = False
+        self.settings = {}
+        self.sweep = None
+
+    def forget(self, path):
+        #The instrument changed this setting on its own, write it again next time it is wanted
+        self.settings.pop(path, None)
+
+    def afterReset(self):
+        #Reset defaults are not mirrored, everything is written once more on the next configure
+        self.known = True
+        self.settings = {}
+        self.sweep = None
+
+    def apply(self, smu, settings):
+        """Write the (path, value) settings that differ from the mirror,
+        return how many were written. Changing a function resets the
+        instrument's per-function settings, so everything listed after a
+        written func is written as well."""
+        written = 0
+        changedFunction = False
+        for path, value in settings:
+            if isinstance(value, Constant):
+                value = value.resolve(smu)
+            if not changedFunction and path in self.settings and self.settings[path] == value:
+                continue
+            owner, _, name = path.rpartition(".")
+            target = smu
+            for part in owner.split(".") if owner else []:
+                target = getattr(target, part)
+            setattr(target, name, value)
+            self.settings[path] = value
+            written += 1
+            changedFunction = changedFunction or name == "func"
+        return written
+
+states = weakref.WeakKeyDictionary()
+statesLock = threading.Lock()
+
+def stateFor(smu):
+    with statesLock:
+        state = states.get(smu)
+        if state is None:
+            state = states[smu] = InstrumentState()
+        return state
+
+def invalidate(smu):
+    if smu is not None:
+        stateFor(smu).invalidate()
+
+def resetSMU(smu):
+    smu.reset()
+    smu.use_front_terminals()
+    stateFor(smu).afterReset()
+
+def sweepKey(points, delay, buffer):
+    #connections imports this module at GUI start-up, numpy is only needed once a sweep is loaded
+    import numpy as np
+    digest = hashlib.sha1(np.ascontiguousarray(points, dtype = float).tobytes())
+    digest.update(repr((float(delay), buffer)).encode())
+    return digest.hexdigest()
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Live I-V plotting for RunInformation.
+
+New readings are appended to one Line2D per Vg curve and redrawn with
+blitting, throttled to a target frame rate. Each curve keeps its full
+resolution data for export but only shows a min/max decimated copy that is
+updated incrementally, so a redraw costs about the same at 10^3 or 10^6
+points. Given a ResultStore, curves show views of the store's columns instead
+of keeping their own copy.
+
+Only curves still receiving readings are blitted. Once a newer curve starts,
+the ones it replaced are drawn into the cached background and never redrawn
+on their own again, so a frame costs the same on the first curve of a map
+as on the hundredth. The whole plot shares PLOT_DISPLAY_POINTS, each curve
+shows its share of them, and the legend is left out past LEGEND_CURVES.
+"""
+import time
+import numpy as np
+
+from sweepplan import ORDERS, nearestFirst
+
+TARGET_FPS = 20
+#Decimated points shown per curve before bins are merged
+MAX_DISPLAY_POINTS = 4000
+#Decimated points shown across all curves of a live plot, and the fewest one curve gets
+PLOT_DISPLAY_POINTS = 16000
+MIN_CURVE_POINTS = 64
+#Live plots with more curves than this go without a legend
+LEGEND_CURVES = 12
+#Headroom added when the axes have to grow
+AXIS_MARGIN = 0.1
+
+#Test types whose rows carry a curve key in column 0, and how that key is labelled
+CURVE_LABELS = {"transistor": "Vg = %g V", "stations": "SMU #%d"}
+
+class CurveBuffer:
+    """Growable x/y storage for one curve plus its incremental min/max
+    decimation. Bins of binSize readings keep the index of their minimum and
+    maximum reading; when there are too many bins, neighbours are merged and
+    binSize doubles, so the decimated copy never has to rescan the raw data."""
+    def __init__(self, capacity = 1024, maxPoints = MAX_DISPLAY_POINTS):
+        self.maxPoints = maxPoints
+        self.x = np.empty(capacity)
+        self.y = np.empty(capacity)
+        self.n = 0
+        self.binSize = 1
+        self.binned = 0
+        self.minIdx = np.empty(0, dtype = np.int64)
+        self.maxIdx = np.empty(0, dtype = np.int64)
+
+    def append(self, x, y):
+        end = self.n + len(x)
+        if end > len(self.x):
+            capacity = max(end, 2 * len(self.x))
+            self.x = np.resize(self.x, capacity)
+            self.y = np.resize(self.y, capacity)
+        self.x[self.n:end] = x
+        self.y[self.n:end] = y
+        self.n = end
+        self.decimate()
+
+    def track(self, x, y):
+        #x and y are views of the whole curve so far, owned by a ResultStore
+        self.x = x
+        self.y = y
+        self.n = len(x)
+        self.decimate()
+
+    def setMaxPoints(self, maxPoints):
+        #A smaller budget merges the existing bins down, the raw data is kept
+        self.maxPoints = maxPoints
+        self.decimate()
+
+    def decimate(self):
+        if not self.binned:
+            #A first chunk bigger than the display starts at its final bin size instead of merging down to it
+            while 2 * (self.n // self.binSize) > self.maxPoints:
+                self.binSize *= 2
+        bins = (self.n - self.binned) // self.binSize
+        if bins:
+            start = self.binned
+            block = self.y[start:start + bins * self.binSize].reshape(bins, self.binSize)
+            offsets = start + np.arange(bins) * self.binSize
+            self.minIdx = np.concatenate((self.minIdx, offsets + block.argmin(axis = 1)))
+            self.maxIdx = np.concatenate((self.maxIdx, offsets + block.argmax(axis = 1)))
+            self.binned += bins * self.binSize
+
+        while 2 * len(self.minIdx) > self.maxPoints:
+            self.mergeBins()
+
+    def mergeBins(self):
+        pairs = len(self.minIdx) // 2
+        lo = self.minIdx[:2 * pairs].reshape(pairs, 2)
+        hi = self.maxIdx[:2 * pairs].reshape(pairs, 2)
+        rows = np.arange(pairs)
+        self.minIdx = lo[rows, self.y[lo].argmin(axis = 1)]
+        self.maxIdx = hi[rows, self.y[hi].argmax(axis = 1)]
+        #An unpaired last bin goes back to the raw tail
+        self.binned = 2 * pairs * self.binSize
+        self.binSize *= 2
+
+    def display(self):
+        if self.binSize == 1:
+            return self.x[:self.n], self.y[:self.n]
+        #Keep min and max of each bin in acquisition order, then the raw tail
+        idx = np.sort(np.concatenate((self.minIdx, self.maxIdx)))
+        idx = np.concatenate((idx, np.arange(self.binned, self.n)))
+        return self.x[idx], self.y[idx]
+
+    def full(self):
+        return self.x[:self.n], self.y[:self.n]
+
+def curveBudget(curves):
+    """Display points per curve when a plot shows curves of them. The share
+    only changes when the curve count passes a power of two, so a growing map
+    rebalances (and fully redraws) a handful of times, not on every curve."""
+    share = PLOT_DISPLAY_POINTS // (1 << max(curves - 1, 0).bit_length())
+    return max(MIN_CURVE_POINTS, min(MAX_DISPLAY_POINTS, share))
+
+def uniqueInOrder(keys):
+    #Distinct keys in order of first appearance
+    keys, starts = np.unique(keys, return_index = True)
+    return keys[np.argsort(starts)]
+
+class LivePlot:
+    def __init__(self, fig, ax, canvas, fps = TARGET_FPS):
+        self.fig = fig
+        self.ax = ax
+        self.canvas = canvas
+        self.interval = 1.0 / fps
+        self.background = None
+        #Optional RunStats, full draws and blits are timed into it
+        self.stats = None
+        self.canvas.mpl_connect("draw_event", self.onDraw)
+        self.reset()
+
+    def reset(self, testType = "diode", markers = False, store = None):
+        for line in getattr(self, "lines", {}).values():
+            line.remove()
+        self.testType = testType.lower()
+        #Adaptive sweeps arrive out of Vd order, joining them with lines would zigzag
+        self.markers = markers
+        #Curves recorded in one piece (diode, transistor) can be shown straight from a ResultStore
+        self.store = store
+        self.curves = {}
+        self.lines = {}
+        #Curves a newer one has replaced, drawn into the background on the next frame
+        self.finished = set()
+        self.budget = curveBudget(1)
+        self.bounds = None
+        self.dirty = False
+        self.needsFullDraw = True
+        self.lastDraw = 0.0
+        legend = self.ax.get_legend()
+        if legend is not None:
+            legend.remove()
+
+    def onDraw(self, event):
+        #Full redraws leave the animated lines out, grab the static background then blit them back
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.blitActive()
+
+    def blitActive(self):
+        for line in self.lines.values():
+            if line.get_animated():
+                self.ax.draw_artist(line)
+        self.canvas.blit(self.fig.bbox)
+
+    def append(self, rows):
+        if len(rows) == 0:
+            return
+        known = len(self.curves)
+        if self.store is not None:
+            keys = rows[:, 0] if self.testType in CURVE_LABELS else np.zeros(1)
+            for key in uniqueInOrder(keys):
+                curve = self.store.curve(key)
+                self.appendCurve(float(key), curve["Vd"], curve["Id"], track = True)
+        elif self.testType in CURVE_LABELS:
+            #Rows are (Vg, Vd, Id, Ig, t) or (station, V, I, t), one curve per key
+            Vg = rows[:, 0]
+            for key in uniqueInOrder(Vg):
+                mask = Vg == key
+                self.appendCurve(float(key), rows[mask, 1], rows[mask, 2])
+        else:
+            self.appendCurve(0.0, rows[:, 0], rows[:, 1])
+        if len(self.curves) > known:
+            #A new curve started, the ones that got nothing in this chunk are done
+            keys = set(uniqueInOrder(rows[:, 0]).tolist()) if self.testType in CURVE_LABELS else {0.0}
+            self.finished.update(key for key, line in self.lines.items() if line.get_animated() and key not in keys)
+        self.updateBounds(rows)
+        self.dirty = True
+
+    def appendCurve(self, key, x, y, track = False):
+        if key not in self.curves:
+            budget = curveBudget(len(self.curves) + 1)
+            if budget != self.budget:
+                self.budget = budget
+                for curve in self.curves.values():
+                    curve.setMaxPoints(budget)
+                self.needsFullDraw = True
+            self.curves[key] = CurveBuffer(maxPoints = self.budget)
+            label = CURVE_LABELS[self.testType] % key if self.testType in CURVE_LABELS else None
+            style = {"linestyle": "none", "marker": "."} if self.markers else {"linewidth": 1}
+            self.lines[key], = self.ax.plot([], [], animated = True, label = label, **style)
+            #An animated line needs no full draw, only a legend entry does (or the legend going away)
+            if label is not None and len(self.lines) <= LEGEND_CURVES + 1:
+                self.needsFullDraw = True
+        elif not self.lines[key].get_animated():
+            #More readings for a curve already in the background, take it out again
+            self.lines[key].set_animated(True)
+            self.needsFullDraw = True
+        self.finished.discard(key)
+        if track:
+            self.curves[key].track(x, y)
+        else:
+            self.curves[key].append(x, y)
+
+    def updateBounds(self, rows):
+        xCol, yCol = (1, 2) if self.testType in CURVE_LABELS else (0, 1)
+        lo = np.array([rows[:, xCol].min(), rows[:, yCol].min()])
+        hi = np.array([rows[:, xCol].max(), rows[:, yCol].max()])
+        if self.bounds is None:
+            self.bounds = [lo, hi]
+        else:
+            self.bounds = [np.minimum(self.bounds[0], lo), np.maximum(self.bounds[1], hi)]
+
+        #Only rescale when the data leaves the current view
+        xLim, yLim = self.ax.get_xlim(), self.ax.get_ylim()
+        if self.needsFullDraw or lo[0] < xLim[0] or hi[0] > xLim[1] or lo[1] < yLim[0] or hi[1] > yLim[1]:
+            span = np.maximum(self.bounds[1] - self.bounds[0], 1e-12)
+            low = self.bounds[0] - AXIS_MARGIN * span
+            high = self.bounds[1] + AXIS_MARGIN * span
+            self.ax.set_xlim(low[0], high[0])
+            self.ax.set_ylim(low[1], high[1])
+            self.needsFullDraw = True
+
+    def update(self, force = False):
+        now = time.perf_counter()
+        if not self.dirty or (not force and now - self.lastDraw < self.interval):
+            return
+        self.lastDraw = now
+        self.dirty = False
+        fullDraw = self.needsFullDraw or self.background is None
+        self.redraw()
+        if self.stats is not None:
+            self.stats.addSpan("draw" if fullDraw else "blit", now, time.perf_counter() - now)
+
+    def redraw(self):
+        fullDraw = self.needsFullDraw or self.background is None
+        for key, line in self.lines.items():
+            #Lines already in the background only change with a full draw
+            if fullDraw or line.get_animated():
+                line.set_data(*self.curves[key].display())
+        finished = [self.lines[key] for key in self.finished]
+        self.finished = set()
+        for line in finished:
+            line.set_animated(False)
+
+        if fullDraw:
+            self.needsFullDraw = False
+            legend = self.ax.get_legend()
+            if self.testType in CURVE_LABELS and 0 < len(self.lines) <= LEGEND_CURVES:
+                self.ax.legend(fontsize = 6, loc = "upper left")
+            elif legend is not None:
+                legend.remove()
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            if finished:
+                #Bake the finished curves into the background once instead of blitting them every frame
+                for line in finished:
+                    self.ax.draw_artist(line)
+                self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+            self.blitActive()
+
+    def fullData(self):
+        return {key: curve.full() for key, curve in self.curves.items()}
+
+    def savefig(self, fileName):
+        #Animated artists are skipped by savefig, draw them normally at full resolution for export
+        animated = {key: line.get_animated() for key, line in self.lines.items()}
+        for key, line in self.lines.items():
+            line.set_animated(False)
+            line.set_data(*self.curves[key].full())
+        try:
+            self.fig.savefig(fileName)
+        finally:
+            for key, line in self.lines.items():
+                line.set_animated(animated[key])
+                line.set_data(*self.curves[key].display())
+            self.canvas.draw()
+
+#Preview grids with more points than this are thinned out for display
+PREVIEW_MAX_POINTS = 20000
+
+def previewGrid(VdPoints, VgPoints, maxPoints = PREVIEW_MAX_POINTS, order = "raster"):
+    """Vectorized Vd x Vg grid as an (n, 2) offsets array for a single
+    scatter, in the order the sweep plan (sweepplan.planCurves) measures it
+    so it doubles as the path, strided along both axes (keeping the end
+    points) when it would exceed maxPoints."""
+    if order not in ORDERS:
+        raise ValueError("Unknown sweep order %r, expected one of %s" % (order, ", ".join(ORDERS)))
+    VdPoints = np.asarray(VdPoints, dtype = float)
+    VgPoints = np.asarray(VgPoints, dtype = float)
+    if not len(VdPoints) or not len(VgPoints):
+        return np.empty((0, 2))
+    stride = int(np.ceil(np.sqrt(len(VdPoints) * len(VgPoints) / maxPoints)))
+    if stride > 1:
+        VdPoints = strideKeepEnds(VdPoints, stride)
+        VgPoints = strideKeepEnds(VgPoints, stride)
+    if order == "minslew":
+        VdPoints = nearestFirst(VdPoints)
+        VgPoints = nearestFirst(VgPoints)
+    Vd, Vg = np.meshgrid(VdPoints, VgPoints)
+    if order == "hysteresis":
+        Vd, Vg = np.concatenate((Vd, Vd[:, ::-1]), axis = 1), np.concatenate((Vg, Vg), axis = 1)
+    elif order != "raster":
+        Vd[1::2] = Vd[1::2, ::-1]
+    return np.column_stack((Vd.ravel(), Vg.ravel()))
+
+def strideKeepEnds(points, stride):
+    if len(points) <= 2:
+        return points
+    thinned = points[::stride]
+    if thinned[-1] != points[-1]:
+        thinned = np.append(thinned, points[-1])
+    return thinned
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk readback of the SMU reading buffer.
+
+Pulls whole ranges of defbuffer1 in a few large transfers (ASCII or binary
+REAL blocks) and parses them straight into numpy arrays instead of asking
+for every source value, reading and timestamp one at a time.
+
+Binary blocks are float64 on the 2450. The 2400 has no 64 bit format, it
+sends single precision (:FORM:DATA SREal, little endian REAL,32). The 2400
+also has no ranged buffer query, so while a sweep runs it is only read once
+the buffer holds every reading, not re-read whole on every poll.
+"""
+import numpy as np
+
+BUFFER = "defbuffer1"
+
+#Buffer elements returned per reading, in column order
+ELEMENTS = ("SOUR", "READ", "REL")
+ELEMENTS_2400 = "VOLT,CURR,TIME"
+
+#Readings per transfer, keeps a single block well under the VISA chunk limits
+CHUNK_SIZE = 5000
+
+def isKeithley2400(smu):
+    return "2400" in type(smu).__name__
+
+def setDataFormat(smu, binary = True):
+    if not binary:
+        smu.write(":FORM:DATA ASC")
+    elif isKeithley2400(smu):
+        #SREal is REAL,32 byte swapped, little endian for the host
+        smu.write(":FORM:DATA SRE")
+    else:
+        #REAL is IEEE754 double, SWAPped puts it little endian for the host
+        smu.write(":FORM:DATA REAL")
+        smu.write(":FORM:BORD SWAP")
+
+def binaryType(smu):
+    #struct format of one binary value as set up by setDataFormat
+    return "f" if isKeithley2400(smu) else "d"
+
+def bufferCount(smu, buffer = BUFFER):
+    if isKeithley2400(smu):
+        return int(float(smu.ask(":TRAC:POIN:ACT?")))
+    return int(float(smu.ask(':TRAC:ACT? "%s"' % buffer)))
+
+def parseASCII(text, columns = len(ELEMENTS)):
+    text = text.strip()
+    if not text:
+        return np.empty((0, columns))
+    return np.array(text.split(","), dtype = float).reshape(-1, columns)
+
+def queryBinary(smu, query):
+    #Simulated instruments answer directly, real ones go through the pyvisa session
+    if hasattr(smu, "query_binary_values"):
+        values = smu.query_binary_values(query, datatype = binaryType(smu), is_big_endian = False)
+    else:
+        values = smu.adapter.connection.query_binary_values(
+            query, datatype = binaryType(smu), is_big_endian = False, container = np.array)
+    return np.asarray(values, dtype = float)
+
+def readBuffer(smu, start, end, buffer = BUFFER, binary = False):
+    """Return readings start..end (1 based, inclusive) as an (n, 3) array of
+    source value, reading and relative timestamp."""
+    if end < start:
+        return np.empty((0, len(ELEMENTS)))
+
+    if isKeithley2400(smu):
+        #The 2400 has no ranged buffer query, fetch it whole and slice locally
+        smu.write(":FORM:ELEM " + ELEMENTS_2400)
+        query = ":TRAC:DATA?"
+    else:
+        query = ':TRAC:DATA? %d, %d, "%s", %s' % (start, end, buffer, ", ".join(ELEMENTS))
+
+    if binary:
+        data = queryBinary(smu, query).reshape(-1, len(ELEMENTS))
+    else:
+        data = parseASCII(smu.ask(query))
+
+    if isKeithley2400(smu):
+        data = data[start - 1:end]
+    return data
+
+def readBufferChunked(smu, count = None, buffer = BUFFER, binary = False, chunkSize = CHUNK_SIZE):
+    if count is None:
+        count = bufferCount(smu, buffer)
+    if isKeithley2400(smu):
+        return readBuffer(smu, 1, count, buffer, binary)
+
+    data = np.empty((count, len(ELEMENTS)))
+    for start in range(1, count + 1, chunkSize):
+        end = min(start + chunkSize - 1, count)
+        data[start - 1:end] = readBuffer(smu, start, end, buffer, binary)
+    return data
+
+class BufferDrainer:
+    """Pulls whatever has landed in the buffer since the last call, so the
+    buffer can be emptied in chunks while the sweep is still running. Given
+    the sweep's reading count, a 2400 is only read once it is complete."""
+    def __init__(self, smu, buffer = BUFFER, binary = False, chunkSize = CHUNK_SIZE, count = None):
+        self.smu = smu
+        self.buffer = buffer
+        self.binary = binary
+        self.chunkSize = chunkSize
+        self.count = count
+        self.nextIndex = 1
+        #Readings the instrument reported at the last drain, read back or not
+        self.available = 0
+        setDataFormat(smu, binary)
+
+    def drain(self):
+        count = bufferCount(self.smu, self.buffer)
+        self.available = count
+        if self.count is not None and count < self.count and isKeithley2400(self.smu):
+            #Every 2400 read returns the whole buffer, wait for the last reading instead
+            return np.empty((0, len(ELEMENTS)))
+        end = min(count, self.nextIndex + self.chunkSize - 1)
+        data = readBuffer(self.smu, self.nextIndex, end, self.buffer, self.binary)
+        self.nextIndex += len(data)
+        return data
+
+    def drainAll(self):
+        chunks = []
+        while True:
+            data = self.drain()
+            if len(data) == 0:
+                break
+            chunks.append(data)
+        if not chunks:
+            return np.empty((0, len(ELEMENTS)))
+        return np.concatenate(chunks)
+
+    def reset(self):
+        self.nextIndex = 1
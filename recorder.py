@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming, crash-safe measurement recording.
+
+Each chunk of readings is appended to disk as it arrives, flushed and
+fsynced every FSYNC_INTERVAL seconds. A JSON sidecar (<name>.run.json) holds
+the run metadata, sweep parameters and how many rows are known to be on disk,
+so an interrupted run can be reloaded or resumed from where it stopped.
+
+Backends:
+    csv  plain text, one row per reading
+    npy  float64 rows in a .npy file memory-mapped on load, no text parsing
+
+Rows are the worker's own chunks, written as they arrive on the worker
+thread, see results.ResultStore for why they do not go through the store.
+"""
+import csv
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+FSYNC_INTERVAL = 5.0
+WRITE_BUFFER = 1 << 20
+
+DIODE_COLUMNS = ["Voltage (V)", "Current (A)", "Time (s)"]
+TRANSISTOR_COLUMNS = ["Vg (V)", "Vd (V)", "Id (A)", "Ig (A)", "Time (s)"]
+
+#Fixed .npy header size so the shape can be rewritten in place on close
+NPY_HEADER_LEN = 128
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+def columnsFor(testType):
+    return TRANSISTOR_COLUMNS if testType.lower() == "transistor" else DIODE_COLUMNS
+
+def sidecarPath(path):
+    if path.endswith(".run.json"):
+        return path
+    return os.path.splitext(path)[0] + ".run.json"
+
+def reserveName(directory, baseName):
+    """baseName, or baseName_2, _3, ... when runs started in the same second
+    already use it. The name is claimed by creating its sidecar, so runs
+    started together on different threads never share files."""
+    index = 1
+    while True:
+        name = baseName if index == 1 else "%s_%d" % (baseName, index)
+        index += 1
+        if any(os.path.exists(os.path.join(directory, name + backend.extension)) for backend in BACKENDS.values()):
+            continue
+        try:
+            with open(os.path.join(directory, name + ".run.json"), "x"):
+                return name
+        except FileExistsError:
+            continue
+
+def npyHeader(rows, columns):
+    header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d, %d), }" % (rows, columns)
+    header = header.ljust(NPY_HEADER_LEN - len(NPY_MAGIC) - 3) + "\n"
+    return NPY_MAGIC + np.uint16(len(header)).tobytes() + header.encode("latin1")
+
+class CSVBackend:
+    extension = ".csv"
+
+    def __init__(self, path, columns, append = False):
+        self.file = open(path, "a" if append else "w", newline = "", buffering = WRITE_BUFFER)
+        if not append:
+            csv.writer(self.file).writerow(columns)
+
+    def write(self, rows):
+        np.savetxt(self.file, rows, delimiter = ",", fmt = "%.10g")
+
+    @staticmethod
+    def truncate(path, rows, columns):
+        #Drop a half written line left by a crash, keep header plus rows
+        with open(path, "r+", newline = "") as file:
+            for _ in range(rows + 1):
+                file.readline()
+            file.truncate(file.tell())
+
+    def close(self, rows):
+        self.file.close()
+
+    @staticmethod
+    def load(path, columns, rows = None):
+        #max_rows skips a half written last line after a crash
+        return np.loadtxt(path, delimiter = ",", skiprows = 1, ndmin = 2, max_rows = rows).reshape(-1, len(columns))
+
+class NPYBackend:
+    extension = ".npy"
+
+    def __init__(self, path, columns, append = False):
+        self.columns = len(columns)
+        self.file = open(path, "r+b" if append else "wb", buffering = WRITE_BUFFER)
+        if append:
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file.write(npyHeader(0, self.columns))
+
+    def write(self, rows):
+        np.ascontiguousarray(rows, dtype = "<f8").tofile(self.file)
+
+    @staticmethod
+    def truncate(path, rows, columns):
+        with open(path, "r+b") as file:
+            file.truncate(NPY_HEADER_LEN + rows * len(columns) * 8)
+
+    def close(self, rows):
+        self.file.seek(0)
+        self.file.write(npyHeader(rows, self.columns))
+        self.file.close()
+
+    @staticmethod
+    def load(path, columns, rows = None):
+        #Trust the sidecar row count, the header is only final after a clean close
+        data = np.memmap(path, dtype = "<f8", mode = "r", offset = NPY_HEADER_LEN)
+        if rows is None:
+            rows = len(data) // len(columns)
+        return data[:rows * len(columns)].reshape(rows, len(columns))
+
+BACKENDS = {"csv": CSVBackend, "npy": NPYBackend}
+
+class Recorder:
+    def __init__(self, directory, testName, testType, backend = "csv", metadata = None, resume = None):
+        if resume is not None:
+            self.info = resume
+            self.path = os.path.join(directory, resume["dataFile"])
+        else:
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            os.makedirs(directory, exist_ok = True)
+            baseName = reserveName(directory, (testName or "run") + "_" + stamp)
+            self.info = {
+                "testName": testName,
+                "testType": testType,
+                "backend": backend,
+                "columns": columnsFor(testType),
+                "dataFile": baseName + BACKENDS[backend].extension,
+                "started": stamp,
+                "status": "running",
+                "rows": 0,
+            }
+            self.info.update(metadata or {})
+            self.path = os.path.join(directory, self.info["dataFile"])
+
+        self.directory = directory
+        self.sidecar = sidecarPath(self.path)
+        self.rows = self.info["rows"]
+        self.lastSync = time.monotonic()
+
+        backendClass = BACKENDS[self.info["backend"]]
+        self.backend = backendClass(self.path, self.info["columns"], append = resume is not None)
+        self.writeSidecar()
+
+    def write(self, rows):
+        if len(rows) == 0:
+            return
+        self.backend.write(rows)
+        self.rows += len(rows)
+        if time.monotonic() - self.lastSync > FSYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        self.backend.file.flush()
+        os.fsync(self.backend.file.fileno())
+        self.lastSync = time.monotonic()
+        #Only claim rows in the sidecar once they are durable
+        self.info["rows"] = self.rows
+        self.writeSidecar()
+
+    def writeSidecar(self):
+        temp = self.sidecar + ".tmp"
+        with open(temp, "w") as file:
+            json.dump(self.info, file, indent = 1)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.sidecar)
+
+    def close(self, status = "complete"):
+        self.sync()
+        self.backend.close(self.rows)
+        self.info["status"] = status
+        self.writeSidecar()
+
+    def exportTo(self, directory):
+        #Data is already on disk, saving is just a copy of the run files
+        if os.path.abspath(directory) == os.path.abspath(self.directory):
+            return self.path
+        os.makedirs(directory, exist_ok = True)
+        for path in (self.path, self.sidecar):
+            shutil.copy2(path, directory)
+        return os.path.join(directory, os.path.basename(self.path))
+
+def readSidecar(path):
+    with open(sidecarPath(path)) as file:
+        return json.load(file)
+
+def loadRun(path):
+    """Return (info, data) for a recorded run given its data file or sidecar."""
+    info = readSidecar(path)
+    dataPath = os.path.join(os.path.dirname(sidecarPath(path)), info["dataFile"])
+    if info["backend"] == "npy":
+        data = NPYBackend.load(dataPath, info["columns"], info["rows"])
+    else:
+        data = CSVBackend.load(dataPath, info["columns"], info["rows"])
+    return info, data
+
+def resumeRecorder(path, rowMultiple = 1):
+    """Reopen an interrupted run for appending. Rows past the last fsync, or
+    past the last whole multiple of rowMultiple (one Vg curve), are dropped so
+    the sweep can restart cleanly from info["rows"]."""
+    info = readSidecar(path)
+    info["rows"] -= info["rows"] % rowMultiple
+    info["status"] = "running"
+    directory = os.path.dirname(sidecarPath(path))
+    dataPath = os.path.join(directory, info["dataFile"])
+
+    BACKENDS[info["backend"]].truncate(dataPath, info["rows"], info["columns"])
+    return Recorder(directory, info["testName"], info["testType"], resume = info)
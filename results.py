@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Array-backed measurement results.
+
+A ResultStore keeps every reading of a run in one preallocated, growable
+NumPy structured array, 41 bytes per reading:
+
+    Vg, Vd, Id, Ig, t   float64
+    status              uint8, STATUS_OK or STATUS_INVALID
+
+Worker rows are mapped onto these fields as they arrive. Diode rows fill Vd
+and Id with Vg = 0 and Ig = NaN; multi-SMU rows keep the station index in Vg,
+the same key column LivePlot groups curves by. Curves are recorded as
+contiguous spans, so curve(key) and column(name) are views into the store,
+not copies, and the plot can show them without keeping its own data.
+
+Past ramBudget bytes the array moves to a memory-mapped file and keeps
+growing there.
+
+The store is the GUI's copy of a run. Writers do not read from it: the
+Recorder is handed the worker's rows on the worker thread, already float64
+in its own column layout, and writes them without a copy (NPYBackend) or
+formats them straight from them (CSVBackend). Going through the store would
+add a copy into the structured array and another back out of it, and would
+put disk writes behind the Tk thread.
+"""
+import os
+import tempfile
+import numpy as np
+
+RESULT_DTYPE = np.dtype([("Vg", "<f8"), ("Vd", "<f8"), ("Id", "<f8"), ("Ig", "<f8"), ("t", "<f8"), ("status", "u1")])
+
+STATUS_OK = 0
+#Reading came back NaN or inf
+STATUS_INVALID = 1
+
+RAM_BUDGET = 256 << 20
+
+#Worker row layouts by test type, field per column
+ROW_FIELDS = {
+    "diode": ("Vd", "Id", "t"),
+    "transistor": ("Vg", "Vd", "Id", "Ig", "t"),
+    "stations": ("Vg", "Vd", "Id", "t"),
+}
+
+class ResultStore:
+    def __init__(self, testType = "diode", capacity = 4096, ramBudget = RAM_BUDGET, spillDirectory = None):
+        self.testType = testType.lower()
+        self.fields = ROW_FIELDS.get(self.testType, ROW_FIELDS["diode"])
+        self.ramBudget = ramBudget
+        self.spillDirectory = spillDirectory
+        self.spillFiles = []
+        self.data = np.empty(capacity, dtype = RESULT_DTYPE)
+        self.n = 0
+        #Curve key -> list of [start, end) spans, usually just one
+        self.spans = {}
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def spilled(self):
+        return isinstance(self.data, np.memmap)
+
+    @property
+    def nbytes(self):
+        return self.n * RESULT_DTYPE.itemsize
+
+    def append(self, rows):
+        """Copy a chunk of worker rows in, return its (start, end) index range."""
+        rows = np.asarray(rows, dtype = float)
+        start, end = self.n, self.n + len(rows)
+        if end > len(self.data):
+            self.grow(end)
+        block = self.data[start:end]
+        if self.testType == "diode":
+            block["Vg"] = 0.0
+        if "Ig" not in self.fields:
+            block["Ig"] = np.nan
+        for column, field in enumerate(self.fields):
+            block[field] = rows[:, column]
+        block["status"] = np.where(np.isfinite(block["Id"]), STATUS_OK, STATUS_INVALID)
+        self.n = end
+        self.addSpans(block["Vg"], start)
+        return start, end
+
+    def addSpans(self, keys, offset):
+        #Split the chunk wherever the key changes and extend or open spans
+        breaks = np.flatnonzero(np.diff(keys)) + 1
+        for first, last in zip(np.concatenate(([0], breaks)), np.concatenate((breaks, [len(keys)]))):
+            spans = self.spans.setdefault(float(keys[first]), [])
+            if spans and spans[-1][1] == offset + first:
+                spans[-1][1] = offset + last
+            else:
+                spans.append([offset + first, offset + last])
+
+    def grow(self, needed):
+        capacity = max(needed, 2 * len(self.data))
+        if capacity * RESULT_DTYPE.itemsize > self.ramBudget:
+            grown = self.spillArray(capacity)
+        else:
+            grown = np.empty(capacity, dtype = RESULT_DTYPE)
+        grown[:self.n] = self.data[:self.n]
+        #Views handed out earlier keep the old array alive until they are dropped
+        self.data = grown
+
+    def spillArray(self, capacity):
+        handle, path = tempfile.mkstemp(prefix = "results-", suffix = ".dat", dir = self.spillDirectory)
+        os.close(handle)
+        #The previous spill file stays mapped for the copy, so removing it now is safe where the OS allows it
+        self.removeSpillFiles()
+        self.spillFiles.append(path)
+        return np.memmap(path, dtype = RESULT_DTYPE, mode = "w+", shape = (capacity,))
+
+    def view(self):
+        return self.data[:self.n]
+
+    def column(self, name):
+        return self.data[name][:self.n]
+
+    def keys(self):
+        return list(self.spans)
+
+    def curve(self, key):
+        """Readings of one curve (one Vg, or one station) in acquisition order.
+        A view when the curve was recorded in one piece, else a copy."""
+        spans = self.spans.get(float(key), [])
+        if len(spans) == 1:
+            start, end = spans[0]
+            return self.data[start:end]
+        if not spans:
+            return self.data[:0]
+        return np.concatenate([self.data[start:end] for start, end in spans])
+
+    def curves(self):
+        return {key: self.curve(key) for key in self.spans}
+
+    def asRows(self, start = 0, end = None):
+        """Plain float rows in the worker / recorder column layout."""
+        block = self.data[start:self.n if end is None else end]
+        return np.column_stack([block[field] for field in self.fields])
+
+    def removeSpillFiles(self):
+        #Open mappings stay readable after the file is removed, where the OS refuses it is retried later
+        kept = []
+        for path in self.spillFiles:
+            try:
+                os.remove(path)
+            except OSError:
+                kept.append(path)
+        self.spillFiles = kept
+
+    def close(self):
+        self.removeSpillFiles()
@@ -6,17 +6,71 @@ Created on Tue Mar 19 13:37:59 2024
 
 Must install pyvisa-py and pymeasure
 """
-from matplotlib.backends.backend_tkagg import (
-    FigureCanvasTkAgg, NavigationToolbar2Tk)
 import tkinter as tk
-import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
+from tkinter import filedialog
 
-from pymeasure.instruments.keithley import Keithley2450
-from pymeasure.instruments.keithley import Keithley2400
+import os
+import queue
+import threading
+import time
 
-import csv
-import numpy as np
+from connections import ConnectionManager
+from instrumentation import tracePath
+
+#numpy, matplotlib and the measurement modules are loaded after the window is up,
+#see loadModules. These names are filled in once loading finishes.
+np = None
+Figure = None
+FigureCanvasTkAgg = None
+SweepWorker = StationCoordinator = None
+Recorder = readSidecar = resumeRecorder = None
+LivePlot = previewGrid = strideKeepEnds = None
+predictRefinement = None
+ResultStore = None
+CurveAnalysis = None
+RunQueue = QueuedRun = None
+RunCatalog = curveLabel = None
+pointsPerCurve = checkOrder = None
+
+def loadModules():
+    #Runs on a background thread while the window is already showing
+    global np, Figure, SweepWorker, StationCoordinator, Recorder, readSidecar, resumeRecorder
+    global LivePlot, previewGrid, strideKeepEnds, predictRefinement, ResultStore, CurveAnalysis
+    global RunQueue, QueuedRun, RunCatalog, curveLabel, pointsPerCurve, checkOrder
+    import numpy
+    from matplotlib.figure import Figure as figure
+    from sweepengine import SweepWorker as sweepWorker
+    from coordinator import StationCoordinator as stationCoordinator
+    import recorder
+    import liveplot
+    import adaptive
+    import results
+    import analysis
+    import runqueue
+    import catalog
+    import sweepplan
+    np, Figure = numpy, figure
+    SweepWorker, StationCoordinator = sweepWorker, stationCoordinator
+    Recorder, readSidecar, resumeRecorder = recorder.Recorder, recorder.readSidecar, recorder.resumeRecorder
+    LivePlot, previewGrid, strideKeepEnds = liveplot.LivePlot, liveplot.previewGrid, liveplot.strideKeepEnds
+    predictRefinement = adaptive.predictRefinement
+    ResultStore = results.ResultStore
+    CurveAnalysis = analysis.CurveAnalysis
+    RunQueue, QueuedRun = runqueue.RunQueue, runqueue.QueuedRun
+    RunCatalog, curveLabel = catalog.RunCatalog, catalog.curveLabel
+    pointsPerCurve, checkOrder = sweepplan.pointsPerCurve, sweepplan.checkOrder
+
+    #Instrument drivers are only needed on first connect, warm them up while idle
+    try:
+        import pymeasure.instruments.keithley
+    except Exception:
+        pass
+
+def loadTkModules():
+    #The Tk canvas backend is imported on the Tk thread, it is quick once matplotlib is loaded
+    global FigureCanvasTkAgg
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg as canvas
+    FigureCanvasTkAgg = canvas
 
 #Setup fonts
 LARGE_FONT = ("Verdana", 12)
@@ -29,10 +83,39 @@ maxVgBound = 100
 minVdBound = 0
 maxVdBound = 100
 
+#Sweep queue polling, each tick handles messages for at most SWEEP_POLL_BUDGET seconds
+SWEEP_POLL_MS = 50
+SWEEP_POLL_BUDGET = 0.015
+
+CONNECTION_POLL_MS = 200
+
+#Quiet time after the last keystroke before the input preview redraws
+PREVIEW_DEBOUNCE_MS = 150
+
+#Every run streams here as it is measured, saving copies it to the chosen folder
+RUN_DIRECTORY = os.path.join(os.path.expanduser("~"), "SMU-IV-Curve", "runs")
+RECORD_BACKEND = {"diode": "csv", "transistor": "npy"}
+
+#Curve orders offered in the GUI, see sweepplan
+SWEEP_ORDERS = ("raster", "serpentine", "hysteresis", "minslew")
+DEFAULT_ORDER = "serpentine"
+
+#Vg curves the adaptive preview predicts before it thins them out
+PREVIEW_ADAPTIVE_CURVES = 25
+
+LOAD_POLL_MS = 20
+
+#Results browser, background catalog work is checked for this often
+BROWSER_POLL_MS = 50
+#Overlays with more curves than this go without a legend
+BROWSER_LEGEND_CURVES = 12
+
 #Initialize Tkinter GUI class
 class SMU_GUI(tk.Tk):
     def __init__(self, *args, **kwargs):
         tk.Tk.__init__(self, *args, **kwargs)
+        self.ready = False
+        self.loadError = None
         container = tk.Frame(self)
         container.grid(row = 0, column = 0, pady = 2)
        
@@ -46,10 +129,102 @@ class SMU_GUI(tk.Tk):
         self.frames[StartPage] = frame
         self.frames[RunInformation] = runFrame
         self.show_frame(StartPage)
+
+        self.sweepQueue = queue.Queue()
+        self.worker = None
+        self.busySessions = []
+
+        #Discovery and health checks run in the background, results arrive through pollConnections
+        self.connections = ConnectionManager()
+        self.connections.discover()
+        self.connections.startHealthChecks()
+        self.after(CONNECTION_POLL_MS, self.pollConnections)
+
+        self.loader = threading.Thread(target = self.loadInBackground, daemon = True)
+        self.loader.start()
+        self.after(LOAD_POLL_MS, self.finishLoading)
+
+    def loadInBackground(self):
+        try:
+            loadModules()
+        except Exception as e:
+            self.loadError = e
+
+    def finishLoading(self):
+        if self.loader.is_alive():
+            self.after(LOAD_POLL_MS, self.finishLoading)
+            return
+        if self.loadError is not None:
+            self.frames[StartPage].errorBox("Failed to load plotting / measurement modules: " + str(self.loadError))
+            return
+        loadTkModules()
+        for frame in self.frames.values():
+            frame.buildGraph()
+        self.ready = True
     def show_frame(self, cont):
         frame = self.frames[cont]
         frame.tkraise()
 
+    def sweepRunning(self):
+        return self.worker is not None and self.worker.is_alive()
+
+    def pollConnections(self):
+        startPage = self.frames[StartPage]
+        while True:
+            try:
+                kind, payload = self.connections.events.get_nowait()
+            except queue.Empty:
+                break
+            startPage.connectionEvent(kind, payload)
+        self.after(CONNECTION_POLL_MS, self.pollConnections)
+
+    def claimInstruments(self):
+        """Take every session for a sweep, keeping health checks and opens
+        off the instruments while it runs. All or none: False when one is
+        still busy with a reset or health check after a second."""
+        for session in self.connections.sessions.values():
+            if not session.busy.acquire(timeout = 1):
+                self.releaseInstruments()
+                return False
+            self.busySessions.append(session)
+        return True
+
+    def releaseInstruments(self):
+        #Never while a sweep is still using them
+        if self.sweepRunning():
+            return
+        for session in self.busySessions:
+            session.busy.release()
+        self.busySessions = []
+
+    def startSweep(self, worker):
+        #The instruments were claimed before the run's recorders were made, see StartPage.claimInstruments
+        self.worker = worker
+        worker.start()
+        self.after(SWEEP_POLL_MS, self.pollSweep)
+
+    def pollSweep(self):
+        #Drain worker messages without holding the event loop for longer than a frame
+        runFrame = self.frames[RunInformation]
+        start = time.perf_counter()
+        deadline = start + SWEEP_POLL_BUDGET
+        handled = 0
+        while time.perf_counter() < deadline:
+            try:
+                kind, payload = self.sweepQueue.get_nowait()
+            except queue.Empty:
+                break
+            runFrame.sweepMessage(kind, payload)
+            handled += 1
+        if handled:
+            self.worker.stats.addSpan("gui", start, time.perf_counter() - start, messages = handled)
+        runFrame.plot.update()
+
+        if self.sweepRunning() or not self.sweepQueue.empty():
+            self.after(SWEEP_POLL_MS, self.pollSweep)
+        else:
+            self.releaseInstruments()
+
 #Create landing page / Main page
 class StartPage(tk.Frame):
     def __init__(self, parent, controller):
@@ -58,12 +233,14 @@ class StartPage(tk.Frame):
        
         self.GRAPH_POINT_SIZE = 1
         self.connectedDevices = []
+        self.sessionResources = []
         self.testType = "Diode"
         self.connected = False
         
         self.device1 = None
         self.device2 = None
         
+        self.deviceLabels = []
         self.device1Options = ["Select Device 1"]
         self.device2Options = ["Select Device 2", "DC Power Supply"]
        
@@ -76,12 +253,19 @@ class StartPage(tk.Frame):
         self.connectK2400_menu = tk.Menu(self.menu)
        
         self.test_menu = tk.Menu(self.menu)
+        self.run_menu = tk.Menu(self.menu)
        
         self.menu.add_cascade(label="Connect to...", menu = self.device_menu)
         self.menu.add_cascade(label="Change Test", menu = self.test_menu)
+        self.menu.add_cascade(label="Runs", menu = self.run_menu)
         
         self.device_menu.add_cascade(label = "Keithely 2450", menu = self.connectK2450_menu)
         self.device_menu.add_cascade(label = "Keithely 2400", menu = self.connectK2400_menu)
+        self.discovered_menu = tk.Menu(self.device_menu)
+        self.device_menu.add_cascade(label = "Discovered Devices", menu = self.discovered_menu)
+        self.discovered_menu.add_command(label = "Searching...", state = tk.DISABLED)
+        self.simulated_menu = tk.Menu(self.device_menu)
+        self.device_menu.add_cascade(label = "Simulated", menu = self.simulated_menu)
 
         #K2450 Sub Menu Commands
         self.connectK2450_menu.add_command(label = "USB", command = lambda: self.connectUSB("K2450"))
@@ -92,8 +276,17 @@ class StartPage(tk.Frame):
         self.connectK2400_menu.add_command(label = "USB", command = lambda: self.connectUSB("K2400"))
         self.connectK2400_menu.add_command(label = "GPIB", command = lambda: self.connectGPIB("K2400"))
 
+        #Simulated SMUs, drain and gate share one transistor
+        for label, resource in (("Diode", "SIM::diode"), ("Resistor", "SIM::resistor"),
+                                ("Transistor Drain", "SIM::drain"), ("Transistor Gate", "SIM::gate")):
+            self.simulated_menu.add_command(label = label, command = lambda value = resource: self.controller.connections.openAsync(value, "K2450"))
+
         self.test_menu.add_command(label = "Diode", command = self.switchToDiode)
         self.test_menu.add_command(label = "Transistor", command = self.switchToTransistor)
+
+        self.run_menu.add_command(label = "Resume Interrupted Run...", command = self.resumeRun)
+        self.run_menu.add_command(label = "Diode Sweep on All Devices", command = self.runAllStations)
+        self.run_menu.add_command(label = "Browse Results...", command = self.openBrowser)
        
         #Titles and Trial Name Entry
         self.TestDiodeLabel = tk.Label(self, text = "Diode Testing", font = LARGE_FONT)
@@ -126,18 +319,18 @@ class StartPage(tk.Frame):
         self.VdStepUnitsLabel = tk.Label(self, text = "# Steps", font = R_FONT)
        
         self.VgMinSV = tk.StringVar()
-        self.VgMinSV.trace_add("write", self.updateGraph)
+        self.VgMinSV.trace_add("write", self.scheduleGraphUpdate)
         self.VgMaxSV = tk.StringVar()
-        self.VgMaxSV.trace_add("write", self.updateGraph)
+        self.VgMaxSV.trace_add("write", self.scheduleGraphUpdate)
         self.VgStepSV = tk.StringVar()
-        self.VgStepSV.trace_add("write", self.updateGraph)
+        self.VgStepSV.trace_add("write", self.scheduleGraphUpdate)
        
         self.VdMinSV = tk.StringVar()
-        self.VdMinSV.trace_add("write", self.updateGraph)
+        self.VdMinSV.trace_add("write", self.scheduleGraphUpdate)
         self.VdMaxSV = tk.StringVar()
-        self.VdMaxSV.trace_add("write", self.updateGraph)
+        self.VdMaxSV.trace_add("write", self.scheduleGraphUpdate)
         self.VdStepSV = tk.StringVar()
-        self.VdStepSV.trace_add("write", self.updateGraph)
+        self.VdStepSV.trace_add("write", self.scheduleGraphUpdate)
        
         #Gate Voltage settings
         self.VgMin = tk.Entry(self, textvariable=self.VgMinSV)
@@ -149,10 +342,28 @@ class StartPage(tk.Frame):
         self.VdMax = tk.Entry(self, textvariable=self.VdMaxSV)
         self.VdStep = tk.Entry(self, textvariable=self.VdStepSV)
        
+        #Adaptive mode uses the Vd step count as the point budget per curve
+        self.adaptiveVar = tk.BooleanVar(self, False)
+        self.adaptiveVar.trace_add("write", self.scheduleGraphUpdate)
+        self.AdaptiveCheck = tk.Checkbutton(self, text = "Adaptive", variable = self.adaptiveVar, font = R_FONT)
+
+        #Order the curves are measured in, the preview draws the path
+        self.orderVar = tk.StringVar(self, DEFAULT_ORDER)
+        self.orderVar.trace_add("write", self.scheduleGraphUpdate)
+        self.OrderLabel = tk.Label(self, text = "Order", font = R_FONT)
+        self.OrderMenu = tk.OptionMenu(self, self.orderVar, *SWEEP_ORDERS)
+
         #Run Buttons
         self.RunDiodeBtn = tk.Button(self, command = lambda: self.runTest("diode"), text = "Run Testing")
         self.RunTransistorBtn = tk.Button(self, command = lambda: self.runTest("transistor"), text = "Run Testing")
 
+        #Run Queue, measured back to back and saved while the next run measures
+        self.queuedRuns = []
+        self.AddQueueBtn = tk.Button(self, command = self.addToQueue, text = "Add to Queue")
+        self.RunQueueBtn = tk.Button(self, command = self.runQueue, text = "Run Queue")
+        self.ClearQueueBtn = tk.Button(self, command = self.clearQueue, text = "Clear Queue")
+        self.QueueList = tk.Listbox(self, height = 5, width = 90)
+
         #Formatting
         self.TestDiodeLabel.grid(row = 0, column = 1, sticky = 'nsew', columnspan = 7)
         self.TestNameLabel.grid(row = 1, column = 3, sticky = 'nsew')
@@ -181,17 +392,37 @@ class StartPage(tk.Frame):
         self.VdStepLabel.grid(row = 3, column = 5, sticky = "nsew")
         self.VdStepUnitsLabel.grid(row = 3, column = 7, sticky = "nsew")
         self.RunDiodeBtn.grid(row = 4, column = 5)
+        self.AdaptiveCheck.grid(row = 4, column = 3)
+        self.OrderLabel.grid(row = 4, column = 1, sticky = "nse")
+        self.OrderMenu.grid(row = 4, column = 2, sticky = "nsw")
+        self.AddQueueBtn.grid(row = 5, column = 1)
+        self.RunQueueBtn.grid(row = 5, column = 3)
+        self.ClearQueueBtn.grid(row = 5, column = 5)
+        self.QueueList.grid(row = 6, column = 0, columnspan = 8, pady = 5)
        
-        #Graphing of Input Curve
+        #Graphing of Input Curve, the figure itself is built by buildGraph once matplotlib has loaded
+        self.previewJob = None
+        self.GraphPlaceholder = tk.Label(self, text = "Loading...", font = R_FONT, width = 40, height = 15)
+        self.GraphPlaceholder.grid(row = 1, column = 8, rowspan = 3, padx = 30, pady = 20)
+
+    def buildGraph(self):
+        self.GraphPlaceholder.destroy()
         self.fig = Figure(figsize = (4, 3), dpi = 100, facecolor = "#F0F0F0", constrained_layout = True)
         self.ax = self.fig.add_subplot(111)
         self.box = self.ax.get_position()
         self.ax.set_xlabel("V", loc = 'right', fontsize = 8)
         self.ax.get_yaxis().set_visible(False)
         self.fig.tight_layout()
+        #One collection for the whole grid, updated in place on every preview
+        self.previewPoints = self.ax.scatter(np.empty(0), np.empty(0), s = self.GRAPH_POINT_SIZE,
+                                             c = np.empty(0), cmap = "viridis")
+        self.previewPath, = self.ax.plot([], [], linewidth = 0.5, color = "grey", alpha = 0.6)
+        #Where an adaptive sweep is expected to concentrate its points
+        self.refinePoints = self.ax.scatter(np.empty(0), np.empty(0), s = 4 * self.GRAPH_POINT_SIZE, c = "red", marker = "|")
         self.canvas = FigureCanvasTkAgg(self.fig, master = self)
         self.canvas.draw()
         self.canvas.get_tk_widget().grid(row = 1, column = 8, rowspan = 3, padx = 30, pady = 20)
+        self.scheduleGraphUpdate()
         
     def switchToTransistor(self):
         self.TestTransistorLabel.grid(row = 0, column = 1, sticky = 'nsew', columnspan = 7)
@@ -214,6 +445,7 @@ class StartPage(tk.Frame):
         self.selectDevice1.grid(row = 1, column = 6)
         self.selectDevice2.grid(row = 1, column = 7)
         self.testType = "Transistor"
+        self.scheduleGraphUpdate()
         
     def switchToDiode(self):
         self.TestDiodeLabel.grid(row = 0, column = 1, sticky = 'nsew', columnspan = 7)
@@ -232,72 +464,256 @@ class StartPage(tk.Frame):
             
             self.selectDevice2.grid_remove()
         self.testType = "Diode"
+        self.scheduleGraphUpdate()
        
-    def updateGraph(self, var, index, mode):
-        self.ax.cla()
+    def scheduleGraphUpdate(self, *args):
+        #Coalesce a burst of edits into one redraw once typing pauses
+        if self.previewJob is not None:
+            self.after_cancel(self.previewJob)
+        self.previewJob = self.after(PREVIEW_DEBOUNCE_MS, self.updateGraph)
+
+    def updateGraph(self, *args):
+        self.previewJob = None
+        if not self.controller.ready:
+            #buildGraph schedules the first preview
+            return
+        try:
+            self.VdPoints, self.VgPoints = self.readSweepPoints(self.testType)
+        except ValueError:
+            #Empty or half typed entry, keep the last preview
+            return
+
+        #Vg is Y Vd is X
+        offsets = previewGrid(self.VdPoints, self.VgPoints, order = self.orderVar.get())
+        self.previewPoints.set_offsets(offsets)
+        self.previewPoints.set_array(offsets[:, 1])
+        self.previewPath.set_data(offsets[:, 0], offsets[:, 1])
+        if self.adaptiveVar.get():
+            VgPoints = strideKeepEnds(self.VgPoints, int(np.ceil(len(self.VgPoints) / PREVIEW_ADAPTIVE_CURVES)))
+            self.refinePoints.set_offsets(predictRefinement(self.VdPoints, VgPoints, self.testType))
+        else:
+            self.refinePoints.set_offsets(np.empty((0, 2)))
+
         if(self.testType == "Diode"):
             self.ax.set_xlabel("V", loc = 'right', fontsize = 8)
-            if (self.VdMin.get() and self.VdMax.get() and self.VdStep.get()):
-                self.VdPoints = np.linspace(float(self.VdMin.get()), float(self.VdMax.get()), int(self.VdStep.get()))
-                self.VgPoints = [0]
-                #Vg is Y Vd is X            
-                #Generate point matrix
-                for point in self.VgPoints:
-                    self.yArray = np.ones((1, int(self.VdStep.get()))) * point
-                    self.ax.scatter(self.VdPoints, self.yArray, label = str(point), s = self.GRAPH_POINT_SIZE)
-                    
-                self.canvas.draw()
-                
+            self.ax.get_yaxis().set_visible(False)
         elif(self.testType == "Transistor"):
             self.ax.set_xlabel("Vd", loc = 'right', fontsize = 8)
             self.ax.set_ylabel("Vg", loc = 'top', fontsize = 8)
-       
-            if (self.VdMin.get() and self.VdMax.get() and self.VdStep.get() and self.VgMin.get() and self.VgMax.get() and self.VgStep.get()):
-                self.VdPoints = np.linspace(float(self.VdMin.get()), float(self.VdMax.get()), int(self.VdStep.get()))
-                self.VgPoints = np.linspace(float(self.VgMin.get()), float(self.VgMax.get()), int(self.VgStep.get()))
-               
-                #Vg is Y Vd is X            
-                #Generate point matrix
-                for point in self.VgPoints:
-                    self.yArray = np.ones((1, int(self.VdStep.get()))) * point
-                    self.ax.scatter(self.VdPoints, self.yArray, label = str(point), s = self.GRAPH_POINT_SIZE)
-                self.canvas.draw()
-               
+            self.ax.get_yaxis().set_visible(True)
+
+        if len(offsets):
+            low, high = offsets.min(axis = 0), offsets.max(axis = 0)
+            margin = np.maximum(0.05 * (high - low), 0.5)
+            self.ax.set_xlim(low[0] - margin[0], high[0] + margin[0])
+            self.ax.set_ylim(low[1] - margin[1], high[1] + margin[1])
+            self.previewPoints.set_clim(low[1], high[1])
+        self.canvas.draw_idle()
+
+    def readSweepPoints(self, testType):
+        #Raises ValueError for empty or unparsable entries
+        VdPoints = np.linspace(float(self.VdMin.get()), float(self.VdMax.get()), int(self.VdStep.get()))
+        if testType.lower() == "transistor":
+            VgPoints = np.linspace(float(self.VgMin.get()), float(self.VgMax.get()), int(self.VgStep.get()))
+        else:
+            VgPoints = np.array([0.0])
+        return VdPoints, VgPoints
+
+    def selectedDevice(self, var):
+        value = var.get()
+        if value in self.deviceLabels:
+            return self.connectedDevices[self.deviceLabels.index(value)]
+        return None
+
+    def stillLoading(self):
+        if not self.controller.ready:
+            self.errorBox("Still loading, try again in a moment")
+            return True
+        return False
+
     def runTest(self, testType):
+        if self.stillLoading():
+            return
         try:
+            if self.controller.sweepRunning():
+                self.errorBox("A sweep is already running")
+                return
             if self.connected:
-                self.smu = self.controller.smu
-                self.trigger = self.smu.trigger()
-               
-                self.smu.defbuffer1.clear()
-                self.smu.measure.func = self.smu.FUNC_DC_CURRENT
-                self.smu.source.fun = self.smu.FUNC_DC_VOLTAGE
-               
-                self.smu.measure.sense = self.smu.SENSE_4WIRE
-                self.smu.measure.autorange = self.smu.ON
-                self.smu.measure.np1c = 1
-               
-                self.smu.source.highc = self.smu.OFF
-                self.smu.source.range = 2
-                self.smu.source.ilimit.level = 1
-                self.smu.source.sweeplinear("diode", self.controller.VgMin.get(), self.controller.VgMax.get(), self.controller.VgSteps.get(), 0.1)
-               
-                self.trigger.initiate()
-                self.trigger.waitcomplete()
-               
-                self.data = []
-                if self.smu.defbuffer1.n == 0:
-                    self.errorBox("Buffer is empty")
-                else:
-                    for i in range(1, self.defbuffer1.n + 1):
-                        self.data.append([
-                            self.defbuffer1.sourcevalues[i],
-                            self.defbuffer1.readings[i],
-                            self.defbuffer1.relativetimestamps[i]])
-                self.smu.shutdown()
-
-                self.controller.show_frame(RunInformation)
+                self.smu = self.selectedDevice(self.device1)
+                if self.smu is None:
+                    self.smu = self.connectedDevices[-1]
+                gate = self.selectedDevice(self.device2)
+
+                self.VdPoints, self.VgPoints = self.readSweepPoints(testType)
+                #Before the recorder, a run that cannot start leaves no files behind
+                checkOrder(self.orderVar.get(), self.adaptiveVar.get())
+                if not self.claimInstruments():
+                    return
+                recorder = Recorder(RUN_DIRECTORY, self.TestName.get(), testType,
+                                    backend = RECORD_BACKEND[testType.lower()],
+                                    metadata = {"VdPoints": self.VdPoints.tolist(),
+                                                "VgPoints": self.VgPoints.tolist(),
+                                                "device1": self.device1.get(),
+                                                "device2": self.device2.get(),
+                                                "adaptive": self.adaptiveVar.get(),
+                                                "order": self.orderVar.get()})
+                worker = SweepWorker(self.controller.sweepQueue, self.smu, testType,
+                                     self.VdPoints, self.VgPoints, gate = gate, recorder = recorder,
+                                     adaptive = self.adaptiveVar.get(), order = self.orderVar.get())
+                self.startWorker(worker, self.TestName.get(), testType, [recorder])
+        except Exception as e:
+            self.controller.releaseInstruments()
+            self.errorBox(e)
+
+    def runAllStations(self):
+        #Same diode sweep on every connected SMU at once, one DUT per SMU
+        if self.stillLoading():
+            return
+        try:
+            if self.controller.sweepRunning():
+                self.errorBox("A sweep is already running")
+                return
+            stations = [(label, smu) for label, smu in zip(self.deviceLabels, self.connectedDevices) if smu is not None]
+            if not stations:
+                self.errorBox("Connect to at least one device first")
+                return
+
+            VdPoints, VgPoints = self.readSweepPoints("diode")
+            testName = self.TestName.get()
+            if not self.claimInstruments():
+                return
+            recorders = [Recorder(RUN_DIRECTORY, "%s_SMU%d" % (testName, station), "diode",
+                                  backend = RECORD_BACKEND["diode"],
+                                  metadata = {"VdPoints": VdPoints.tolist(), "device1": label,
+                                              "order": self.orderVar.get()})
+                         for station, (label, smu) in enumerate(stations)]
+            worker = StationCoordinator(self.controller.sweepQueue, [smu for label, smu in stations],
+                                        VdPoints, recorders = recorders, order = self.orderVar.get())
+            self.startWorker(worker, testName, "stations", recorders)
+        except Exception as e:
+            self.controller.releaseInstruments()
+            self.errorBox(e)
+
+    def openBrowser(self):
+        if self.stillLoading():
+            return
+        try:
+            os.makedirs(RUN_DIRECTORY, exist_ok = True)
+            ResultsBrowser(self, RUN_DIRECTORY)
+        except Exception as e:
+            self.errorBox(e)
+
+    def addToQueue(self):
+        if self.stillLoading():
+            return
+        try:
+            if not self.connected:
+                self.errorBox("Connect to a device before queueing a run")
+                return
+            smu = self.selectedDevice(self.device1)
+            if smu is None:
+                smu = self.connectedDevices[-1]
+            VdPoints, VgPoints = self.readSweepPoints(self.testType)
+            checkOrder(self.orderVar.get(), self.adaptiveVar.get())
+            name = self.TestName.get() or "%s_run%d" % (self.testType.lower(), len(self.queuedRuns) + 1)
+            run = QueuedRun(name, self.testType, VdPoints, VgPoints, smu, gate = self.selectedDevice(self.device2),
+                            adaptive = self.adaptiveVar.get(), device1 = self.device1.get(), device2 = self.device2.get(),
+                            order = self.orderVar.get())
+            self.queuedRuns.append(run)
+            self.QueueList.insert(tk.END, run.describe())
+        except Exception as e:
+            self.errorBox(e)
+
+    def clearQueue(self):
+        self.queuedRuns = []
+        self.QueueList.delete(0, tk.END)
+
+    def runQueue(self):
+        if self.stillLoading():
+            return
+        try:
+            if self.controller.sweepRunning():
+                self.errorBox("A sweep is already running")
+                return
+            if not self.queuedRuns:
+                self.errorBox("Add runs to the queue first")
+                return
+            #Asked once up front, every run is saved there as soon as it finishes
+            saveLocation = filedialog.askdirectory(initialdir = '/', title = 'Select Save Directory')
+            if not saveLocation:
+                return
+            if not self.claimInstruments():
+                return
+            runQueue = RunQueue(self.controller.sweepQueue, self.queuedRuns, saveLocation, RUN_DIRECTORY, RECORD_BACKEND)
+            self.addResetSpans(runQueue)
+            self.controller.frames[RunInformation].queueStarted(runQueue)
+            self.controller.startSweep(runQueue)
+            self.controller.show_frame(RunInformation)
+            self.clearQueue()
+        except Exception as e:
+            self.controller.releaseInstruments()
+            self.errorBox(e)
+
+    def claimInstruments(self):
+        #Before a run creates any files, a run that cannot have its instruments leaves nothing behind
+        if self.controller.claimInstruments():
+            return True
+        self.errorBox("An instrument is busy (reset or health check), try again in a moment")
+        return False
+
+    def addResetSpans(self, worker):
+        #Resets since the last run belong to this run's timings
+        for session in self.controller.connections.sessions.values():
+            if session.prepared is not None:
+                worker.stats.addSpan("reset", *session.prepared, thread = "connect", resource = session.resource)
+                session.prepared = None
+
+    def startWorker(self, worker, testName, testType, recorders):
+        self.addResetSpans(worker)
+        self.controller.frames[RunInformation].sweepStarted(testName, testType, worker, recorders)
+        self.controller.startSweep(worker)
+        self.controller.show_frame(RunInformation)
+
+    def resumeRun(self):
+        if self.stillLoading():
+            return
+        try:
+            if self.controller.sweepRunning():
+                self.errorBox("A sweep is already running")
+                return
+            if not self.connected:
+                self.errorBox("Connect to a device before resuming a run")
+                return
+            path = filedialog.askopenfilename(initialdir = RUN_DIRECTORY, title = 'Select Run File',
+                                              filetypes = [("Run files", "*.run.json")])
+            if not path:
+                return
+            info = readSidecar(path)
+            if info["status"] == "complete":
+                self.errorBox("That run already finished")
+                return
+            if info.get("adaptive"):
+                self.errorBox("Adaptive runs cannot be resumed, their points depend on the whole curve")
+                return
+
+            #Transistor runs restart at the first Vg curve that was not fully recorded
+            VdPoints = np.array(info["VdPoints"])
+            VgPoints = np.array(info["VgPoints"])
+            order = info.get("order", "raster")
+            rowMultiple = pointsPerCurve(len(VdPoints), order) if info["testType"].lower() == "transistor" else 1
+            if not self.claimInstruments():
+                return
+            recorder = resumeRecorder(path, rowMultiple)
+
+            self.smu = self.selectedDevice(self.device1)
+            if self.smu is None:
+                self.smu = self.connectedDevices[-1]
+            worker = SweepWorker(self.controller.sweepQueue, self.smu, info["testType"], VdPoints, VgPoints,
+                                 gate = self.selectedDevice(self.device2), recorder = recorder, skip = recorder.rows,
+                                 order = order)
+            self.startWorker(worker, info["testName"], info["testType"], [recorder])
         except Exception as e:
+            self.controller.releaseInstruments()
             self.errorBox(e)
             
     def errorBox(self, errorMsg):
@@ -324,59 +740,72 @@ class StartPage(tk.Frame):
        
     def connectIP(self, deviceName):
         IPV4 = "TCPIP::" + self.IPEntry.get() + "::INSTR"
-        try:
-            if(deviceName == "K2450"):
-                self.connectedDevices.append(Keithley2450(IPV4))
-                self.device1Options.append("Keithley2450")
-                self.selectDevice1["menu"].add_command(label = self.device1Options[-1], command=lambda value=self.device1Options[-1]: self.device1.set(value))
-                self.connectedDevice()
-               
-            elif(deviceName == "K2400"):
-                self.connectedDevices.append(Keithley2400(IPV4))
-                self.device1Options.append("Keithley2400")
-                self.selectDevice1["menu"].add_command(label = self.device1Options[-1], command=lambda value=self.device1Options[-1]: self.device1.set(value))
-                self.connectedDevice()
-
-        except Exception as e:
-            self.ipConnected = False
-            self.errorBox(e)
+        self.window.destroy()
+        self.controller.connections.openAsync(IPV4, deviceName)
 
     def connectUSB(self, deviceName):
-        self.connectedDevices.append(None)
-        #self.connectedDevice()
-        self.connected = True
         #USB0::0x05e6::0x2450::[serial number]::INSTR
-        return(None)
+        productID = "0X" + deviceName[1:]
+        for resource, idn in self.controller.connections.resources:
+            if resource.upper().startswith("USB") and productID in resource.upper():
+                self.controller.connections.openAsync(resource, deviceName)
+                return
+        self.errorBox("No USB " + deviceName + " found, check the cable or try again once discovery finishes")
     
     def connectGPIB(self, deviceName):
         GPIB = "GPIB::1"
-        try:
-            if(deviceName == "K2450"):
-                self.connectedDevices.append(Keithley2450(GPIB))
-                self.device1Options.append("Keithley2450")
-                self.selectDevice1["menu"].add_command(label = self.device1Options[-1], command=lambda value=self.device1Options[-1]: self.device1.set(value))
-                self.connectedDevice()
-               
-            elif(deviceName == "K2400"):
-                self.connectedDevices.append(Keithley2400(GPIB))
-                self.device1Options.append("Keithley2400")
-                self.selectDevice1["menu"].add_command(label = self.device1Options[-1], command=lambda value=self.device1Options[-1]: self.device1.set(value))
-                self.connectedDevice()
-                
-        except Exception as e:
-            self.ipConnected = False
-            self.errorBox(e)
-    def connectedDevice(self):
+        self.controller.connections.openAsync(GPIB, deviceName)
+
+    def updateDiscovered(self, resources):
+        self.discovered_menu.delete(0, "end")
+        for resource, idn in resources:
+            label = resource + ("  (" + idn.split(",")[1].strip() + ")" if idn.count(",") >= 1 else "")
+            self.discovered_menu.add_command(label = label, command = lambda value = resource: self.controller.connections.openAsync(value))
+        if not resources:
+            self.discovered_menu.add_command(label = "No instruments found", state = tk.DISABLED)
+        self.discovered_menu.add_separator()
+        self.discovered_menu.add_command(label = "Refresh", command = self.controller.connections.discover)
+
+    def connectionEvent(self, kind, payload):
+        if kind == "opened":
+            session = payload
+            if session.resource in self.sessionResources:
+                #Pooled session handed back, keep its dropdown entry
+                self.connectedDevices[self.sessionResources.index(session.resource)] = session.instrument
+            else:
+                self.connectedDevices.append(session.instrument)
+                self.sessionResources.append(session.resource)
+                self.addDeviceOption("Keithley" + session.model[1:])
+            self.connectedDevice(session)
+        elif kind == "openFailed":
+            resource, error = payload
+            self.errorBox(resource + ": " + str(error))
+        elif kind == "resources":
+            self.updateDiscovered(payload)
+        elif kind == "discoverFailed":
+            self.updateDiscovered([])
+        elif kind == "lost":
+            self.menu.entryconfigure(1, label = "⚠ Lost " + payload.resource)
+        elif kind == "reconnected":
+            session = payload
+            if session.resource in self.sessionResources:
+                self.connectedDevices[self.sessionResources.index(session.resource)] = session.instrument
+            self.connectedDevice(session)
+
+    def addDeviceOption(self, deviceName):
+        #Number the label so two of the same model can be told apart
+        label = deviceName + " #" + str(len(self.connectedDevices))
+        self.deviceLabels.append(label)
+        self.device1Options.append(label)
+        self.device2Options.append(label)
+        self.selectDevice1["menu"].add_command(label = label, command=lambda value=label: self.device1.set(value))
+        self.selectDevice2["menu"].add_command(label = label, command=lambda value=label: self.device2.set(value))
+
+    def connectedDevice(self, session):
+        #Sessions arrive already prepared, ConnectionManager resets them on its own threads
         self.menu.entryconfigure(1, label = "✔" + str(len(self.connectedDevices)) + "Connected")
-        #Initialize SMU parameters
-        try:
-            self.connectedDevices[-1].reset()
-            self.connectedDevices[-1].use_front_terminals()
-            self.connected = True
+        self.connected = True
 
-        except Exception as e:
-            self.ipConnected = False
-            self.errorBox(e)
 class RunInformation(tk.Frame):
     def __init__(self, parent, controller):
         self.controller = controller
@@ -385,69 +814,211 @@ class RunInformation(tk.Frame):
         #Bind to runSMU when the frame is shown so it doesn't look for nonexistent information
        
         #Control Buttons
-        self.SaveALLBtn = tk.Button(self, text = "Quit and Save All")
+        self.SaveALLBtn = tk.Button(self, command = self.saveAll, text = "Quit and Save All")
         self.SaveRAWBtn = tk.Button(self, command = self.saveRaw, text = "Quit and Save Raw Data")
         self.QuitBtn = tk.Button(self, command = self.quitConformation, text = "Quit Without Saving")
+        self.PauseBtn = tk.Button(self, command = self.togglePause, text = "Pause", state = tk.DISABLED)
+        self.CancelBtn = tk.Button(self, command = self.cancelSweep, text = "Cancel Sweep", state = tk.DISABLED)
+        self.StatusLabel = tk.Label(self, text = "Idle", font = R_FONT)
+        self.AnalysisLabel = tk.Label(self, text = "", font = R_FONT, justify = tk.LEFT)
+        self.StatsLabel = tk.Label(self, text = "", font = ("Courier", 8), justify = tk.LEFT)
+        self.QueueLogLabel = tk.Label(self, text = "", font = ("Courier", 8), justify = tk.LEFT)
 
+       
+        #Formatting
+        self.SaveALLBtn.place(x = 220, y = 50)
+        self.SaveRAWBtn.place(x = 200, y = 150)
+        self.QuitBtn.place(x = 210, y = 250)
+        self.PauseBtn.place(x = 20, y = 330)
+        self.CancelBtn.place(x = 100, y = 330)
+        self.StatusLabel.place(x = 20, y = 370)
+        self.AnalysisLabel.place(x = 20, y = 400)
+        self.StatsLabel.place(x = 260, y = 400)
+        self.QueueLogLabel.place(x = 500, y = 380)
+        self.results = None
+        self.analysis = None
+        self.worker = None
+        self.runStats = None
+        self.runQueue = None
+        self.runIndex = None
+        self.queueLog = []
+        self.recorders = []
+        self.plot = None
+
+    def buildGraph(self):
         #Graphing of Input Curve
         self.fig = Figure(figsize = (5, 3.5), dpi = 100, facecolor = "#F0F0F0", constrained_layout = True)
-        self.t = np.arange(0, 100, .01)
         self.ax = self.fig.add_subplot(111)
-        self.line, = self.ax.plot(self.t, 2 * np.sin(2 * self.t))
         self.ax.set_xlabel("Vds", loc = 'right', fontsize = 8)
         self.ax.set_ylabel("Id", loc = 'top', fontsize = 8)
         self.canvas = FigureCanvasTkAgg(self.fig, master = self)
+        self.plot = LivePlot(self.fig, self.ax, self.canvas)
         self.canvas.draw()
-       
-        #Formatting
-        self.SaveALLBtn.place(x = 220, y = 50)
-        self.SaveRAWBtn.place(x = 200, y = 150)
-        self.QuitBtn.place(x = 210, y = 250)
         self.canvas.get_tk_widget().place(x = 500, y = 20)
-        self.IV_curve_data = []
-        
-        '''
-        for Vg in self.controller.VgPoints:
-            self.smu.source_voltage = Vg
-            Vd_Id_data = []
-           
-            for Vd in self.controller.VdPoints:
-                self.smu.source_voltage = Vd
-                Id = self.smu.current
-                Vd_Id_data.append((Vd, Id))
-            self.IV_curve_data.append((Vg, Vd_Id_data))
+    def sweepStarted(self, testName, testType, worker, recorders):
+        self.worker = worker
+        self.runQueue = None
+        self.QueueLogLabel.config(text = "")
+        self.runStarted(testName, testType, worker, recorders)
+        self.PauseBtn.config(text = "Pause", state = tk.NORMAL)
+        self.CancelBtn.config(state = tk.NORMAL)
+        self.StatusLabel.config(text = "Starting " + testType + " sweep")
 
-        self.smu.shutdown()
-        '''
-    def runSMU(self):
-        print("Running Transistor")
-        device1 = self.controller.device1
-        print(device1)
-        '''
-        '''
-    def saveCSV(self, saveLocation):
-        csv_filename = saveLocation + self.TestName + "measurement_data.csv"
+    def queueStarted(self, runQueue):
+        self.worker = runQueue
+        self.runQueue = runQueue
+        self.runIndex = None
+        self.recorders = []
+        self.queueLog = []
+        self.QueueLogLabel.config(text = "")
+        self.PauseBtn.config(text = "Pause", state = tk.NORMAL)
+        self.CancelBtn.config(state = tk.NORMAL)
+        self.StatusLabel.config(text = "Starting queue of %d runs" % len(runQueue.runs))
+
+    def runStarted(self, testName, testType, worker, recorders):
+        #One run of a sweep or queue, the plot and analysis start over
+        self.TestName = testName
+        self.testType = testType
+        self.runStats = worker.stats
+        self.recorders = recorders
+        if self.results is not None:
+            self.results.close()
+        self.results = ResultStore(testType)
+        self.analysis = CurveAnalysis(testType, getattr(worker, "VdPoints", None))
+        self.AnalysisLabel.config(text = "")
+        self.StatsLabel.config(text = "")
+        self.plot.stats = worker.stats
+        #Multi-SMU rows interleave stations, those curves keep their own copy in the plot
+        self.plot.reset(testType, markers = getattr(worker, "adaptive", False),
+                        store = self.results if testType.lower() != "stations" else None)
+        self.ax.set_xlabel("Vds" if testType.lower() == "transistor" else "V", loc = 'right', fontsize = 8)
+
+    def finishRun(self):
+        self.plot.update(force = True)
+        self.AnalysisLabel.config(text = self.analysis.summary())
+        self.StatsLabel.config(text = self.runStats.summaryText())
+
+    def runLabel(self):
+        if self.runQueue is None or self.runIndex is None:
+            return ""
+        return "Run %d/%d: " % (self.runIndex + 1, len(self.runQueue.runs))
+
+    def logQueue(self, text):
+        self.queueLog.append(text)
+        self.QueueLogLabel.config(text = "\n".join(self.queueLog[-8:]))
+
+    def sweepMessage(self, kind, payload):
+        if kind == "data":
+            self.results.append(payload)
+            self.analysis.update(payload)
+            self.plot.append(payload)
+        elif kind == "progress":
+            done, total = payload
+            self.StatusLabel.config(text = self.runLabel() + "%d / %d points (%.0f%%)" % (done, total, 100 * done / max(total, 1)))
+            self.StatsLabel.config(text = self.runStats.summaryText())
+        elif kind == "runStarted":
+            index, run, worker, recorder = payload
+            self.runIndex = index
+            self.runStarted(run.name, run.testType, worker, [recorder])
+            self.StatusLabel.config(text = self.runLabel() + run.name)
+        elif kind == "runFinished":
+            index, outcome, error = payload
+            name = self.runQueue.runs[index].name
+            if index != self.runIndex:
+                #Failed before measuring anything
+                self.logQueue("%s: failed, %s" % (name, error))
+                return
+            self.finishRun()
+            #The figure belongs to the Tk thread, so the graph is saved here rather than by the saver
+            try:
+                graphFile = os.path.splitext(os.path.basename(self.recorders[0].path))[0] + "_graph.png"
+                self.plot.savefig(os.path.join(self.runQueue.saveLocation, graphFile))
+            except Exception as e:
+                self.logQueue("%s: graph not saved, %s" % (name, e))
+            if outcome == "error":
+                self.logQueue("%s: failed after %d points, %s" % (name, len(self.results), error))
+            else:
+                self.logQueue("%s: %s, %d points" % (name, outcome, len(self.results)))
+        elif kind == "runSaved":
+            index, path, summary = payload
+            name = self.runQueue.runs[index].name
+            if path is None:
+                self.logQueue("%s: saving failed, %s" % (name, summary))
+            else:
+                self.logQueue("%s: saved to %s" % (name, path))
+        elif kind in ("done", "cancelled", "error") and self.runQueue is not None:
+            #Every run was finished and saved as it came in
+            self.PauseBtn.config(state = tk.DISABLED)
+            self.CancelBtn.config(state = tk.DISABLED)
+            if kind == "done":
+                self.StatusLabel.config(text = "Queue complete, %d runs saved to %s" % (len(self.runQueue.runs), self.runQueue.saveLocation))
+            else:
+                self.StatusLabel.config(text = "Queue cancelled, finished runs are saved")
+        elif kind in ("done", "cancelled", "error"):
+            self.finishRun()
+            if self.recorders:
+                self.worker.stats.write(tracePath(self.recorders[0].path))
+            self.PauseBtn.config(state = tk.DISABLED)
+            self.CancelBtn.config(state = tk.DISABLED)
+            if kind == "done":
+                self.StatusLabel.config(text = "Sweep complete, %d points" % len(self.results))
+            elif kind == "cancelled":
+                self.StatusLabel.config(text = "Sweep cancelled, %d points kept" % len(self.results))
+            else:
+                self.StatusLabel.config(text = "Sweep failed")
+                self.errorBox(payload)
+
+    def togglePause(self):
+        if self.worker.paused:
+            self.worker.resume()
+            self.PauseBtn.config(text = "Pause")
+        else:
+            self.worker.pause()
+            self.PauseBtn.config(text = "Resume")
+            self.StatusLabel.config(text = "Paused")
+
+    def cancelSweep(self):
+        self.worker.cancel()
+        self.StatusLabel.config(text = "Cancelling...")
+    def saveData(self, saveLocation):
+        #The recorder has been streaming the run to disk, saving just copies its files
+        if self.worker is not None and self.worker.is_alive():
+            raise RuntimeError("Wait for the sweep to finish or cancel it before saving")
+        if not self.recorders:
+            raise RuntimeError("No run data to save")
+        dataFile = [recorder.exportTo(saveLocation) for recorder in self.recorders][0]
+        if self.analysis is not None:
+            self.analysis.write(dataFile)
+        if self.worker is not None:
+            self.worker.stats.write(tracePath(dataFile))
+        return dataFile
 
-        with open(csv_filename, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(["Voltage (V)", "Current (A)"])
-            writer.writerows(self.data)
     def saveAll(self):
         saveLocation = self.selectSaveLocation()
-       
-        #Graph Saving
-        graphFileName = saveLocation + self.TestName + "graph.png"
-        self.fig.savefig(graphFileName)
-        self.saveCSV(self.saveLocation)
+        if not saveLocation:
+            return
+        try:
+            dataFile = self.saveData(saveLocation)
+            #Graph Saving
+            self.plot.savefig(os.path.splitext(dataFile)[0] + "_graph.png")
+        except Exception as e:
+            self.errorBox(e)
+            return
         self.quitConformation("All data has been saved, are you sure you want to quit?")
        
     def saveRaw(self):
         saveLocation = self.selectSaveLocation()
-        self.saveCSV(saveLocation)
+        if not saveLocation:
+            return
+        try:
+            self.saveData(saveLocation)
+        except Exception as e:
+            self.errorBox(e)
+            return
         self.quitConformation("Are you sure you want to quit without saving the graph?")
        
     def selectSaveLocation(self):
-        saveLocation = tk.filedialog.askdirectory(initialdir = '/', title = 'Select Save Directory')
+        saveLocation = filedialog.askdirectory(initialdir = '/', title = 'Select Save Directory')
         return saveLocation
     def quitConformation(self, quitText = ""):
         window = tk.Toplevel()
@@ -476,5 +1047,192 @@ class RunInformation(tk.Frame):
         label.grid(row = 0, column = 0)
         button_close.grid(row = 1, column = 0, sticky = "nsew")
         
-app = SMU_GUI()
-app.mainloop()
+class ResultsBrowser(tk.Toplevel):
+    """Search a directory of saved runs and overlay them. Indexing and loading
+    run on a background thread, see catalog.RunCatalog."""
+    def __init__(self, parent, directory):
+        tk.Toplevel.__init__(self, parent)
+        self.title("Results Browser")
+        self.catalog = None
+        self.entries = []
+        self.tasks = queue.Queue()
+        #busy and closed decide who closes the catalog, the window or the job still using it
+        self.lock = threading.Lock()
+        self.busy = False
+        self.closed = False
+
+        self.DirectoryLabel = tk.Label(self, text = "", font = R_FONT, anchor = "w")
+        self.ChangeDirBtn = tk.Button(self, command = self.changeDirectory, text = "Change Folder...")
+        self.RefreshBtn = tk.Button(self, command = self.refresh, text = "Refresh")
+
+        #Filters, dates as YYYYMMDD
+        self.NameFilter = tk.Entry(self, width = 14)
+        self.typeVar = tk.StringVar(self, "All")
+        self.TypeFilter = tk.OptionMenu(self, self.typeVar, "All", "diode", "transistor")
+        self.SinceFilter = tk.Entry(self, width = 10)
+        self.UntilFilter = tk.Entry(self, width = 10)
+        self.VdLowFilter = tk.Entry(self, width = 6)
+        self.VdHighFilter = tk.Entry(self, width = 6)
+        self.SearchBtn = tk.Button(self, command = self.search, text = "Search")
+
+        self.RunList = tk.Listbox(self, selectmode = tk.EXTENDED, width = 70, height = 22, font = ("Courier", 8))
+        self.RunScroll = tk.Scrollbar(self, command = self.RunList.yview)
+        self.RunList.config(yscrollcommand = self.RunScroll.set)
+        self.OverlayBtn = tk.Button(self, command = self.overlaySelected, text = "Overlay Selected")
+        self.StatusLabel = tk.Label(self, text = "", font = R_FONT, anchor = "w")
+
+        self.fig = Figure(figsize = (6, 4.5), dpi = 100, facecolor = "#F0F0F0", constrained_layout = True)
+        self.ax = self.fig.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.fig, master = self)
+
+        #Formatting
+        self.DirectoryLabel.grid(row = 0, column = 0, columnspan = 10, sticky = "nsew")
+        self.ChangeDirBtn.grid(row = 0, column = 10)
+        self.RefreshBtn.grid(row = 0, column = 11)
+        for column, (text, widget) in enumerate((("Name", self.NameFilter), ("Type", self.TypeFilter),
+                                                 ("From", self.SinceFilter), ("To", self.UntilFilter),
+                                                 ("Vd min", self.VdLowFilter), ("Vd max", self.VdHighFilter))):
+            tk.Label(self, text = text, font = R_FONT).grid(row = 1, column = 2 * column, sticky = "nse")
+            widget.grid(row = 1, column = 2 * column + 1, sticky = "nsw")
+        self.SearchBtn.grid(row = 1, column = 12)
+        self.RunList.grid(row = 2, column = 0, columnspan = 6, sticky = "nsew")
+        self.RunScroll.grid(row = 2, column = 6, sticky = "nsw")
+        self.canvas.get_tk_widget().grid(row = 2, column = 7, columnspan = 6)
+        self.OverlayBtn.grid(row = 3, column = 0, columnspan = 2)
+        self.StatusLabel.grid(row = 3, column = 2, columnspan = 11, sticky = "nsew")
+
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.after(BROWSER_POLL_MS, self.pollTasks)
+        try:
+            self.openDirectory(directory)
+        except Exception:
+            self.close()
+            raise
+
+    def runInBackground(self, task, done):
+        #One catalog job at a time, its result comes back through pollTasks
+        if self.busy:
+            self.StatusLabel.config(text = "Busy, try again in a moment")
+            return
+        self.busy = True
+        def work():
+            try:
+                result = task()
+            except Exception as e:
+                result = e
+            with self.lock:
+                self.busy = False
+                if self.closed:
+                    #The window is gone and its polls with it
+                    self.catalog.close()
+                    return
+            self.tasks.put((done, result))
+        threading.Thread(target = work, daemon = True).start()
+
+    def pollTasks(self):
+        while True:
+            try:
+                done, result = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if self.closed:
+                return
+            if isinstance(result, Exception):
+                self.StatusLabel.config(text = "Failed: " + str(result))
+            else:
+                done(result)
+        self.after(BROWSER_POLL_MS, self.pollTasks)
+
+    def openDirectory(self, directory):
+        if self.catalog is not None:
+            self.catalog.close()
+        self.catalog = RunCatalog(directory)
+        self.DirectoryLabel.config(text = directory)
+        self.refresh()
+
+    def changeDirectory(self):
+        if self.busy:
+            return
+        directory = filedialog.askdirectory(initialdir = self.catalog.directory, title = 'Select Results Folder')
+        if directory:
+            try:
+                self.openDirectory(directory)
+            except Exception as e:
+                self.StatusLabel.config(text = "Failed: " + str(e))
+
+    def refresh(self):
+        self.StatusLabel.config(text = "Indexing...")
+        start = time.perf_counter()
+        def indexed(updated):
+            self.StatusLabel.config(text = "%d runs re-indexed in %.0f ms" % (updated, (time.perf_counter() - start) * 1e3))
+            self.search()
+            #The list is up, CSV previews are parsed behind it
+            self.runInBackground(self.catalog.buildPreviews, previewed)
+        def previewed(made):
+            if made:
+                self.StatusLabel.config(text = "%d CSV runs previewed in %.0f ms" % (made, (time.perf_counter() - start) * 1e3))
+        self.runInBackground(self.catalog.refresh, indexed)
+
+    def search(self):
+        try:
+            VdLow = float(self.VdLowFilter.get()) if self.VdLowFilter.get() else None
+            VdHigh = float(self.VdHighFilter.get()) if self.VdHighFilter.get() else None
+            self.entries = self.catalog.search(name = self.NameFilter.get(),
+                                               testType = None if self.typeVar.get() == "All" else self.typeVar.get(),
+                                               since = self.SinceFilter.get(), until = self.UntilFilter.get(),
+                                               VdLow = VdLow, VdHigh = VdHigh)
+        except Exception as e:
+            self.StatusLabel.config(text = "Failed: " + str(e))
+            return
+        self.RunList.delete(0, tk.END)
+        for entry in self.entries:
+            self.RunList.insert(tk.END, self.describe(entry))
+
+    def describe(self, entry):
+        text = "%-20.20s %-10s %s" % (entry["testName"], entry["testType"], entry["started"])
+        if entry["rows"] is not None:
+            text += " %8d rows" % entry["rows"]
+        if entry["VdMin"] is not None:
+            text += "  Vd %g..%g" % (entry["VdMin"], entry["VdMax"])
+        if entry["VgCount"]:
+            text += "  Vg %g..%g" % (entry["VgMin"], entry["VgMax"])
+        return text
+
+    def overlaySelected(self):
+        entries = [self.entries[index] for index in self.RunList.curselection()]
+        if not entries:
+            self.StatusLabel.config(text = "Select one or more runs")
+            return
+        self.StatusLabel.config(text = "Loading %d runs..." % len(entries))
+        start = time.perf_counter()
+        self.runInBackground(lambda: [(entry, self.catalog.curves(entry)) for entry in entries],
+                             lambda runs: self.drawOverlay(runs, time.perf_counter() - start))
+
+    def drawOverlay(self, runs, elapsed):
+        self.ax.clear()
+        shown = 0
+        for entry, curves in runs:
+            for key, x, y in curves:
+                self.ax.plot(x, y, linewidth = 0.8, label = curveLabel(entry, key))
+                shown += len(x)
+        lines = len(self.ax.get_lines())
+        if 0 < lines <= BROWSER_LEGEND_CURVES:
+            self.ax.legend(fontsize = 6)
+        transistor = any(entry["testType"] == "transistor" for entry, curves in runs)
+        self.ax.set_xlabel("Vds" if transistor else "V", loc = 'right', fontsize = 8)
+        self.ax.set_ylabel("Id" if transistor else "I", loc = 'top', fontsize = 8)
+        self.canvas.draw_idle()
+        self.StatusLabel.config(text = "%d runs, %d curves, %d points shown, loaded in %.0f ms" %
+                                (len(runs), lines, shown, elapsed * 1e3))
+
+    def close(self):
+        #destroy() drops the pending pollTasks, a running job closes the catalog when it finishes
+        with self.lock:
+            self.closed = True
+            if not self.busy and self.catalog is not None:
+                self.catalog.close()
+        self.destroy()
+
+if __name__ == "__main__":
+    app = SMU_GUI()
+    app.mainloop()
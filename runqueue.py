@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Queue of GUI runs measured back to back.
+
+A RunQueue measures its runs one after another on its own thread and hands
+each finished run to a single saver thread, which exports the run files to
+the save location, analyses the recorded data and writes its trace while the
+next run is already configuring and measuring. The instruments only wait for
+their own configuration between runs, never for saving.
+
+It posts to the GUI queue like a SweepWorker, with the inner workers'
+started/data/progress messages passed through and a few of its own:
+
+    ("runStarted", (index, run, worker, recorder))
+    ("runFinished", (index, kind, payload))     kind is done, cancelled or error
+    ("runSaved", (index, path, summary))        summary is an exception if saving failed
+    ("done", None) / ("cancelled", None)        once every run is measured and saved
+
+A failed run is reported and the queue moves on; cancelling stops the
+current run, saves what it recorded and skips the rest.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis import CurveAnalysis
+from instrumentation import RunStats, tracePath
+from recorder import Recorder, loadRun
+from sweepengine import SweepWorker
+from sweepplan import pointsPerCurve
+
+class QueuedRun:
+    def __init__(self, name, testType, VdPoints, VgPoints, smu, gate = None, adaptive = False,
+                 delay = None, device1 = "", device2 = "", order = "raster"):
+        self.name = name
+        self.testType = testType.lower()
+        self.VdPoints = VdPoints
+        self.VgPoints = VgPoints
+        self.smu = smu
+        self.gate = gate
+        self.adaptive = adaptive
+        self.delay = delay
+        self.device1 = device1
+        self.device2 = device2
+        self.order = order
+
+    def describe(self):
+        text = "%s  %s  Vd %g..%g (%d)" % (self.name, self.testType, self.VdPoints[0], self.VdPoints[-1], len(self.VdPoints))
+        if self.testType == "transistor":
+            text += "  Vg %g..%g (%d)" % (self.VgPoints[0], self.VgPoints[-1], len(self.VgPoints))
+        if self.order != "raster":
+            text += "  " + self.order
+        return text + ("  adaptive" if self.adaptive else "") + "  on " + self.device1
+
+class RunRelay:
+    #Stands in for a worker's outQueue, holds back its final message for the RunQueue to report
+    def __init__(self, outQueue):
+        self.outQueue = outQueue
+        self.outcome = ("error", RuntimeError("Run ended without a result"))
+
+    def put(self, message):
+        kind, payload = message
+        if kind in ("done", "cancelled", "error"):
+            self.outcome = (kind, payload)
+        else:
+            self.outQueue.put(message)
+
+def abandonRecorder(recorder):
+    #A run that fails before its worker took over still leaves a closed file and an "error" sidecar
+    try:
+        recorder.close("error")
+    except Exception:
+        pass
+
+class RunQueue(threading.Thread):
+    def __init__(self, outQueue, runs, saveLocation, runDirectory, backends):
+        threading.Thread.__init__(self, daemon = True)
+        self.outQueue = outQueue
+        self.runs = list(runs)
+        self.saveLocation = saveLocation
+        self.runDirectory = runDirectory
+        self.backends = backends
+        self.worker = None
+        self.cancelEvent = threading.Event()
+        self.resumeEvent = threading.Event()
+        self.resumeEvent.set()
+        self.queueStats = RunStats()
+
+    @property
+    def stats(self):
+        return self.worker.stats if self.worker is not None else self.queueStats
+
+    @property
+    def totalPoints(self):
+        return sum(pointsPerCurve(len(run.VdPoints), run.order) * (len(run.VgPoints) if run.testType == "transistor" else 1)
+                   for run in self.runs)
+
+    @property
+    def paused(self):
+        return not self.resumeEvent.is_set()
+
+    def cancel(self):
+        self.cancelEvent.set()
+        self.resumeEvent.set()
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def pause(self):
+        self.resumeEvent.clear()
+        if self.worker is not None:
+            self.worker.pause()
+
+    def resume(self):
+        self.resumeEvent.set()
+        if self.worker is not None:
+            self.worker.resume()
+
+    def post(self, kind, payload = None):
+        self.outQueue.put((kind, payload))
+
+    def run(self):
+        saver = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "saver")
+        try:
+            for index, run in enumerate(self.runs):
+                #Pausing between runs holds the next one back too
+                self.resumeEvent.wait()
+                if self.cancelEvent.is_set():
+                    break
+                kind, payload, recorder, worker = self.measure(index, run)
+                self.post("runFinished", (index, kind, payload))
+                if worker is not None:
+                    saver.submit(self.save, index, run, recorder, worker.stats)
+                if kind == "cancelled":
+                    break
+        finally:
+            #Everything measured is saved before the queue reports back
+            saver.shutdown(wait = True)
+            self.queueStats.finish()
+        self.post("cancelled" if self.cancelEvent.is_set() else "done")
+
+    def measure(self, index, run):
+        #Any failure here is this run's error, the queue carries on with the next one
+        relay = RunRelay(self.outQueue)
+        recorder = None
+        try:
+            recorder = Recorder(self.runDirectory, run.name, run.testType, backend = self.backends[run.testType],
+                                metadata = {"VdPoints": [float(V) for V in run.VdPoints],
+                                            "VgPoints": [float(V) for V in run.VgPoints],
+                                            "device1": run.device1, "device2": run.device2,
+                                            "adaptive": run.adaptive, "order": run.order})
+            worker = SweepWorker(relay, run.smu, run.testType, run.VdPoints, run.VgPoints, gate = run.gate,
+                                 delay = run.delay, recorder = recorder, adaptive = run.adaptive, order = run.order)
+        except Exception as e:
+            if recorder is not None:
+                abandonRecorder(recorder)
+            return "error", e, None, None
+        if index == 0:
+            #Resets before the queue started count toward its first run
+            for name, start, duration, thread, args in self.queueStats.spans:
+                worker.stats.addSpan(name, start, duration, thread = thread, **args)
+        self.worker = worker
+        if self.cancelEvent.is_set():
+            worker.cancel()
+        self.post("runStarted", (index, run, worker, recorder))
+        #The worker's loop runs right here, the queue is already off the Tk thread
+        try:
+            worker.run()
+        except Exception as e:
+            #worker.run reports sweep failures itself, this one came before its sweep could
+            abandonRecorder(recorder)
+            return "error", e, None, None
+        return relay.outcome + (recorder, worker)
+
+    def save(self, index, run, recorder, stats):
+        #Runs on the saver thread while the next run measures
+        try:
+            path = recorder.exportTo(self.saveLocation)
+            info, data = loadRun(recorder.path)
+            analysis = CurveAnalysis(run.testType, run.VdPoints)
+            analysis.update(data)
+            analysis.write(path)
+            stats.write(tracePath(recorder.path))
+            stats.write(tracePath(path))
+            self.post("runSaved", (index, path, analysis.summary()))
+        except Exception as e:
+            self.post("runSaved", (index, None, e))
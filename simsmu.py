@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated Keithley 2450 / 2400 stand-ins for running and benchmarking without
+hardware.
+
+Every command costs a fixed round-trip latency plus a transfer time per byte,
+so per-reading buffer access and bulk readback compare like for like. The
+instruments answer the SCPI subset hwsweep and readback send (sweep loading,
+:INIT/:ABOR, buffer queries) and the attribute API configureSMU and the
+connection manager use (defbuffer1, measure/source settings, trigger(),
+source_voltage/current, reset, use_front_terminals, shutdown).
+
+A started sweep steps through its points in real time on a background thread,
+one reading every source delay + NPLC, and readings come from a device model
+in devicemodels with gaussian noise. timeScale < 1 runs sweeps faster than a
+real instrument would.
+
+Resources named "SIM::<device>" open a simulated instrument through the
+connection manager, device being diode, resistor, drain or gate. drain and
+gate share one transistor, so a transistor map runs with SIM::drain as device 1
+and SIM::gate as device 2.
+"""
+import re
+import threading
+import time
+import numpy as np
+
+from devicemodels import shockley, squareLaw
+
+#Typical LAN/GPIB figures, override per instance
+DEFAULT_LATENCY = 0.002
+DEFAULT_BANDWIDTH = 1e6
+
+ASCII_BYTES_PER_VALUE = 14
+
+#Values per :SOUR:LIST:VOLT(:APP), and how far past its range a fixed source can go
+MAX_LIST = 100
+SOURCE_OVERRANGE = 1.05
+
+#Relative noise and absolute noise floor of a reading, in A
+DEFAULT_NOISE = 1e-3
+DEFAULT_NOISE_FLOOR = 1e-12
+LINE_FREQUENCY = 60
+#Fixed per-reading overhead of the trigger model on top of delay and NPLC
+READING_OVERHEAD = 0.0005
+
+TRACE_DATA = re.compile(r':TRAC(?:E)?:DATA\?\s*(\d+)\s*,\s*(\d+)\s*,\s*"(\w+)"\s*,?(.*)', re.IGNORECASE)
+
+class SimTransistor:
+    """One MOSFET shared by a drain and a gate SMU. The gate terminal sets Vg
+    whenever its source level changes, the drain sees the square law at that Vg."""
+    def __init__(self, gateLeakage = 1e-10, **params):
+        self.params = params
+        self.gateLeakage = gateLeakage
+        self.Vg = 0.0
+        self.gate = SimGate(self)
+
+    def drain(self, V):
+        return squareLaw(V, self.Vg, **self.params)
+
+class SimGate:
+    def __init__(self, transistor):
+        self.transistor = transistor
+
+    def __call__(self, V):
+        return np.asarray(V, dtype = float) * self.transistor.gateLeakage
+
+    def bias(self, V):
+        self.transistor.Vg = float(V)
+
+class SimBufferColumn:
+    #1 based, every index costs a full round-trip like a real per-reading query
+    def __init__(self, buffer, column):
+        self.buffer = buffer
+        self.column = column
+
+    def __getitem__(self, i):
+        self.buffer.smu.transfer(ASCII_BYTES_PER_VALUE)
+        with self.buffer.lock:
+            return float(self.buffer.data[i - 1, self.column])
+
+class SimBuffer:
+    #Readings land from the sweep thread while the host drains them, so every access is locked
+    COLUMNS = {"SOUR": 0, "VOLT": 0, "READ": 1, "CURR": 1, "REL": 2, "TIME": 2}
+
+    def __init__(self, smu, name = "defbuffer1"):
+        self.smu = smu
+        self.name = name
+        self.lock = threading.Lock()
+        self.clear()
+        self.sourcevalues = SimBufferColumn(self, 0)
+        self.readings = SimBufferColumn(self, 1)
+        self.relativetimestamps = SimBufferColumn(self, 2)
+
+    @property
+    def n(self):
+        return self.count
+
+    def clear(self):
+        with self.lock:
+            self.data = np.empty((1024, 3))
+            self.count = 0
+
+    def append(self, sources, readings, times):
+        with self.lock:
+            end = self.count + len(sources)
+            if end > len(self.data):
+                grown = np.empty((max(end, 2 * len(self.data)), 3))
+                grown[:self.count] = self.data[:self.count]
+                self.data = grown
+            self.data[self.count:end] = np.column_stack((sources, readings, times))
+            self.count = end
+
+    def rows(self, start, end, elements):
+        columns = [self.COLUMNS[e] for e in elements]
+        with self.lock:
+            return self.data[start - 1:end, columns].copy()
+
+class SimSettings:
+    #Attribute bag standing in for the measure / source / ilimit setting objects
+    def __init__(self, **settings):
+        self.__dict__.update(settings)
+
+class SimSource(SimSettings):
+    def __init__(self, smu):
+        SimSettings.__init__(self, func = None, range = 2, highc = None, ilimit = SimSettings(level = 0.105))
+        self.smu = smu
+
+    def sweeplinear(self, name, start, stop, points, delay = 0.0):
+        self.smu.transfer(64)
+        self.smu.sweepPoints = np.linspace(float(start), float(stop), int(points))
+        self.smu.sourceDelay = float(delay)
+
+class SimTrigger:
+    def __init__(self, smu):
+        self.smu = smu
+
+    def initiate(self):
+        self.smu.write(":INIT")
+
+    def waitcomplete(self):
+        self.smu.transfer(8)
+        self.smu.waitSweep()
+
+class SimKeithley2450:
+    FUNC_DC_CURRENT = "CURR"
+    FUNC_DC_VOLTAGE = "VOLT"
+    SENSE_2WIRE = "OFF"
+    SENSE_4WIRE = "ON"
+    ON = "ON"
+    OFF = "OFF"
+    MODEL = "2450"
+
+    def __init__(self, address = "SIM::2450", latency = DEFAULT_LATENCY, bandwidth = DEFAULT_BANDWIDTH,
+                 device = shockley, noise = DEFAULT_NOISE, noiseFloor = DEFAULT_NOISE_FLOOR,
+                 timeScale = 1.0, seed = None):
+        self.address = address
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.device = device
+        self.noise = noise
+        self.noiseFloor = noiseFloor
+        self.timeScale = timeScale
+        self.rng = np.random.default_rng(seed)
+        self.rngLock = threading.Lock()
+        self.queries = 0
+        self.bytesMoved = 0
+        self.defbuffer1 = SimBuffer(self)
+        self.sweepThread = None
+        self.stopEvent = threading.Event()
+        self.settings()
+
+    def settings(self):
+        #Power-on state, also what reset() returns to
+        self.dataFormat = "ASC"
+        self.swapped = False
+        self.output = False
+        self.level = 0.0
+        self.sweepPoints = None
+        self.sourceList = np.empty(0)
+        self.sourceDelay = 0.0
+        self.measure = SimSettings(func = self.FUNC_DC_CURRENT, sense = self.SENSE_2WIRE, autorange = self.ON, nplc = 1.0)
+        self.source = SimSource(self)
+
+    def transfer(self, nbytes):
+        self.queries += 1
+        self.bytesMoved += nbytes
+        if self.latency or self.bandwidth:
+            time.sleep(self.latency + nbytes / self.bandwidth)
+
+    def respond(self, V):
+        """Measured current at source voltages V: device model, compliance
+        clamp and noise."""
+        V = np.asarray(V, dtype = float)
+        I = np.asarray(self.device(V), dtype = float)
+        limit = self.source.ilimit.level
+        I = np.clip(I, -limit, limit)
+        with self.rngLock:
+            return I + self.rng.normal(0, 1, I.shape) * (self.noise * np.abs(I) + self.noiseFloor)
+
+    def setLevel(self, V):
+        self.level = float(V)
+        bias = getattr(self.device, "bias", None)
+        if bias is not None:
+            bias(self.level)
+
+    def fillSweep(self, start, stop, points, resistance = 1e3, nplc = 1, lineFrequency = LINE_FREQUENCY):
+        #Plain resistor load, enough to give the buffer realistic contents
+        sources = np.linspace(start, stop, points)
+        times = np.arange(points) * nplc / lineFrequency
+        self.defbuffer1.append(sources, sources / resistance, times)
+
+    #Sweep execution
+
+    def readingPeriod(self):
+        return (self.sourceDelay + float(self.measure.nplc) / LINE_FREQUENCY + READING_OVERHEAD) * self.timeScale
+
+    def startSweep(self):
+        self.abort()
+        if self.sweepPoints is None or len(self.sweepPoints) == 0:
+            raise ValueError("Simulated SMU: :INIT without a sweep loaded")
+        points = np.array(self.sweepPoints)
+        self.output = True
+        self.setLevel(points[0])
+        self.stopEvent.clear()
+        self.sweepThread = threading.Thread(target = self.runSweep, args = (points, self.readingPeriod()), daemon = True)
+        self.sweepThread.start()
+
+    def runSweep(self, points, period):
+        #Store every reading whose time has come, like the trigger model filling the buffer
+        start = time.monotonic()
+        stored = 0
+        while stored < len(points):
+            due = min(len(points), int((time.monotonic() - start) / period) + 1) if period > 0 else len(points)
+            if due > stored:
+                sources = points[stored:due]
+                self.setLevel(sources[-1])
+                self.defbuffer1.append(sources, self.respond(sources), np.arange(stored, due) * period)
+                stored = due
+            if self.stopEvent.wait(min(period, 0.01)):
+                return
+
+    def waitSweep(self):
+        if self.sweepThread is not None:
+            self.sweepThread.join()
+
+    def abort(self):
+        self.stopEvent.set()
+        if self.sweepThread is not None and self.sweepThread is not threading.current_thread():
+            self.sweepThread.join()
+        self.sweepThread = None
+
+    #SCPI
+
+    def write(self, command):
+        self.transfer(len(command))
+        header, _, arguments = command.strip().partition(" ")
+        self.command(header.upper(), [a.strip().strip('"') for a in arguments.split(",")] if arguments else [])
+
+    def command(self, header, args):
+        if header.startswith(":FORM:DATA"):
+            self.dataFormat = "REAL" if args and args[0].upper().startswith("REAL") else "ASC"
+        elif header.startswith(":FORM:BORD"):
+            self.swapped = bool(args) and args[0].upper().startswith("SW")
+        elif header in (":TRAC:CLE", ":TRACE:CLEAR"):
+            self.defbuffer1.clear()
+        elif header == ":SOUR:SWE:VOLT:LIN":
+            self.sweepPoints = np.linspace(float(args[0]), float(args[1]), int(args[2]))
+            if len(args) > 7 and args[7].upper() in ("ON", "1"):
+                #Dual sweep, back from the stop point to the start
+                self.sweepPoints = np.concatenate((self.sweepPoints, self.sweepPoints[::-1]))
+            self.sourceDelay = float(args[3]) if len(args) > 3 else 0.0
+        elif header == ":SOUR:LIST:VOLT":
+            self.sourceList = self.listValues(args)
+        elif header == ":SOUR:LIST:VOLT:APP":
+            self.sourceList = np.concatenate((self.sourceList, self.listValues(args)))
+        elif header == ":SOUR:SWE:VOLT:LIST":
+            self.sweepPoints = self.checkRange(self.sourceList[int(args[0]) - 1:])
+            self.sourceDelay = float(args[1]) if len(args) > 1 else 0.0
+        elif header == ":SOUR:VOLT" and args:
+            self.setLevel(self.checkRange([float(args[0])])[0])
+        elif header == ":OUTP":
+            self.output = args[0].upper() in ("ON", "1")
+        elif header == ":INIT":
+            self.startSweep()
+        elif header == ":ABOR":
+            self.abort()
+        #Anything else is a setting the model does not depend on
+
+    def listValues(self, args):
+        if len(args) > MAX_LIST:
+            raise ValueError("Simulated SMU: %d list values in one command, at most %d" % (len(args), MAX_LIST))
+        return np.array(args, dtype = float)
+
+    def checkRange(self, points):
+        #List sweeps and fixed levels stay on the source range, only linear sweeps pick their own
+        points = np.asarray(points, dtype = float)
+        if len(points) and np.abs(points).max() > self.source.range * SOURCE_OVERRANGE:
+            raise ValueError("Simulated SMU: %.6g V is outside the %g V source range" %
+                             (np.abs(points).max(), self.source.range))
+        return points
+
+    def ask(self, command):
+        command = command.strip()
+        upper = command.upper()
+        if upper == "*IDN?":
+            self.transfer(48)
+            return "KEITHLEY INSTRUMENTS,MODEL %s,%s,1.0" % (self.MODEL, self.address)
+        if upper.startswith(":TRAC:ACT?") or upper.startswith(":TRAC:POIN:ACT?"):
+            self.transfer(8)
+            return str(self.defbuffer1.n)
+
+        data = self.traceData(command)
+        if data is not None:
+            text = ",".join("%.6e" % v for v in data.ravel())
+            self.transfer(len(text))
+            return text
+        raise ValueError("Unsupported simulated query: " + command)
+
+    def binaryDtype(self):
+        if self.dataFormat != "REAL":
+            raise ValueError("Simulated SMU: binary query with :FORM:DATA %s" % self.dataFormat)
+        return np.dtype("<f8" if self.swapped else ">f8")
+
+    def query_binary_values(self, command, datatype = "d", is_big_endian = False):
+        #Values go out in the instrument's format and are read back the way the caller asked, like pyvisa would
+        data = self.traceData(command)
+        if data is None:
+            raise ValueError("Unsupported simulated query: " + command)
+        block = data.ravel().astype(self.binaryDtype()).tobytes()
+        self.transfer(len(block))
+        return np.frombuffer(block, dtype = (">" if is_big_endian else "<") + datatype).astype(float)
+
+    def traceData(self, command):
+        match = TRACE_DATA.match(command)
+        if match is None:
+            return None
+        start, end = int(match.group(1)), int(match.group(2))
+        elements = [e.strip().upper() for e in match.group(4).split(",") if e.strip()] or ["READ"]
+        return self.defbuffer1.rows(start, min(end, self.defbuffer1.n), elements)
+
+    #Attribute API
+
+    def trigger(self):
+        return SimTrigger(self)
+
+    @property
+    def source_voltage(self):
+        return self.level
+
+    @source_voltage.setter
+    def source_voltage(self, V):
+        self.transfer(24)
+        self.setLevel(V)
+
+    @property
+    def current(self):
+        self.transfer(ASCII_BYTES_PER_VALUE)
+        time.sleep(self.readingPeriod() - self.sourceDelay * self.timeScale)
+        return float(self.respond([self.level])[0]) if self.output else 0.0
+
+    @property
+    def voltage(self):
+        self.transfer(ASCII_BYTES_PER_VALUE)
+        return self.level
+
+    def enable_source(self):
+        self.write(":OUTP ON")
+
+    def disable_source(self):
+        self.write(":OUTP OFF")
+
+    def reset(self):
+        self.transfer(8)
+        self.abort()
+        self.defbuffer1.clear()
+        self.settings()
+        self.setLevel(0.0)
+
+    def use_front_terminals(self):
+        self.transfer(24)
+
+    def shutdown(self):
+        self.abort()
+        self.output = False
+        self.setLevel(0.0)
+
+class SimKeithley2400(SimKeithley2450):
+    """2400 flavour: source mode, sweep and list set up with separate
+    commands, :TRIG:COUN readings, and a trace buffer read back whole."""
+    MODEL = "2400"
+
+    def settings(self):
+        SimKeithley2450.settings(self)
+        self.sourceMode = "FIX"
+        self.sweepStart = self.sweepStop = 0.0
+        self.sweepCount = 1
+        self.triggerCount = 1
+
+    def command(self, header, args):
+        if header.startswith(":FORM:DATA") and args and args[0].upper().startswith("SRE"):
+            self.dataFormat = "SRE"
+        elif header == ":SOUR:VOLT:MODE":
+            self.sourceMode = args[0].upper()[:4]
+        elif header == ":SOUR:VOLT:STAR":
+            self.sweepStart = float(args[0])
+        elif header == ":SOUR:VOLT:STOP":
+            self.sweepStop = float(args[0])
+        elif header == ":SOUR:SWE:POIN":
+            self.sweepCount = int(args[0])
+        elif header == ":SOUR:DEL":
+            self.sourceDelay = float(args[0])
+        elif header == ":TRIG:COUN":
+            self.triggerCount = int(args[0])
+        elif header == ":INIT":
+            self.sweepPoints = self.programmedPoints()
+            self.startSweep()
+        else:
+            SimKeithley2450.command(self, header, args)
+
+    def programmedPoints(self):
+        #The 2400 takes one reading per trigger, repeating the source list if the count is longer
+        if self.sourceMode == "SWE":
+            points = np.linspace(self.sweepStart, self.sweepStop, self.sweepCount)
+        elif self.sourceMode == "LIST":
+            points = self.checkRange(self.sourceList)
+        elif self.sweepPoints is not None:
+            #Loaded through source.sweeplinear
+            points = self.sweepPoints
+        else:
+            points = np.array([self.level])
+        return np.resize(points, max(self.triggerCount, 1))
+
+    def binaryDtype(self):
+        #No 64 bit format on the 2400: REAL is REAL,32 in the set byte order, SREal always little endian
+        if self.dataFormat == "SRE":
+            return np.dtype("<f4")
+        if self.dataFormat == "REAL":
+            return np.dtype("<f4" if self.swapped else ">f4")
+        return SimKeithley2450.binaryDtype(self)
+
+    def traceData(self, command):
+        if command.strip().upper() != ":TRAC:DATA?":
+            return SimKeithley2450.traceData(self, command)
+        return self.defbuffer1.rows(1, self.defbuffer1.n, ("VOLT", "CURR", "TIME"))
+
+#Simulated benches opened through the connection manager, shared so SIM::drain and SIM::gate see one transistor
+TRANSISTOR = SimTransistor()
+DEVICES = {
+    "diode": shockley,
+    "resistor": lambda V: np.asarray(V, dtype = float) / 1e3,
+    "drain": TRANSISTOR.drain,
+    "gate": TRANSISTOR.gate,
+}
+
+def isSimulated(resource):
+    return resource.upper().startswith("SIM::")
+
+def simulatedInstrument(model, resource, **options):
+    """Instrument for a "SIM::<device>" resource, see DEVICES."""
+    name = resource.split("::")[1].lower() if resource.count("::") else "diode"
+    if name not in DEVICES:
+        raise ValueError("Unknown simulated device %r, expected one of %s" % (name, ", ".join(DEVICES)))
+    options.setdefault("latency", 0.0005)
+    cls = SimKeithley2400 if model == "K2400" else SimKeithley2450
+    return cls(resource, device = DEVICES[name], **options)
@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+Sweep execution off the Tk event thread.
+
+A SweepWorker drives the instrument from its own thread and posts
+(kind, payload) messages to a queue.Queue that the GUI drains with after():
+
+    ("started", totalPoints)
+    ("data", rows)            numpy array, one row per reading
+    ("progress", (done, total))
+    ("done", None) / ("cancelled", None) / ("error", exception)
+
+Every Vd sweep is loaded into the SMU and run by the instrument itself (see
+hwsweep). For transistor maps the gate SMU runs a constant Vg sweep of the
+same length on its own SessionThread, started together with the drain sweep,
+so gate current is measured in lockstep and paired with Id by reading index.
+In adaptive mode each curve is measured as a series of list sweeps chosen by
+adaptive.adaptiveSweep, and rows arrive out of Vd order.
+
+Curves are measured in the order sweepplan.planCurves gives for the run's
+order (raster, serpentine, hysteresis or minslew). Without a fixed delay every
+sweep's source delay follows its largest step (sweepplan.settleTime), and a
+jump onto a sweep's first point that needs longer is settled once, host side,
+before the sweep starts.
+
+Diode rows are (source value, reading, relative time), transistor rows are
+(Vg, Vd, Id, Ig, relative time). With a recorder attached every chunk is written
+to disk on the worker thread before it is posted.
+
+Every phase of the run is timed into worker.stats (instrumentation.RunStats)
+and every SCPI command counted, for the stats panel and the run trace.
+"""
+import queue
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from readback import BufferDrainer
+from hwsweep import abortSweep, clearBuffer, ensureSweep, holdLevel, startSweep
+from instrumentstate import Constant, invalidate, resetSMU, stateFor
+from adaptive import adaptiveSweep
+from instrumentation import RunStats, instrumentSMU
+from sweepplan import IDLE_LEVEL, checkOrder, largestStep, planCurves, settleTime
+
+#How often the worker looks at the instrument buffer while a sweep runs
+POLL_INTERVAL = 0.05
+#Give up if the buffer stops growing for this long
+STALL_TIMEOUT = 30.0
+#Integration time per reading in power line cycles, and the mains frequency it counts
+NPLC = 1
+LINE_FREQUENCY = 60
+
+class SweepCancelled(Exception):
+    pass
+
+#Sweep settings in the order they are written, functions first
+SETTINGS = (
+    ("measure.func", Constant("FUNC_DC_CURRENT")),
+    ("source.func", Constant("FUNC_DC_VOLTAGE")),
+
+    ("measure.sense", Constant("SENSE_4WIRE")),
+    ("measure.autorange", Constant("ON")),
+    ("measure.nplc", NPLC),
+
+    ("source.highc", Constant("OFF")),
+    ("source.range", 2),
+    ("source.ilimit.level", 1),
+)
+
+def configureSMU(smu):
+    """Bring smu to the sweep settings, writing only what changed since the
+    last configure. An instrument in unknown state is reset first. The
+    buffer is cleared before every sweep, not here."""
+    state = stateFor(smu)
+    if not state.known:
+        resetSMU(smu)
+    return state.apply(smu, SETTINGS)
+
+class SessionThread:
+    """One thread owning one VISA session. VISA sessions are not safe to
+    share between threads, so every call for this SMU is queued onto it."""
+    def __init__(self, smu, name = "smu"):
+        self.smu = smu
+        self.executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = name)
+
+    def submit(self, func, *args):
+        return self.executor.submit(func, self.smu, *args)
+
+    def call(self, func, *args):
+        return self.submit(func, *args).result()
+
+    def shutdown(self, wait = True):
+        self.executor.shutdown(wait = wait)
+
+class SweepWorker(threading.Thread):
+    def __init__(self, outQueue, smu, testType, VdPoints, VgPoints = None, gate = None, delay = None,
+                 recorder = None, skip = 0, adaptive = False, stats = None, label = "smu", order = "raster"):
+        threading.Thread.__init__(self, daemon = True)
+        self.outQueue = outQueue
+        self.smu = smu
+        self.gate = gate
+        self.testType = testType.lower()
+        self.VdPoints = np.asarray(VdPoints, dtype = float)
+        self.VgPoints = np.asarray(VgPoints if VgPoints is not None else [0], dtype = float)
+        #Source delay per point, None settles each sweep for its step size
+        self.delay = delay
+        self.order = order
+        checkOrder(order, adaptive)
+        self.plan = planCurves(self.VdPoints, self.VgPoints if self.testType == "transistor" else [0.0], order)
+        #Where the sources were left by the last sweep, for the jump onto the next one
+        self.drainLevel = self.gateLevel = IDLE_LEVEL
+        self.delaySeconds = 0.0
+        self.recorder = recorder
+        #Points already recorded by an interrupted run being resumed
+        self.skip = skip
+        #Adaptive runs treat len(VdPoints) as the point budget per curve
+        self.adaptive = adaptive
+        self.done = 0
+        #Host time the first sweep started, used to align several workers
+        self.sweepStart = None
+        #Host time readings are timed from, the first sweep's start unless a coordinator gives a shared one
+        self.timeOrigin = None
+        self.gateSession = None
+        #Shared between the workers of a multi-SMU run, label tells their instruments apart
+        self.stats = stats or RunStats()
+        self.label = label
+
+        self.cancelEvent = threading.Event()
+        self.resumeEvent = threading.Event()
+        self.resumeEvent.set()
+
+    @property
+    def totalPoints(self):
+        return sum(len(points) for Vg, points in self.plan)
+
+    @property
+    def paused(self):
+        return not self.resumeEvent.is_set()
+
+    def cancel(self):
+        self.cancelEvent.set()
+        #Wake a paused worker so it can see the cancel
+        self.resumeEvent.set()
+
+    def pause(self):
+        self.resumeEvent.clear()
+
+    def resume(self):
+        self.resumeEvent.set()
+
+    def post(self, kind, payload = None):
+        self.outQueue.put((kind, payload))
+
+    def emit(self, rows):
+        if self.recorder is not None:
+            with self.stats.phase("record"):
+                self.recorder.write(rows)
+        self.done += len(rows)
+        self.stats.addPoints(len(rows))
+        self.post("data", rows)
+        self.post("progress", (self.done, self.totalPoints))
+
+    def origin(self):
+        return self.sweepStart if self.timeOrigin is None else self.timeOrigin
+
+    def checkpoint(self):
+        #Pause and cancel take effect here, between instrument operations
+        self.resumeEvent.wait()
+        if self.cancelEvent.is_set():
+            raise SweepCancelled()
+
+    def run(self):
+        self.post("started", self.totalPoints)
+        status = "complete"
+        error = None
+        restore = [instrumentSMU(self.smu, self.stats, self.label if self.gate is None else "drain")]
+        if self.gate is not None:
+            restore.append(instrumentSMU(self.gate, self.stats, "gate"))
+        try:
+            if self.testType == "transistor":
+                self.runTransistor()
+            else:
+                self.runDiode()
+        except SweepCancelled:
+            status = "cancelled"
+            self.abortTrigger()
+        except Exception as e:
+            status = "error"
+            error = e
+            self.abortTrigger()
+            #Whatever the instruments were doing when it failed, their state is unknown now
+            invalidate(self.smu)
+            invalidate(self.gate)
+        finally:
+            if self.recorder is not None:
+                try:
+                    self.recorder.close(status)
+                except Exception as e:
+                    if error is None:
+                        status = "error"
+                        error = e
+            if self.gateSession is not None:
+                self.gateSession.shutdown()
+            with self.stats.phase("shutdown"):
+                for smu in (self.smu, self.gate):
+                    if smu is not None:
+                        try:
+                            smu.shutdown()
+                        except Exception:
+                            pass
+            for undo in restore:
+                undo()
+            self.noteTimings()
+            self.stats.finish()
+        if status == "complete":
+            self.post("done")
+        elif status == "cancelled":
+            self.post("cancelled")
+        else:
+            self.post("error", error)
+
+    def noteTimings(self):
+        #The instrument runs delay + NPLC per point on its own, estimate that share of the wait from the settings
+        measured = max(self.done - self.skip, 0)
+        notes = self.stats.notes
+        notes["sourceDelay"] = notes.get("sourceDelay", 0.0) + self.delaySeconds
+        notes["integration"] = notes.get("integration", 0.0) + measured * NPLC / LINE_FREQUENCY
+
+    def abortTrigger(self):
+        #The gate's follow loop leaves at its next checkpoint, then each SMU is aborted by the thread that owns it
+        self.cancel()
+        try:
+            abortSweep(self.smu)
+        except Exception:
+            pass
+        if self.gate is None:
+            return
+        try:
+            if self.gateSession is not None:
+                #Queued behind the follow loop, done before the session is shut down
+                self.gateSession.submit(abortSweep).result(timeout = STALL_TIMEOUT)
+            else:
+                abortSweep(self.gate)
+        except Exception:
+            pass
+
+    def drainSweep(self, drainer, count):
+        #Yield buffer chunks until the instrument has stored count readings
+        lastData = time.monotonic()
+        available = 0
+        while drainer.nextIndex <= count:
+            self.checkpoint()
+            with self.stats.phase("readback"):
+                rows = drainer.drain()
+            #A growing buffer is progress even when nothing is read back yet (2400)
+            if len(rows) or drainer.available > available:
+                lastData = time.monotonic()
+                available = drainer.available
+            if len(rows):
+                yield rows
+            elif time.monotonic() - lastData > STALL_TIMEOUT:
+                raise RuntimeError("No new readings for %d s, sweep stalled" % STALL_TIMEOUT)
+            else:
+                with self.stats.phase("wait"):
+                    time.sleep(POLL_INTERVAL)
+
+    def sweepDelay(self, points):
+        if self.delay is not None:
+            return self.delay
+        return settleTime(largestStep(points))
+
+    def settleBefore(self, level, Vg, delay):
+        #Settle the jump onto a sweep's first point, when the sweep's own delay is too short for it
+        if self.delay is not None:
+            return
+        jump = abs(level - self.drainLevel)
+        if Vg is not None:
+            jump = max(jump, abs(Vg - self.gateLevel))
+        wait = settleTime(jump) - delay
+        if wait <= 0:
+            return
+        with self.stats.phase("settle"):
+            if Vg is not None:
+                self.gateSession.call(holdLevel, Vg)
+            holdLevel(self.smu, level)
+            self.cancelEvent.wait(wait)
+        self.checkpoint()
+
+    def sweepFinished(self, points, delay):
+        self.drainLevel = points[-1]
+        self.delaySeconds += len(points) * delay
+
+    def loadSweep(self, smu, points, delay):
+        #A sweep still loaded from an earlier curve or run is reused as is
+        start = time.perf_counter()
+        if ensureSweep(smu, points, delay):
+            self.stats.addSpan("load", start, time.perf_counter() - start, points = len(points))
+
+    def loadDrainSweep(self, points, delay):
+        self.loadSweep(self.smu, points, delay)
+
+    def sweepCurve(self, measure, points):
+        #Measure one planned curve, either its fixed Vd points or adaptively, in the same direction, within its budget
+        if self.adaptive:
+            adaptiveSweep(measure, points[0], points[-1], len(points))
+        else:
+            measure(points)
+
+    def runDiode(self):
+        with self.stats.phase("configure"):
+            self.stats.notes["settingsWritten"] = configureSMU(self.smu)
+        Vg, points = self.plan[0]
+        if self.adaptive:
+            self.sweepCurve(self.measureDiode, points)
+        else:
+            #A resumed run carries on from the first point not yet recorded
+            self.done = self.skip
+            self.measureDiode(points[self.skip:])
+
+    def measureDiode(self, points):
+        delay = self.sweepDelay(points)
+        self.settleBefore(points[0], None, delay)
+        with self.stats.phase("clear"):
+            clearBuffer(self.smu)
+        self.loadDrainSweep(points, delay)
+        drainer = BufferDrainer(self.smu, binary = True, count = len(points))
+        if self.sweepStart is None:
+            self.sweepStart = time.monotonic()
+        offset = time.monotonic() - self.origin()
+        with self.stats.phase("start"):
+            startSweep(self.smu)
+
+        readings = []
+        for rows in self.drainSweep(drainer, len(points)):
+            rows[:, 2] += offset
+            readings.append(rows[:, 1])
+            self.emit(rows)
+        self.sweepFinished(points, delay)
+        return np.concatenate(readings)
+
+    def runTransistor(self):
+        if self.gate is None:
+            raise RuntimeError("Transistor testing needs a gate SMU selected as Device 2")
+        self.gateSession = SessionThread(self.gate, "gate")
+        with self.stats.phase("configure"):
+            self.stats.notes["settingsWritten"] = self.gateSession.call(configureSMU) + configureSMU(self.smu)
+
+        #Resume at the first curve that was not completely recorded
+        count = len(self.plan[0][1])
+        self.done = self.skip - self.skip % count
+        self.sweepStart = time.monotonic()
+        for Vg, points in self.plan[self.done // count:]:
+            self.checkpoint()
+            self.sweepCurve(lambda points, Vg = Vg: self.measureCurve(Vg, points), points)
+
+    def measureCurve(self, Vg, points):
+        count = len(points)
+        delay = self.sweepDelay(points)
+        self.settleBefore(points[0], Vg, delay)
+        with self.stats.phase("clear"):
+            clearBuffer(self.smu)
+        self.loadDrainSweep(points, delay)
+        drainer = BufferDrainer(self.smu, binary = True, count = count)
+
+        #Gate and drain start together, gate readings arrive through gateRows
+        barrier = threading.Barrier(2, timeout = STALL_TIMEOUT)
+        gateRows = queue.Queue()
+        #The gate holds Vg with the drain's delay so both take their readings at the same pace
+        gateFuture = self.gateSession.submit(self.followGate, Vg, count, delay, barrier, gateRows)
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            gateFuture.result()
+            raise
+        offset = time.monotonic() - self.origin()
+        with self.stats.phase("start"):
+            startSweep(self.smu)
+
+        drainPending = np.empty((0, 3))
+        gatePending = np.empty(0)
+        readings = []
+        try:
+            for chunk in self.drainSweep(drainer, count):
+                drainPending = np.concatenate((drainPending, chunk))
+                gatePending = np.concatenate([gatePending] + self.takeAll(gateRows))
+                drainPending, gatePending = self.emitPaired(Vg, offset, drainPending, gatePending, readings)
+        except Exception:
+            barrier.abort()
+            raise
+        gateFuture.result()
+        gatePending = np.concatenate([gatePending] + self.takeAll(gateRows))
+        self.emitPaired(Vg, offset, drainPending, gatePending, readings)
+        self.gateLevel = Vg
+        self.sweepFinished(points, delay)
+        return np.concatenate(readings)
+
+    def followGate(self, gate, Vg, count, delay, barrier, gateRows):
+        #Runs on the gate SessionThread: hold Vg for count readings in step with the drain sweep
+        with self.stats.phase("clear"):
+            clearBuffer(gate)
+        self.loadSweep(gate, np.full(count, Vg), delay)
+        drainer = BufferDrainer(gate, binary = True, count = count)
+        with self.stats.phase("sync"):
+            barrier.wait()
+        with self.stats.phase("start"):
+            startSweep(gate)
+        for chunk in self.drainSweep(drainer, count):
+            gateRows.put(chunk[:, 1])
+
+    def takeAll(self, rowQueue):
+        chunks = []
+        while True:
+            try:
+                chunks.append(rowQueue.get_nowait())
+            except queue.Empty:
+                return chunks
+
+    def emitPaired(self, Vg, offset, drainPending, gatePending, readings):
+        #Pair drain rows (Vd, Id, t) with gate readings by index, keep the rest for next time
+        n = min(len(drainPending), len(gatePending))
+        if n:
+            drain = drainPending[:n]
+            readings.append(drain[:, 1])
+            self.emit(np.column_stack((np.full(n, Vg), drain[:, 0], drain[:, 1], gatePending[:n], drain[:, 2] + offset)))
+        return drainPending[n:], gatePending[n:]
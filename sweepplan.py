@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Sweep ordering and settling time.
+
+planCurves lists the sweeps of a run as (Vg, points), in the order they are
+measured:
+    raster      every curve from the first Vd point to the last
+    serpentine  every other curve runs backwards, so between curves only Vg
+                steps and Vd never jumps back across its whole range
+    hysteresis  every curve forward then back again in one sweep, for the
+                hysteresis loop, twice the points
+    minslew     serpentine, starting from the ends of the Vd and Vg ranges
+                nearest the idle output, so the sources travel the least
+
+A diode run is the single curve at Vg = 0.
+
+settleTime gives the source delay for a sweep from its largest step. The
+transient after a step of dV is taken as one RC-like decay of SETTLE_TAU,
+which is within SETTLE_ERROR of its final value after
+SETTLE_TAU * ln(dV / SETTLE_ERROR). Small steps settle in a fraction of the
+0.1 s a fixed delay used to allow for the worst case, and the worst case,
+the jump onto a curve's first point, is settled once per curve instead of
+on every point (SweepWorker.settleBefore).
+"""
+import numpy as np
+
+ORDERS = ("raster", "serpentine", "hysteresis", "minslew")
+
+#Source level of an instrument that is off or was just reset, in V
+IDLE_LEVEL = 0.0
+#Settling model, the time constant of source, cabling and DUT and the error allowed in V
+SETTLE_TAU = 0.01
+SETTLE_ERROR = 1e-3
+SETTLE_MIN = 0.001
+SETTLE_MAX = 0.1
+
+def settleTime(step):
+    step = abs(float(step))
+    if step <= SETTLE_ERROR:
+        return SETTLE_MIN
+    return float(np.clip(SETTLE_TAU * np.log(step / SETTLE_ERROR), SETTLE_MIN, SETTLE_MAX))
+
+def largestStep(points):
+    return float(np.abs(np.diff(points)).max()) if len(points) > 1 else 0.0
+
+def nearestFirst(points, level = IDLE_LEVEL):
+    #The same points, run from whichever end is closer to level
+    return points[::-1] if abs(points[-1] - level) < abs(points[0] - level) else points
+
+def checkOrder(order, adaptive = False):
+    #Called before a run records anything, an order that cannot be measured fails up front
+    if order not in ORDERS:
+        raise ValueError("Unknown sweep order %r, expected one of %s" % (order, ", ".join(ORDERS)))
+    if adaptive and order == "hysteresis":
+        raise ValueError("Hysteresis sweeps cannot be adaptive, their return sweep follows the forward one")
+
+def planCurves(VdPoints, VgPoints, order = "raster"):
+    checkOrder(order)
+    VdPoints = np.asarray(VdPoints, dtype = float)
+    VgPoints = np.asarray(VgPoints, dtype = float)
+    if order == "hysteresis":
+        loop = np.concatenate((VdPoints, VdPoints[::-1]))
+        return [(Vg, loop) for Vg in VgPoints]
+    if order == "minslew":
+        VdPoints = nearestFirst(VdPoints)
+        VgPoints = nearestFirst(VgPoints)
+    if order == "raster":
+        return [(Vg, VdPoints) for Vg in VgPoints]
+    return [(Vg, VdPoints if curve % 2 == 0 else VdPoints[::-1]) for curve, Vg in enumerate(VgPoints)]
+
+def pointsPerCurve(VdCount, order = "raster"):
+    return 2 * VdCount if order == "hysteresis" else VdCount
+
+def slew(VdPoints, VgPoints, order = "raster"):
+    """Total voltage the drain and gate sources travel over a run, starting
+    and ending at the idle level, for comparing orders."""
+    drain = gate = IDLE_LEVEL
+    total = 0.0
+    for Vg, points in planCurves(VdPoints, VgPoints, order):
+        total += abs(Vg - gate) + abs(points[0] - drain) + np.abs(np.diff(points)).sum()
+        gate, drain = Vg, points[-1]
+    return total + abs(gate - IDLE_LEVEL) + abs(drain - IDLE_LEVEL)
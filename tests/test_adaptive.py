@@ -0,0 +1,25 @@
+import numpy as np
+
+from adaptive import adaptiveSweep, predictRefinement, refinePoints
+from devicemodels import shockley
+
+def test_refinement_stays_within_budget():
+    V, I = adaptiveSweep(shockley, 0, 1, 60)
+    assert len(V) <= 60
+    assert np.all(np.diff(V) > 0)
+    assert V[0] == 0 and V[-1] == 1
+
+def test_points_go_to_the_knee():
+    V, I = adaptiveSweep(shockley, 0, 1, 80)
+    #The diode is flat well below its knee, the refined points land above it
+    assert np.sum(V > 0.6) > np.sum(V < 0.4)
+
+def test_straight_line_is_not_refined():
+    #Fine enough that no interval steps more than JUMP_TOLERANCE of the range
+    V = np.linspace(0, 1, 41)
+    assert len(refinePoints(V, 3 * V, 40)) == 0
+
+def test_preview_has_every_curve():
+    offsets = predictRefinement(np.linspace(0, 3, 31), [1.0, 2.0], "transistor")
+    assert offsets.shape[1] == 2
+    assert set(offsets[:, 1]) == {1.0, 2.0}
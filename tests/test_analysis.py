@@ -0,0 +1,34 @@
+import numpy as np
+
+from analysis import CurveAnalysis
+from devicemodels import DIODE, MOSFET, shockley, squareLaw
+
+def test_diode_fit_recovers_the_model():
+    V = np.linspace(0, 1, 400)
+    analysis = CurveAnalysis("diode")
+    rows = np.column_stack((V, shockley(V), np.arange(len(V))))
+    #Fed in chunks, the way the worker posts them
+    for chunk in np.array_split(rows, 7):
+        analysis.update(chunk)
+    results = analysis.results()
+    assert abs(results["n"][0] - DIODE["n"]) < 0.05
+    assert abs(results["Rs"][0] - DIODE["Rs"]) / DIODE["Rs"] < 0.1
+
+def test_transistor_threshold():
+    Vd = np.linspace(0, 3, 61)
+    Vg = np.linspace(0, 3, 31)
+    analysis = CurveAnalysis("transistor", Vd)
+    for gate in Vg:
+        Id = squareLaw(Vd, gate)
+        analysis.update(np.column_stack((np.full(len(Vd), gate), Vd, Id, np.zeros(len(Vd)), np.zeros(len(Vd)))))
+    results = analysis.results()
+    assert abs(results["Vth"] - MOSFET["Vth"]) < 0.2
+    assert results["gmMax"] > 0
+    assert len(results["Ron"]) == len(Vg)
+
+def test_results_are_written_next_to_the_data(tmp_path):
+    analysis = CurveAnalysis("diode")
+    V = np.linspace(0, 1, 50)
+    analysis.update(np.column_stack((V, shockley(V), V)))
+    path = analysis.write(str(tmp_path / "run.csv"))
+    assert path.endswith("run_analysis.json")
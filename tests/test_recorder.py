@@ -0,0 +1,73 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import recorder
+from recorder import Recorder, loadRun, readSidecar, reserveName, resumeRecorder
+
+@pytest.fixture
+def sameSecond(monkeypatch):
+    #Every run starts in the same second
+    monkeypatch.setattr(recorder.time, "strftime", lambda format: "20260101-120000")
+
+def test_reserve_name_suffixes(tmp_path):
+    directory = str(tmp_path)
+    assert reserveName(directory, "run") == "run"
+    assert reserveName(directory, "run") == "run_2"
+    assert reserveName(directory, "run") == "run_3"
+
+def test_reserve_name_skips_existing_data(tmp_path):
+    (tmp_path / "run.npy").write_bytes(b"")
+    assert reserveName(str(tmp_path), "run") == "run_2"
+
+def test_reserve_name_from_threads(tmp_path):
+    names = []
+    threads = [threading.Thread(target = lambda: names.append(reserveName(str(tmp_path), "run"))) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(names)) == 16
+
+@pytest.mark.parametrize("backend", ["csv", "npy"])
+def test_runs_in_the_same_second_keep_their_data(tmp_path, sameSecond, backend):
+    first = Recorder(str(tmp_path), "dut", "diode", backend = backend)
+    second = Recorder(str(tmp_path), "dut", "diode", backend = backend)
+    assert first.path != second.path
+    first.write(np.ones((3, 3)))
+    second.write(2 * np.ones((5, 3)))
+    first.close()
+    second.close()
+    assert loadRun(first.path)[1].shape == (3, 3)
+    info, data = loadRun(second.path)
+    assert info["status"] == "complete"
+    np.testing.assert_array_equal(data, 2 * np.ones((5, 3)))
+
+@pytest.mark.parametrize("backend", ["csv", "npy"])
+def test_resume_drops_the_partial_curve(tmp_path, backend):
+    run = Recorder(str(tmp_path), "fet", "transistor", backend = backend)
+    rows = np.arange(35, dtype = float).reshape(7, 5)
+    run.write(rows)
+    run.sync()
+    #Crash before close, the sidecar still says running
+    run.backend.file.close()
+    assert readSidecar(run.path)["status"] == "running"
+
+    resumed = resumeRecorder(run.path, rowMultiple = 3)
+    assert resumed.rows == 6
+    resumed.write(rows[6:] + 100)
+    resumed.close()
+    info, data = loadRun(run.path)
+    assert info["rows"] == 7
+    np.testing.assert_array_equal(data[:6], rows[:6])
+    np.testing.assert_array_equal(data[6], rows[6] + 100)
+
+def test_export_copies_data_and_sidecar(tmp_path):
+    run = Recorder(str(tmp_path / "runs"), "dut", "diode")
+    run.write(np.zeros((2, 3)))
+    run.close()
+    path = run.exportTo(str(tmp_path / "saved"))
+    assert os.path.exists(path)
+    assert loadRun(path)[0]["rows"] == 2
@@ -0,0 +1,45 @@
+import numpy as np
+
+from results import ResultStore, RESULT_DTYPE, STATUS_INVALID, STATUS_OK
+
+def transistorRows(Vg, count, start = 0.0):
+    Vd = np.linspace(0, 1, count)
+    return np.column_stack((np.full(count, Vg), Vd, Vd * 1e-3, np.zeros(count), start + np.arange(count)))
+
+def test_curves_are_views_of_the_store():
+    store = ResultStore("transistor", capacity = 8)
+    store.append(transistorRows(0.0, 5))
+    store.append(transistorRows(1.0, 5))
+    curve = store.curve(1.0)
+    assert len(curve) == 5
+    assert np.shares_memory(curve, store.data)
+    assert store.keys() == [0.0, 1.0]
+
+def test_growth_keeps_rows():
+    store = ResultStore("transistor", capacity = 2)
+    rows = transistorRows(0.5, 100)
+    assert store.append(rows) == (0, 100)
+    np.testing.assert_array_equal(store.asRows(), rows)
+
+def test_diode_rows_fill_the_missing_fields():
+    store = ResultStore("diode")
+    store.append(np.array([[0.1, 1e-6, 0.0], [0.2, np.nan, 0.1]]))
+    view = store.view()
+    assert np.all(view["Vg"] == 0)
+    assert np.all(np.isnan(view["Ig"]))
+    assert list(view["status"]) == [STATUS_OK, STATUS_INVALID]
+
+def test_curve_split_across_chunks_is_joined():
+    store = ResultStore("transistor")
+    store.append(transistorRows(0.0, 3))
+    store.append(transistorRows(1.0, 3))
+    store.append(transistorRows(0.0, 3, start = 10))
+    assert len(store.curve(0.0)) == 6
+
+def test_spill_to_memmap(tmp_path):
+    store = ResultStore("transistor", capacity = 4, ramBudget = 64 * RESULT_DTYPE.itemsize, spillDirectory = str(tmp_path))
+    rows = transistorRows(0.0, 200)
+    store.append(rows)
+    assert store.spilled
+    np.testing.assert_array_equal(store.asRows(), rows)
+    store.close()
@@ -0,0 +1,41 @@
+import json
+import os
+import queue
+
+import numpy as np
+
+from runqueue import QueuedRun, RunQueue
+from simsmu import SimKeithley2450
+
+def drain(outQueue):
+    messages = []
+    while not outQueue.empty():
+        messages.append(outQueue.get())
+    return messages
+
+def test_failed_run_does_not_stop_the_queue(tmp_path):
+    smu = SimKeithley2450("SIM::diode", latency = 0, bandwidth = 1e9, timeScale = 0.001)
+    Vd = np.linspace(0, 0.8, 20)
+    #Adaptive hysteresis is refused when its worker is built, after the recorder exists
+    runs = [QueuedRun("bad", "diode", Vd, np.array([0.0]), smu, adaptive = True, order = "hysteresis"),
+            QueuedRun("good", "diode", Vd, np.array([0.0]), smu)]
+    outQueue = queue.Queue()
+    runDirectory = str(tmp_path / "runs")
+    runQueue = RunQueue(outQueue, runs, str(tmp_path / "saved"), runDirectory, {"diode": "csv", "transistor": "npy"})
+    runQueue.start()
+    runQueue.join(10)
+    assert not runQueue.is_alive()
+
+    messages = drain(outQueue)
+    finished = [payload[:2] for kind, payload in messages if kind == "runFinished"]
+    assert finished == [(0, "error"), (1, "done")]
+    assert ("done", None) in messages
+
+    #The bad run's recorder is closed, not left running as an orphan
+    statuses = {}
+    for name in os.listdir(runDirectory):
+        if name.endswith(".run.json"):
+            with open(os.path.join(runDirectory, name)) as file:
+                info = json.load(file)
+            statuses[info["testName"]] = info["status"]
+    assert statuses == {"bad": "error", "good": "complete"}
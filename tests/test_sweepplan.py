@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from sweepplan import checkOrder, planCurves, pointsPerCurve, settleTime, slew, SETTLE_MIN, SETTLE_MAX
+
+VD = np.linspace(0, 2, 5)
+VG = np.array([0.0, 1.0, 2.0])
+
+def test_raster_repeats_the_same_sweep():
+    curves = planCurves(VD, VG, "raster")
+    assert [Vg for Vg, points in curves] == list(VG)
+    for Vg, points in curves:
+        np.testing.assert_array_equal(points, VD)
+
+def test_serpentine_reverses_every_other_curve():
+    curves = planCurves(VD, VG, "serpentine")
+    np.testing.assert_array_equal(curves[0][1], VD)
+    np.testing.assert_array_equal(curves[1][1], VD[::-1])
+    np.testing.assert_array_equal(curves[2][1], VD)
+
+def test_hysteresis_runs_forward_and_back():
+    curves = planCurves(VD, VG, "hysteresis")
+    assert len(curves[0][1]) == pointsPerCurve(len(VD), "hysteresis") == 2 * len(VD)
+    np.testing.assert_array_equal(curves[0][1][len(VD):], VD[::-1])
+
+def test_minslew_starts_nearest_idle():
+    curves = planCurves(-VD, -VG, "minslew")
+    assert curves[0][0] == 0.0
+    assert curves[0][1][0] == 0.0
+
+def test_minslew_travels_least():
+    Vd = np.linspace(2, 0, 21)
+    Vg = np.linspace(3, 0, 7)
+    assert slew(Vd, Vg, "minslew") <= min(slew(Vd, Vg, order) for order in ("raster", "serpentine"))
+
+def test_unknown_order_is_rejected():
+    with pytest.raises(ValueError):
+        planCurves(VD, VG, "zigzag")
+
+def test_adaptive_hysteresis_is_rejected():
+    checkOrder("hysteresis")
+    checkOrder("raster", adaptive = True)
+    with pytest.raises(ValueError):
+        checkOrder("hysteresis", adaptive = True)
+
+def test_settle_time_is_bounded():
+    assert settleTime(0) == SETTLE_MIN
+    assert settleTime(100) == SETTLE_MAX
+    assert settleTime(0.01) < settleTime(1)